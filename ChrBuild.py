@@ -19,59 +19,146 @@
 # Jl17 optimize
 # Version 2020-4:
 # Add '@' option to synteny file
+# Version 2026-10:
+# Fasta output is streamed by FastaWriter, memory use is bounded by one scaffold instead of one chromosome
+# Sequences are read as bytes from a memory mapped fasta, reverse complement by one translate table (IUPAC aware), -m keeps soft-masking
+# Split scaffolds (Scaffold:start-end) only read the requested region. The region is 1-based inclusive, as in the AGP output
+# Missing or outdated .fai index is built by FaIndex.py
+# bgzip compressed scaffold fasta (.fa.gz) is read directly, through .fai + .gzi
+# -j N writes the chromosomes in N worker processes to temporary parts, joined in synteny file order
+# -L liftover looks features up in an AGP interval index (bisect) and streams the lifted annotation to NAME.gff3
+# ChrBuild.py liftover: BED/VCF/PAF/GFF records from scaffold to pseudochromosome coordinates, from the AGP or the synteny file
+# ChrBuilder class: one opened assembly builds any number of synteny orders, the command line is main()
+# --profile writes time, calls, bytes and peak memory per stage (Profile.py), sequence fetch and line wrapping are counted apart
+# Fasta records of chromosomes (and unplaced scaffolds) whose sequence did not change since the last run are copied from the old NAME.fa (NAME.fa.buildcache)
 import os
 import sys
+import re
+import gzip
+import json
+import bisect
+import hashlib
+import shutil
 import argparse
+import tempfile
+import multiprocessing
 from datetime import date
+from FaIndex import FaiOpen, FastaMap, ReplaceFile
+from Profile import PROFILE, AddArguments as ProfileArguments
 
-################################ Argparse module #############################
+################################ Functions ###################################
+# Translation tables for bytes.translate, newlines are removed in the same pass. IUPAC codes are complemented as well.
+COMPLEMENT = (b'ACGTURYKMSWBDHVNacgturykmswbdhvn', b'TGCAAYRMKSWVHDBNtgcaayrmkswvhdbn')
+UPPER_TABLE = bytes.maketrans(b'abcdefghijklmnopqrstuvwxyz', b'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+RC_TABLE = bytes.maketrans(COMPLEMENT[0], COMPLEMENT[1].upper())
+RC_MASKED_TABLE = bytes.maketrans(COMPLEMENT[0], COMPLEMENT[1]) # keeps soft-masked (lower case) bases lower case
+STR_RC_TABLE = str.maketrans(COMPLEMENT[0].decode(), COMPLEMENT[1].decode())
+
+class FastaSeq: # byte level access to a fasta file, located by its .fai entries [length, offset, line_bases, line_bytes]
+    # Plain fasta is memory mapped, bgzip compressed fasta is read through its .gzi index (only the blocks a region needs).
+    def __init__(self, fasta_file, fai):
+        self.fai, self.data = fai, FastaMap(fasta_file)
+
+    def Fetch(self, name, rc = False, softmask = False, start = 0, end = None, table = UPPER_TABLE):
+        # out: bases [start, end) (0-based, forward strand) as bytes without newlines, upper case unless softmask, reverse complemented if rc
+        # Only the lines covering the region are read, their byte offsets follow from the .fai line geometry.
+        length, offset, line_bases, line_bytes = self.fai[name][:4]
+        if not length: return b''
+        end = length if end is None else max(start, min(end, length))
+        raw = self.data[offset + start // line_bases * line_bytes + start % line_bases:offset + end // line_bases * line_bytes + end % line_bases]
+        if rc: return raw.translate(RC_MASKED_TABLE if softmask else RC_TABLE, b'\r\n')[::-1]
+        return raw.translate(None if softmask else table, b'\r\n')
+
+    def close(self):
+        if self.data: self.data.close()
+
+class FastaWriter: # writes fasta records (bytes) piece by piece, the unfinished line is carried over to the next piece
+    def __init__(self, handle, width = 60):
+        self.handle, self.width, self.line, self.empty = handle, width, b'', False
+        self.written = 0 # bytes written to handle
+
+    def Head(self, name):
+        self.End()
+        head = b'>' + name.encode() + b'\n'
+        self.handle.write(head)
+        self.written += len(head)
+        self.empty = True
+
+    def Write(self, seq):
+        if not seq: return
+        self.empty = False
+        if self.line:
+            fill = self.width - len(self.line)
+            if len(seq) < fill:
+                self.line += seq
+                return
+            self.handle.write(self.line + seq[:fill] + b'\n')
+            self.written += self.width + 1
+            seq = seq[fill:]
+        full = len(seq) - len(seq) % self.width
+        if full:
+            self.handle.write(b'\n'.join(seq[cx:cx+self.width] for cx in range(0, full, self.width)) + b'\n')
+            self.written += full + full // self.width
+        self.line = seq[full:]
+
+    def End(self):
+        if self.line or self.empty: # an empty record still gets its (empty) sequence line
+            self.handle.write(self.line + b'\n')
+            self.written += len(self.line) + 1
+        self.line, self.empty = b'', False
+
+class AgpIndex: # AGP components per scaffold, sorted by their start on the scaffold forward strand, located by bisect
+    def __init__(self, agp_lines, lengths): # lengths {scaffold:length} place reverse complemented split regions on the forward strand
+        components = {}
+        for line in agp_lines:
+            if not line.strip() or line[0] == '#': continue
+            dx = line.rstrip('\n').split('\t')
+            if len(dx) < 9 or dx[4] in 'NU': continue
+            name, piece_start = dx[5], 1
+            if name[-1] == ']' and '[' in name: # split scaffold Scaffold[start-end], region counted on the strand of the component
+                name, region = name[:-1].rsplit('[', 1)
+                split_start, split_end = map(int, region.split('-'))
+                piece_start = split_start if dx[8] != '-' else lengths[name] - split_end + 1
+            components.setdefault(name, []).append([piece_start + int(dx[6]) - 1, piece_start + int(dx[7]) - 1, dx[0], int(dx[1]), int(dx[2]), dx[8] == '-'])
+        self.index, self.objects = {}, {} # objects: {chr_name:length} in AGP order
+        for line in agp_lines:
+            dx = line.split('\t')
+            if line[0] != '#' and len(dx) > 2 and dx[2].isdigit(): self.objects[dx[0]] = max(self.objects.get(dx[0], 0), int(dx[2]))
+        for name, cx in components.items():
+            cx.sort(key = lambda ex:ex[0])
+            self.index[name] = [[ex[0] for ex in cx], cx]
+
+    def Lift(self, name, start, end):
+        # out: [object, start, end, reverse] for 1-based inclusive [start, end] on scaffold name, None unless it lies inside one component
+        if name not in self.index: return None
+        starts, components = self.index[name]
+        cx = bisect.bisect_right(starts, start) - 1
+        if cx < 0 or end > components[cx][1] or end < start: return None
+        scaffold_start, _, chr_name, chr_start, chr_end, reverse = components[cx]
+        if reverse: return [chr_name, chr_end - end + scaffold_start, chr_end - start + scaffold_start, True]
+        return [chr_name, chr_start + start - scaffold_start, chr_start + end - scaffold_start, False]
+
+    def Why(self, name, start, end): # reason why Lift found nothing
+        if name not in self.index: return 'scaffold not in the assembly'
+        starts, components = self.index[name]
+        inside = [cx >= 0 and ex <= components[cx][1] for cx, ex in [[bisect.bisect_right(starts, start) - 1, start], [bisect.bisect_right(starts, end) - 1, end]]]
+        if all(inside): return 'across the gap between two scaffold components'
+        if any(inside) or bisect.bisect_right(starts, end) != bisect.bisect_left(starts, start): return 'partly outside the used scaffold regions'
+        return 'outside the used scaffold regions'
 
-parser = argparse.ArgumentParser(prog='ChrBuild', description='Build pseudoc-chromosomes from synteny file. Requires python 3.4+')
-parser.add_argument('Scaffold_FASTA', help = 'Input file name Scaffold fasta file.')
-parser.add_argument('Synteny_File', help = 'Input synteny file for Pseudo chromosome building. Synetny file ')
-parser_chr = parser.add_argument_group('ChrBuilder - functions:')
-parser_chr.add_argument('-S','--Summary', dest='summary', action = 'store_true', default = False, help = 'Instead of all three (= default), only the summary file is created')
-parser_chr.add_argument('-A','--AGP', dest='agp', action = 'store_true', default = False, help = 'Instead of all three (= default), only the AGP file is created')
-parser_chr.add_argument('-F','--Fasta', dest='sequence', action = 'store_true', default = False, help = 'Instead of all three (= default), only the fasta file is created')
-parser_chr.add_argument('-L','--Liftover', dest='gff', action = 'store', nargs = '?', const = True, default = '', help = 'Liftover gtf/gff3 annotation from scaffolds to genome based on synteny file.')
-parser_chr = parser.add_argument_group('ChrBuilder - settings:')
-parser_chr.add_argument('-D', dest='split_symbol', action = 'store', default = ':', metavar='SYMBOL', help = 'Change the contig split symbol. Default split symbol ":".')
-parser_chr.add_argument('-H','--Nohead', action = "store_true", default = False, help = "Remove header from summary and AGP file.")
-parser_chr.add_argument('-o', dest= 'Output', action = 'store', metavar='NAME', nargs='?', const = '', default = '', help = 'Give a custom name to the output file(s). Do not use suffixes.')
-parser_chr.add_argument('-t', dest= 'Toplevel', action = 'store_true', default = False, help = 'Output Toplevel sequence of fasta. All unused scaffolds will be outputed.')
-args = parser.parse_args()
-
-################################## script ####################################
-# Initiate:
-agp_requested, sequence_requested, summary_requested, header_set, split_symbol, top_level = args.agp, args.sequence, args.summary, not args.Nohead, args.split_symbol, args.Toplevel
-Chr_list, summary_total, Used_scaf, summary_output = [],0,[],'\t'.join(['Chromosome','Scaffold_length','Scaffold_count'])+'\n'
-filename = args.Output if args.Output != '' else os.getcwd().split('/')[-1]
-if not (agp_requested or sequence_requested or summary_requested): agp_requested = sequence_requested = summary_requested = True
-if args.gff == True:
-    print('Option Liftover is given, but does not following by gtf/gff/gff3 file name. Liftover ommited.' )
-    args.gff = '' 
-# Find and read files
-Fas = open(args.Scaffold_FASTA,'r')
-try: Faindex = open(args.Scaffold_FASTA+'.fai','r')
-except FileNotFoundError:
-    sys.stderr.write('ERROR: FASTA index file '+ args.Scaffold_FASTA +'.fai can not be found.')
-    exit(1)
-Fai = {dx.split('\t')[0]:list(map(int,dx.split('\t')[1:])) for dx in Faindex} 
-Faindex.close()
-with open(args.Synteny_File,'r') as SCL: Scaf_list = [dx.strip() for dx in SCL.readlines() if dx != '\n' and dx.strip()[0] != '#']
-
-#Header info
-header_info = Scaf_list[0].split('\t')
-if header_info[3] == '-': header_info[3] = date.today().strftime('%d-%B-%y')
-agp_output = '##agp-version\t2.0\n#ORGANISM:\t'+header_info[0]+'\n#TAX_ID:\t'+header_info[1]+'\n#ASSEMBLY NAME:\t'+header_info[2]+'\n#ASSEMBLY DATE:\t'+header_info[3]+'\n#GENOME CENTER:\t'+header_info[4]+'\n#DESCRIPTION:\t'+header_info[5]+'\n#COMMENTS:\t'+header_info[6]+'\n' if header_set else ''
-for dx in Scaf_list[1:]:
-    if ' ' not in dx : print(dx, '\ndoes not follow synteny line syntex. Deleted'); continue
-    Chr_list.append(dx.split(' '))
-# Main:
-if sequence_requested: output = open(filename+'.fa','w')
-for dx in Chr_list:
-    Chr_length, summary_length,scaffold_count, Chr_output, line_count, Chr_pointer = 0,0,0,'', 1, 1
-    print('Processing {}'.format(dx[0]))
+def SyntenyRead(synteny_file): # out: [header_info, Chr_list], Chr_list = [[chr_name, 'scaffold,+gap,...'], ...]
+    with open(synteny_file,'r') as SCL: Scaf_list = [dx.strip() for dx in SCL.readlines() if dx != '\n' and dx.strip()[0] != '#']
+    Chr_list = []
+    for dx in Scaf_list[1:]:
+        if ' ' not in dx : print(dx, '\ndoes not follow synteny line syntex. Deleted'); continue
+        Chr_list.append(dx.split(' '))
+    return [Scaf_list[0].split('\t'), Chr_list]
+
+def ChrLine(dx, fai, split_symbol, softmask, used_scaf):
+    # One synteny line [chr_name, 'scaffold,+gap,...'] checked against the fai (ValueError if it does not fit), scaffolds are appended to used_scaf.
+    # out: [agp_lines, segments, Chr_length, summary_length, scaffold_count], segments as in FastaPart
+    agp_output, segments = '', []
+    Chr_length, summary_length,scaffold_count, line_count, Chr_pointer = 0,0,0, 1, 1
     for scaffoldname in dx[1].split(','):
         # Add gaps when requested
         if scaffoldname[0] in '+@':
@@ -80,7 +167,7 @@ for dx in Chr_list:
                 if Chr_length > seq_length: print('WARNING: @{} will overlap with previous contig(s).'.format(scaffoldname[1:]))
                 seq_length = seq_length - Chr_length - 1
             agp_output += '\t'.join([dx[0], str(int(Chr_pointer)),str(int(Chr_pointer+seq_length - 1)), str(line_count),'N',str(seq_length),'scaffold','no','na\n'])
-            if sequence_requested: Chr_output += 'N'*seq_length
+            segments.append([seq_length])
             Chr_length += seq_length
         else:
             ## Check for reverse complementary scaffolds
@@ -92,10 +179,9 @@ for dx in Chr_list:
             if split_symbol in scaffoldname:
                 name_split = scaffoldname.split(split_symbol)
                 if len(name_split) != 2 or len(name_split[1].split('-')) != 2:
-                    sys.stderr.write('ERROR: The scaffold {} containing scaffold split symbol "{}". But the format is incomprehensible(Scaffld:start-end expected, e.g. Chr1:1-100K). Use -D option to change default split symbol if necessary'.format(scaffoldname, split_symbol))
-                    exit(1)
+                    raise ValueError('The scaffold {} containing scaffold split symbol "{}". But the format is incomprehensible(Scaffld:start-end expected, e.g. Chr1:1-100K). Use -D option to change default split symbol if necessary'.format(scaffoldname, split_symbol))
                 scaffoldname = name_split[0]
-                split_start, split_end = [int(cx[:-1])*{'K':1e3,'M':1e6,'G':1e9}[cx[-1].upper()] if cx[-1] in 'GMKgmk' else int(cx) for cx in name_split[1].split('-')]
+                split_start, split_end = [int(cx[:-1])*{'K':1000,'M':1000000,'G':1000000000}[cx[-1].upper()] if cx[-1] in 'GMKgmk' else int(cx) for cx in name_split[1].split('-')]
                 if split_start > split_end: 
                     sys.stderr.write('WARNING: Given region in scaffold {} looks reversed. Please read the instruction on spliting reverse complementary scaffolds.'.format(scaffoldname))
                     split_start, split_end = split_end, split_start
@@ -104,22 +190,15 @@ for dx in Chr_list:
                 broken_contig_flag = False
 
             ## check if fai file is correct
-            if not broken_contig_flag and scaffoldname not in Fai.keys():
-                sys.stderr.write('ERROR: Following scaffold is not found in {}: {}, please check if fai index file is correct.\n'.format(dx[0],scaffoldname))
-                exit(1)
-            if scaffoldname in Used_scaf: sys.stderr.write('WARNING: {} used more than one times in the synteny.\n'.format(scaffoldname))
-            if sequence_requested: Fas.seek(Fai[scaffoldname][1])
-            if rc_flag:
-                seq_scaffold = Fas.read(Fai[scaffoldname][0] + (Fai[scaffoldname][3]-Fai[scaffoldname][2]) * (Fai[scaffoldname][0] // Fai[scaffoldname][2])).replace('\n','').lower()[::-1]
-                for ex,cx in [['a','T'],['t','A'],['g','C'],['c','G'],['n','N']]:
-                    seq_scaffold = seq_scaffold.replace(ex,cx)
-            else:
-                seq_scaffold = Fas.read(Fai[scaffoldname][0] + (Fai[scaffoldname][3]-Fai[scaffoldname][2]) * (Fai[scaffoldname][0] // Fai[scaffoldname][2])).replace('\n','').upper()
-            if broken_contig_flag:
-                seq_scaffold = seq_scaffold[split_start:split_end]
-            Chr_output += seq_scaffold
-            Used_scaf.append(scaffoldname)
-            seq_length = split_end-split_start + 1 if broken_contig_flag else Fai[scaffoldname][0]
+            if scaffoldname not in fai.keys():
+                raise ValueError('Following scaffold is not found in {}: {}, please check if fai index file is correct.'.format(dx[0],scaffoldname))
+            if scaffoldname in used_scaf: sys.stderr.write('WARNING: {} used more than one times in the synteny.\n'.format(scaffoldname))
+            if broken_contig_flag: # split_start-split_end is 1-based and counted on the strand given in the synteny line
+                region = [split_start - 1, split_end] if not rc_flag else [fai[scaffoldname][0] - split_end, fai[scaffoldname][0] - split_start + 1]
+                segments.append([scaffoldname, rc_flag, softmask, max(region[0], 0), region[1]])
+            else: segments.append([scaffoldname, rc_flag, softmask, 0, None])
+            used_scaf.append(scaffoldname)
+            seq_length = split_end-split_start + 1 if broken_contig_flag else fai[scaffoldname][0]
             orientation = '-\n' if rc_flag else '+\n'
             name = scaffoldname + '[' + str(split_start) + '-' + str(split_end) + ']' if broken_contig_flag else scaffoldname
             agp_output += '\t'.join([dx[0], str(int(Chr_pointer)),str(int(Chr_pointer+seq_length - 1)), str(line_count),'W', name,'1',str(seq_length),orientation])
@@ -128,131 +207,391 @@ for dx in Chr_list:
             Chr_length += seq_length
         Chr_pointer += seq_length
         line_count += 1
-    if sequence_requested:#slice of string can  be out of range, return empty. this solves last line shorter than 60bp
-        output.write('>' + dx[0] + '\n' + '\n'.join(Chr_output[i:i+60] for i in range(0, len(Chr_output), 60)) + '\n')
-    if summary_requested:# summary section
-        summary_output += '\t'.join([dx[0], str(Chr_length),str(summary_length),str(scaffold_count)])+'\n'
-        summary_total += summary_length
-if top_level:
-    print('Processing unplaced scaffolds.')
-    for dx in Fai.keys():
-        if dx not in Used_scaf:
-            agp_output += '\t'.join([dx,'1',str(Fai[dx][0]),'1','W', dx,'1',str(Fai[dx][0]),'+'])+'\n'
-            if sequence_requested:
-                Fas.seek(Fai[dx][1])
-                seq_scaffold = Fas.read(Fai[dx][0] + (Fai[dx][3]-Fai[dx][2]) * (Fai[dx][0] // Fai[dx][2])).replace('\n','')
-                output.write('>' + dx + '\n' + '\n'.join(seq_scaffold[cx:cx+60] for cx in range(0, len(seq_scaffold), 60)) + '\n')
-Fas.close()
-if sequence_requested: output.close()
-if agp_requested:
-    with open(filename+'.agp','w') as output: output.write(agp_output)
-if summary_requested:
-    with open(filename+'.txt','w') as output:
-        output.write(summary_output)
-        scaffold_total = sum(Fai[dx][0] for dx in Fai.keys())
-        output.write('\t'.join(['Assembled:',str(summary_total),str(len(Used_scaf))])+'\n')
-        output.write('\t'.join(['Total:',str(scaffold_total),str(len(Fai))])+'\n')
-        output.write('Sequence Assembled: {0:3.1f}%'.format(summary_total/scaffold_total*100))
-
-# Function gff3 liftover
-if args.gff != '':
-    AGP_from, AGP_to, gff3, used_new = {}, {}, [], []
-    #AGP_from[scaffold_name] = [start, end, scaffold_name, direction]
-    AGP_from = dict(zip(Fai.keys(),[[1, Fai[dx][0],dx,'+'] for dx in Fai.keys()]))
-    for line in agp_output:
-        if line.strip()[0] == '#' or '\t' not in line: continue
-        dx = line.strip().split('\t')
-        if dx[0] not in used_new : used_new.append(dx[5])
-        AGP_to[dx[5]] = [dx[0],int(dx[1]),int(dx[2]),dx[8]]
-    for line in open(args.gff,'r'):
-        if line.strip()[0] == '#' or '\t' not in line:
-            print(line)
-            continue
-        dx = line.rstrip().split('\t')
-        dx[3],dx[4] = int(dx[3]), int(dx[4])
-        if dx[0] not in used_new and dx[0] not in AGP_from.keys():
-            gff3.append(dx)
-            continue
-        if dx[0] in used_new and dx[0] not in AGP_from.keys():
-            if AGP_to[dx[0]][3] == '+':
-                pos1 = AGP_to[dx[0]][1] + dx[3] -1
-                pos2 = AGP_to[dx[0]][1] + dx[4] -1
-                dir_ = dx[6]
+    return [agp_output, segments, Chr_length, summary_length, scaffold_count]
+
+def UnplacedAgp(fai, used_scaf, names = False): # AGP lines (or names) of the scaffolds left out of the synteny, in fai order (-t)
+    used = set(used_scaf)
+    if names: return [dx for dx in fai.keys() if dx not in used]
+    return ['\t'.join([dx,'1',str(fai[dx][0]),'1','W', dx,'1',str(fai[dx][0]),'+'])+'\n' for dx in fai.keys() if dx not in used]
+
+def FastaPartFile(part): # worker of ChrBuilder.WriteFasta: part = [part_file, records], every part is a complete fasta on its own
+    builder = ChrBuilder.forked # inherited from the parent by fork, the fasta is opened again in the worker
+    fas = FastaSeq(builder.fasta_file, builder.fai)
+    with open(part[0],'wb') as PART: sizes = builder.WriteFasta(part[1], PART, jobs = 1, fas = fas)
+    fas.close()
+    return [part[0], sizes]
+
+class BuildCache: # fasta records of the previous run, found by ChrBuilder.RecordKey and copied from the old output instead of being built again
+    # NAME.fa.buildcache keeps key, offset and size of every record of NAME.fa. It is only used while NAME.fa has the size/mtime stored with it.
+    def __init__(self, fasta_output):
+        self.fasta_output, self.path, self.records, self.source = fasta_output, fasta_output + '.buildcache', {}, None
+        try:
+            with open(self.path,'r') as CACHE: data = json.load(CACHE)
+            stat = os.stat(fasta_output)
+            if data['fasta'] == [stat.st_size, stat.st_mtime_ns]:
+                self.records = {dx[0]:dx[1:] for dx in data['records']}
+                self.source = open(fasta_output,'rb')
+        except (OSError, ValueError, KeyError, TypeError): self.records = {}
+
+    def Copy(self, key, handle): # out: size of the record copied from the old output to handle, None when it is not cached
+        if key not in self.records: return None
+        offset, size = self.records[key]
+        with PROFILE.Stage('copy', system = False) as stage:
+            self.source.seek(offset)
+            left = size
+            while left > 0:
+                block = self.source.read(min(left, 1 << 24))
+                if not block: raise OSError('{} is shorter than its build cache'.format(self.fasta_output))
+                handle.write(block)
+                left -= len(block)
+            stage.Io(read = size, written = size)
+        return size
+
+    def Save(self, keys, sizes): # after the new output has replaced the old one, keys/sizes of its records in file order
+        offset, records = 0, []
+        for key, size in zip(keys, sizes):
+            records.append([key, offset, size])
+            offset += size
+        try:
+            stat = os.stat(self.fasta_output)
+            with ReplaceFile(self.path) as CACHE: json.dump({'fasta':[stat.st_size, stat.st_mtime_ns], 'records':records}, CACHE)
+        except OSError as err: sys.stderr.write('WARNING: fasta build cache can not be written ({}).\n'.format(err))
+
+    def close(self):
+        if self.source: self.source.close()
+        self.source = None
+
+class ChrBuilder: # an opened scaffold assembly, any number of synteny orders can be built against it without indexing again
+    forked = None # the builder handed to FastaPartFile workers
+    def __init__(self, fasta_file, split_symbol = ':', softmask = False, jobs = 1, verbose = False):
+        self.fasta_file, self.split_symbol, self.softmask, self.jobs, self.verbose = fasta_file, split_symbol, softmask, jobs, verbose
+        self.fai = FaiOpen(fasta_file) # built here when fasta_file.fai is missing or older than the fasta
+        self.fas = FastaSeq(fasta_file, self.fai)
+        self.used_scaf = [] # scaffolds placed by the last Build
+        stat = os.stat(fasta_file)
+        self.fasta_key = [stat.st_size, stat.st_mtime_ns] # part of every RecordKey, an edited fasta invalidates the build cache
+
+    def Build(self, chr_lines):
+        # chr_lines: synteny lines 'Chr1 scaffold,+gap,...' (str or already split), header line excluded.
+        # yields [chr_name, agp_lines, segments, Chr_length, summary_length, scaffold_count] per chromosome, ValueError if a line does not fit
+        self.used_scaf = []
+        for dx in chr_lines:
+            if isinstance(dx, str): dx = dx.strip().split(' ')
+            if self.verbose: print('Processing {}'.format(dx[0]))
+            yield [dx[0]] + ChrLine(dx, self.fai, self.split_symbol, self.softmask, self.used_scaf)
+
+    def Unplaced(self): # same records for the scaffolds the last Build left out (-t), soft-masking is always kept
+        for dx in UnplacedAgp(self.fai, self.used_scaf, names = True):
+            yield [dx, '\t'.join([dx,'1',str(self.fai[dx][0]),'1','W', dx,'1',str(self.fai[dx][0]),'+'])+'\n', [[dx, False, True, 0, None]], self.fai[dx][0], self.fai[dx][0], 1]
+
+    def Sequence(self, segments, fas = None, gap_block = b'N' * (1 << 20)): # yields the bytes of a record piece by piece, one scaffold at most
+        for cx in segments:
+            if len(cx) == 1:
+                for ex in range(0, cx[0], len(gap_block)): yield gap_block[:cx[0] - ex]
             else:
-                pos1 = AGP_to[dx[0]][2] - dx[4] +1
-                pos2 = AGP_to[dx[0]][2] - dx[3] +1
-                dir_ = {'+':'-','-':'+'}[dx[6]]
-            gff3.append([AGP_to[dx[0]][0],dx[1],dx[2],pos1,pos2,dx[5],dir_,dx[7],dx[8]])
-            print(AGP_to[dx[0]][0],dx[1],dx[2],pos1,pos2,dx[5],dir_,dx[7],dx[8], file = sys.stderr)
-            continue
-        hit1, hit2 = False, False
-        chr_1, chr_2 = 'na','na'
-        for start_,end_,scaffold,direct in AGP_from[dx[0]]:
-            if direct == 'na': continue
-            if start_ <= dx[3] and dx[3] <= end_:
-                if direct == AGP_to[scaffold][3]:
-                    pos1 = dx[3] - start_ + AGP_to[scaffold][1]
-                    dir_ = dx[6]
-                else:
-                    pos2 = AGP_to[scaffold][2] - dx[3] + start_
-                    dir_ = '|' if dx[6] == '+' else 'x'
-                chr_1 = AGP_to[scaffold][0]
-                hit1 = True
-            if start_ <= dx[4] and dx[4] <= end_:
-                if direct == AGP_to[scaffold][3]:
-                    pos2 = dx[4] - start_ + AGP_to[scaffold][1]
-                    dir_ = dx[6]
-                else:
-                    pos1 = AGP_to[scaffold][2] - dx[4] + start_
-                    dir_ = '|' if dx[6] == '+' else 'x'
-                chr_2 = AGP_to[scaffold][0]
-                hit2 = True
-            if hit1 and hit2 : break
-        if hit1 and chr_2 =='na':
-            hit2 = hit1 -dx[3] + dx[4] if dir_ in ['+','-'] else hit1 +dx[3] - dx[4] -1
-            chr_2 = chr_1
-            print('Warning:',dx[8],'on',dx[0],"have 3' end fall inside scaffold gaps, please check", file=sys.stderr)
-        if hit2 and chr_1 =='na':
-            hit1 = hit2 -dx[4] + dx[3] if dir_ in ['+','-'] else hit2 -dx[3] + dx[4] -1
-            chr_1 = chr_2
-            print('Warning:',dx[8],'on',dx[0],"have 5' end fall inside scaffold gaps, please check", file=sys.stderr)
-        if hit1 and hit2 and chr_1 == chr_2:
-            gff3.append([chr_1,dx[1],dx[2],pos1,pos2,dx[5],dir_,dx[7],dx[8]])
-        else:
-            print(dx, 'error')
-            exit(1)
-    # direction fix and output:
-    exon_count, CDS_count, gene = 0,0,[]
-    pointer = 0
-    line_count = len(gff3)
-    while True:
-        dx = gff3[pointer]
-        if dx[2] == 'gene':
-            print('\t'.join(map(str,[dx[0],dx[1],dx[2],dx[3],dx[4],dx[5],{'+':'+','-':'-','x':'+','|':'-'}[dx[6]],dx[7],dx[8]])))
-            pointer += 1
-            continue
-        elif dx[2] == 'mRNA':
-            print('\t'.join(map(str,[dx[0],dx[1],dx[2],dx[3],dx[4],dx[5],{'+':'+','-':'-','x':'+','|':'-'}[dx[6]],dx[7],dx[8]])))
-            pointer += 1
-            gene_name = dx[8].split('ID=')[1].split(';')[0]
-            continue
-        if dx[2] == 'exon': exon_count += 1
-        if dx[2] == 'CDS': CDS_count += 1
-        gene.append(dx)
-        pointer +=1
-        if gff3[pointer][2] in ['gene','mRNA'] or pointer+1 >= line_count:
-            if dx[6] in ['|','x']:
-                for cx in range(len(gene)):
-                    if gene[cx][2] == 'exon':
-                        gene[cx][8] = 'ID'+gene_name+'.exon'+ str(exon_count-int(gene[cx][8].split('.exon')[1].split(';')[0])+1) + ';Parent=' + gene_name
-                    elif gene[cx][2] == 'CDS':
-                        gene[cx][8] = 'ID'+gene_name+'.CDS'+ str(exon_count-int(gene[cx][8].split('.CDS')[1].split(';')[0])+1) + ';Parent=' + gene_name
-            gene = sorted(gene, key = lambda ex:ex[3])
-            gene = sorted(gene, key = lambda ex:ex[4])
-            for cx in gene:
-                print('\t'.join(map(str,[cx[0],cx[1],cx[2],cx[3],cx[4],cx[5],{'+':'+','-':'-','x':'+','|':'-'}[cx[6]],cx[7],cx[8]])))
-            exon_count, CDS_count, gene = 0,0,[]
-            #print('Processing:',gene_name, file=sys.stderr)
-            if pointer+1 >= line_count: exit(0)
-print('\nDONE')
-exit(0)
+                with PROFILE.Stage('fetch', system = False) as stage:
+                    seq = (fas or self.fas).Fetch(*cx)
+                    stage.Io(read = len(seq))
+                yield seq
+
+    def RecordKey(self, record): # hash of everything the fasta of one record depends on
+        # Segments are the synteny line resolved against the fai (split symbol, regions, strand, soft-masking), the fai entries locate the bases.
+        names = sorted({dx[0] for dx in record[2] if len(dx) > 1})
+        return hashlib.sha1(json.dumps([record[0], record[2], [self.fai[dx] for dx in names], self.fasta_key]).encode()).hexdigest()
+
+    def WriteFastaFile(self, records, fasta_file, cache = True): # WriteFasta to fasta_file
+        # With cache, records unchanged since the last run are copied from the old fasta_file, the others are built. Written to a temporary file first.
+        if not cache:
+            with open(fasta_file,'wb') as FAS: self.WriteFasta(records, FAS)
+            return
+        build_cache, keys, sizes, cx = BuildCache(fasta_file), [self.RecordKey(dx) for dx in records], [], 0
+        with ReplaceFile(fasta_file,'wb') as FAS:
+            try:
+                while cx < len(records):
+                    size = build_cache.Copy(keys[cx], FAS)
+                    if size is not None:
+                        sizes.append(size)
+                        cx += 1
+                        continue
+                    ex = cx + 1 # a run of records to build, written with the -j workers
+                    while ex < len(records) and keys[ex] not in build_cache.records: ex += 1
+                    sizes += self.WriteFasta(records[cx:ex], FAS)
+                    cx = ex
+            finally: build_cache.close() # the old output is closed before it is replaced
+        if self.verbose and build_cache.records: print('{} of {} fasta records taken from the build cache.'.format(len(records) - sum(1 for dx in keys if dx not in build_cache.records), len(records)))
+        build_cache.Save(keys, sizes)
+
+    def WriteFasta(self, records, handle, jobs = None, fas = None): # records as yielded by Build/Unplaced, written as fasta to a binary handle
+        # out: byte size of every record as written
+        jobs = jobs or self.jobs
+        if jobs > 1 and len(records) > 1:
+            # A chromosome is a part of its own, runs of single scaffolds (unplaced, -t) are shared out in jobs parts. Parts are joined in record order.
+            size, parts = -(-sum(1 for dx in records if len(dx[2]) == 1) // jobs) or 1, []
+            for dx in records:
+                if len(dx[2]) > 1 or not parts or len(parts[-1][-1][2]) > 1 or len(parts[-1]) >= size: parts.append([dx])
+                else: parts[-1].append(dx)
+            part_dir = tempfile.mkdtemp(prefix = '.chrbuild.', dir = os.path.dirname(os.path.abspath(handle.name)) if isinstance(getattr(handle, 'name', None), str) else None)
+            ChrBuilder.forked, sizes = self, []
+            try:
+                with multiprocessing.get_context('fork').Pool(min(jobs, len(parts))) as pool:
+                    for part_file, part_sizes in pool.imap(FastaPartFile, [[os.path.join(part_dir, str(cx) + '.fa'), ex] for cx, ex in enumerate(parts)]):
+                        with open(part_file,'rb') as PART: shutil.copyfileobj(PART, handle, 1 << 24)
+                        os.remove(part_file)
+                        sizes += part_sizes
+            finally:
+                ChrBuilder.forked = None
+                shutil.rmtree(part_dir, ignore_errors = True)
+            return sizes
+        fasta, sizes = FastaWriter(handle), []
+        for dx in records:
+            start = fasta.written
+            fasta.Head(dx[0])
+            for cx in self.Sequence(dx[2], fas):
+                with PROFILE.Stage('wrap', system = False) as stage:
+                    fasta.Write(cx)
+                    stage.Io(written = len(cx))
+            fasta.End()
+            sizes.append(fasta.written - start)
+        return sizes
+
+    def close(self):
+        self.fas.close()
+
+def Reverse(seq): # reverse complement of a str, case and IUPAC codes kept
+    return seq.translate(STR_RC_TABLE)[::-1]
+
+def GffRecord(dx, agp_index, fas): # out: [lifted fields, None] or [None, reason], for all *Record functions
+    if len(dx) < 9 or not (dx[3].isdigit() and dx[4].isdigit()): return [None, 'malformed']
+    hit = agp_index.Lift(dx[0], int(dx[3]), int(dx[4]))
+    if hit is None: return [None, agp_index.Why(dx[0], int(dx[3]), int(dx[4]))]
+    dx[0], dx[3], dx[4] = hit[0], str(hit[1]), str(hit[2])
+    if hit[3]: dx[6] = {'+':'-','-':'+'}.get(dx[6], dx[6])
+    return [dx, None]
+
+def BedRecord(dx, agp_index, fas): # 0-based half open, strand, thickStart/thickEnd and blocks (BED12) are lifted as well
+    if len(dx) < 3 or not (dx[1].isdigit() and dx[2].isdigit()): return [None, 'malformed']
+    start, end = int(dx[1]), int(dx[2])
+    hit = agp_index.Lift(dx[0], start + 1, max(end, start + 1)) # an empty interval (insertion point) is placed by the base right of it
+    if hit is None: return [None, agp_index.Why(dx[0], start + 1, max(end, start + 1))]
+    new_start = hit[1] - 1 if not hit[3] else hit[1] - 1 + max(end, start + 1) - end
+    Boundary = (lambda cx: cx - start + new_start) if not hit[3] else (lambda cx: new_start + end - cx)
+    dx[0], dx[1], dx[2] = hit[0], str(min(Boundary(start), Boundary(end))), str(max(Boundary(start), Boundary(end)))
+    if hit[3]:
+        if len(dx) > 5: dx[5] = {'+':'-','-':'+'}.get(dx[5], dx[5])
+        if len(dx) > 7 and dx[6].isdigit() and dx[7].isdigit(): dx[6], dx[7] = str(Boundary(int(dx[7]))), str(Boundary(int(dx[6])))
+        if len(dx) > 11:
+            sizes, starts = [int(cx) for cx in dx[10].strip(',').split(',')], [int(cx) for cx in dx[11].strip(',').split(',')]
+            dx[10] = ','.join(str(cx) for cx in sizes[::-1]) + ','
+            dx[11] = ','.join(str(end - start - cx - ex) for cx, ex in zip(starts[::-1], sizes[::-1])) + ','
+    elif len(dx) > 7 and dx[6].isdigit() and dx[7].isdigit(): dx[6], dx[7] = str(Boundary(int(dx[6]))), str(Boundary(int(dx[7])))
+    return [dx, None]
+
+def VcfRecord(dx, agp_index, fas):
+    # REF/ALT are reverse complemented on '-' components. The padding base of an indel has to stay left of the allele,
+    # so it is replaced by the base behind REF on the scaffold, which needs the scaffold fasta.
+    if len(dx) < 8 or not dx[1].isdigit(): return [None, 'malformed']
+    pos, ref, alts = int(dx[1]), dx[3], dx[4].split(',')
+    hit = agp_index.Lift(dx[0], pos, pos + len(ref) - 1)
+    if hit is None: return [None, agp_index.Why(dx[0], pos, pos + len(ref) - 1)]
+    if not hit[3]: new_pos = hit[1]
+    elif any(cx[:1] == '<' or '[' in cx or ']' in cx for cx in alts): return [None, 'symbolic allele on a reverse complemented scaffold']
+    elif all(cx in '*.' or (len(cx) > 1 or len(ref) > 1) and cx[0].upper() == ref[0].upper() for cx in alts) and any(len(cx) != len(ref) for cx in alts if cx not in '*.'):
+        hit = agp_index.Lift(dx[0], pos + 1, pos + len(ref))
+        if hit is None: return [None, 'padding base of the indel outside the scaffold component']
+        if fas is None: return [None, 'indel on a reverse complemented scaffold needs the scaffold fasta']
+        base = fas.Fetch(dx[0], softmask = True, start = pos + len(ref) - 1, end = pos + len(ref)).decode()
+        new_pos, dx[3], dx[4] = hit[1], Reverse(ref[1:] + base), ','.join(cx if cx in '*.' else Reverse(cx[1:] + base) for cx in alts)
+    else: new_pos, dx[3], dx[4] = hit[1], Reverse(ref), ','.join(cx if cx in '*.' else Reverse(cx) for cx in alts)
+    if 'END=' in dx[7]: dx[7] = ';'.join('END=' + str(int(cx[4:]) - pos + new_pos) if cx[:4] == 'END=' and cx[4:].isdigit() else cx for cx in dx[7].split(';'))
+    dx[0], dx[1] = hit[0], str(new_pos)
+    return [dx, None]
+
+def CsReverse(cs): # minimap2 cs tag read on the other strand of the target
+    out = []
+    for cx in re.findall(r'[:=*+~-][0-9A-Za-z]+', cs)[::-1]:
+        if cx[0] == ':': out.append(cx)
+        elif cx[0] == '*': out.append('*' + Reverse(cx[1]) + Reverse(cx[2]))
+        elif cx[0] == '~': out.append('~' + Reverse(cx[-2:]) + cx[3:-2] + Reverse(cx[1:3]))
+        else: out.append(cx[0] + Reverse(cx[1:]))
+    return ''.join(out)
+
+def PafRecord(dx, agp_index, fas, column = 5): # target side by default, column = 0 lifts the query side
+    if len(dx) < 12 or dx[4] not in ['+', '-'] or not (dx[column + 2].isdigit() and dx[column + 3].isdigit()): return [None, 'malformed']
+    start, end = int(dx[column + 2]), int(dx[column + 3])
+    hit = agp_index.Lift(dx[column], start + 1, end)
+    if hit is None: return [None, agp_index.Why(dx[column], start + 1, end)]
+    dx[column:column + 4] = [hit[0], str(agp_index.objects[hit[0]]), str(hit[1] - 1), str(hit[2])]
+    if hit[3]:
+        dx[4] = '-' if dx[4] == '+' else '+'
+        if column: # cigar and cs follow the target strand, they are read backwards now
+            for cx in range(12, len(dx)):
+                if dx[cx][:5] == 'cg:Z:': dx[cx] = 'cg:Z:' + ''.join(re.findall(r'[0-9]+[MIDNSHP=X]', dx[cx][5:])[::-1])
+                elif dx[cx][:5] == 'cs:Z:': dx[cx] = 'cs:Z:' + CsReverse(dx[cx][5:])
+    return [dx, None]
+
+LIFT_RECORD = {'gff':GffRecord, 'bed':BedRecord, 'vcf':VcfRecord, 'paf':PafRecord, 'paf_query':lambda dx, agp_index, fas: PafRecord(dx, agp_index, fas, 0)}
+
+def LiftFile(in_file, out_file, unlifted_file, record_format, agp_index, fas = None):
+    # Stream records through the AGP index. Records outside the assembly, in excluded parts of split scaffolds or across
+    # the gap between two components go unchanged to unlifted_file (removed if empty). out: [lifted, {reason:count}]
+    Record, lifted, unlifted = LIFT_RECORD[record_format], 0, {}
+    with (gzip.open(in_file,'rt') if in_file.endswith('.gz') else open(in_file,'r')) as IN, open(out_file,'w') as OUT, open(unlifted_file,'w') as UNLIFTED:
+        for line in IN:
+            if line[0] == '#' or line.startswith(('track', 'browser')) or '\t' not in line:
+                if record_format == 'gff' and line.startswith('##FASTA'): break # embedded scaffold sequences do not belong to the new assembly
+                if line.startswith(('##sequence-region', '##contig=')): continue # scaffold regions are no longer valid
+                if record_format == 'vcf' and line.startswith('#CHROM'): OUT.write(''.join('##contig=<ID={},length={}>\n'.format(cx, ex) for cx, ex in agp_index.objects.items()))
+                OUT.write(line)
+                continue
+            dx, reason = Record(line.rstrip('\n').split('\t'), agp_index, fas)
+            if dx is None:
+                UNLIFTED.write(line)
+                unlifted[reason] = unlifted.get(reason, 0) + 1
+                continue
+            OUT.write('\t'.join(dx) + '\n')
+            lifted += 1
+    if not unlifted: os.remove(unlifted_file)
+    return [lifted, unlifted]
+
+def Liftover(argv): # ChrBuild.py liftover ...: scaffold coordinates of BED/VCF/PAF/GFF to pseudochromosome coordinates
+    parser = argparse.ArgumentParser(prog='ChrBuild liftover', description='Move BED, VCF, PAF or GFF records from scaffold to pseudochromosome coordinates. Requires python 3.4+')
+    parser.add_argument('Scaffold_FASTA', help = 'Scaffold fasta file (or its .fai index, enough unless VCF indels lie on reverse complemented scaffolds).')
+    parser.add_argument('Input', help = 'BED, VCF, PAF or GFF3/GTF file on the scaffolds, may be gzip compressed.')
+    parser_lift = parser.add_argument_group('Liftover - assembly (one of):')
+    parser_lift.add_argument('-a', dest='agp', action = 'store', metavar='AGP', default = '', help = 'AGP file written by ChrBuild.')
+    parser_lift.add_argument('-s', dest='synteny', action = 'store', metavar='SYNTENY', default = '', help = 'Synteny file, the AGP is built from it without reading sequence.')
+    parser_lift = parser.add_argument_group('Liftover - settings:')
+    parser_lift.add_argument('-D', dest='split_symbol', action = 'store', default = ':', metavar='SYMBOL', help = 'Contig split symbol of the synteny file. Default split symbol ":".')
+    parser_lift.add_argument('-t', dest= 'Toplevel', action = 'store_true', default = False, help = 'With -s: unused scaffolds are part of the assembly (ChrBuild -t).')
+    parser_lift.add_argument('-F', dest='format', action = 'store', choices = ['bed','vcf','paf','gff'], default = '', help = 'Input format, default is taken from the file suffix.')
+    parser_lift.add_argument('-q', dest='query', action = 'store_true', default = False, help = 'PAF: lift the query instead of the target columns.')
+    parser_lift.add_argument('-o', dest= 'Output', action = 'store', metavar='NAME', default = '', help = 'Output file, default INPUT.lifted.SUFFIX. Unlifted records go to NAME.unlifted.')
+    args = parser.parse_args(argv)
+    suffix = args.Input[:-3] if args.Input.endswith('.gz') else args.Input
+    record_format = args.format or {'.bed':'bed', '.vcf':'vcf', '.paf':'paf', '.gff':'gff', '.gff3':'gff', '.gtf':'gff'}.get(os.path.splitext(suffix)[1].lower(), '')
+    if not record_format or bool(args.agp) == bool(args.synteny):
+        sys.stderr.write('ERROR: Liftover needs one of -a/-s and a .bed/.vcf/.paf/.gff3/.gtf input (or -F).\n')
+        return 1
+    if record_format == 'paf' and args.query: record_format = 'paf_query'
+    output = args.Output or os.path.basename(os.path.splitext(suffix)[0]) + '.lifted' + os.path.splitext(suffix)[1]
+    unlifted_file = os.path.splitext(output)[0] + '.unlifted' + os.path.splitext(output)[1]
+    if os.path.abspath(args.Input) in [os.path.abspath(output), os.path.abspath(unlifted_file)]:
+        sys.stderr.write('ERROR: Liftover output would overwrite the input {}, please use -o to give another name.\n'.format(args.Input))
+        return 1
+    try:
+        if args.Scaffold_FASTA.endswith('.fai'):
+            with open(args.Scaffold_FASTA,'r') as FAI: fai, fas = {dx.split('\t')[0]:list(map(int,dx.split('\t')[1:])) for dx in FAI}, None
+        else: fai = FaiOpen(args.Scaffold_FASTA)
+    except (OSError, ValueError) as err:
+        sys.stderr.write('ERROR: FASTA index of {} can not be read: {}\n'.format(args.Scaffold_FASTA, err))
+        return 1
+    if not args.Scaffold_FASTA.endswith('.fai'): fas = FastaSeq(args.Scaffold_FASTA, fai)
+    if args.synteny: # same AGP lines as ChrBuild writes, sequence is not touched
+        agp_lines, used_scaf = [], []
+        try:
+            for dx in SyntenyRead(args.synteny)[1]: agp_lines += ChrLine(dx, fai, args.split_symbol, False, used_scaf)[0].splitlines()
+        except ValueError as err:
+            sys.stderr.write('ERROR: {}\n'.format(err))
+            return 1
+        if args.Toplevel: agp_lines += UnplacedAgp(fai, used_scaf)
+    else:
+        with open(args.agp,'r') as AGP: agp_lines = AGP.readlines()
+    lifted, unlifted = LiftFile(args.Input, output, unlifted_file, record_format, AgpIndex(agp_lines, {dx:fai[dx][0] for dx in fai}), fas)
+    if fas: fas.close()
+    print('Liftover: {} records written to {}.'.format(lifted, output))
+    if unlifted:
+        print('{} records not lifted, written to {}:'.format(sum(unlifted.values()), unlifted_file))
+        for reason, count in sorted(unlifted.items(), key = lambda cx:-cx[1]): print('  {}\t{}'.format(count, reason))
+    return 0
+
+################################ Argparse module #############################
+def main(argv = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['liftover']: return Liftover(argv[1:])
+    parser = argparse.ArgumentParser(prog='ChrBuild', description='Build pseudoc-chromosomes from synteny file. Requires python 3.4+', epilog = 'ChrBuild.py liftover -h: move BED/VCF/PAF/GFF records to the pseudochromosomes.')
+    parser.add_argument('Scaffold_FASTA', help = 'Input file name Scaffold fasta file, plain text or bgzip compressed.')
+    parser.add_argument('Synteny_File', help = 'Input synteny file for Pseudo chromosome building. Synetny file ')
+    parser_chr = parser.add_argument_group('ChrBuilder - functions:')
+    parser_chr.add_argument('-S','--Summary', dest='summary', action = 'store_true', default = False, help = 'Instead of all three (= default), only the summary file is created')
+    parser_chr.add_argument('-A','--AGP', dest='agp', action = 'store_true', default = False, help = 'Instead of all three (= default), only the AGP file is created')
+    parser_chr.add_argument('-F','--Fasta', dest='sequence', action = 'store_true', default = False, help = 'Instead of all three (= default), only the fasta file is created')
+    parser_chr.add_argument('-L','--Liftover', dest='gff', action = 'store', nargs = '?', const = True, default = '', help = 'Liftover gtf/gff3 annotation from scaffolds to genome based on synteny file, written to NAME.gff3 (or NAME.gtf).')
+    parser_chr = parser.add_argument_group('ChrBuilder - settings:')
+    parser_chr.add_argument('-D', dest='split_symbol', action = 'store', default = ':', metavar='SYMBOL', help = 'Change the contig split symbol. Default split symbol ":".')
+    parser_chr.add_argument('-H','--Nohead', action = "store_true", default = False, help = "Remove header from summary and AGP file.")
+    parser_chr.add_argument('-o', dest= 'Output', action = 'store', metavar='NAME', nargs='?', const = '', default = '', help = 'Give a custom name to the output file(s). Do not use suffixes.')
+    parser_chr.add_argument('-m','--softmask', dest= 'softmask', action = 'store_true', default = False, help = 'Keep soft-masked (lower case) bases, default output is upper case.')
+    parser_chr.add_argument('-j','--jobs', dest= 'jobs', action = 'store', type = int, default = 1, metavar='N', help = 'Number of worker processes writing the fasta output, one chromosome each (default = 1).')
+    parser_chr.add_argument('--nocache', dest='build_cache', action = 'store_false', default = True, help = 'Build every fasta record, do not reuse unchanged records of the last NAME.fa (NAME.fa.buildcache).')
+    parser_chr.add_argument('-t', dest= 'Toplevel', action = 'store_true', default = False, help = 'Output Toplevel sequence of fasta. All unused scaffolds will be outputed.')
+    ProfileArguments(parser_chr)
+    args = parser.parse_args(argv)
+    if args.profile is not None or args.profile_stage: PROFILE.Start((args.Output or os.getcwd().split('/')[-1]) if args.profile in (None, True) else args.profile, args.profile_stage, 'ChrBuild')
+    try: return ChrRun(args)
+    finally: PROFILE.Write()
+
+def ChrRun(args): # main() after argument parsing, every return value is the exit code
+    ################################## script ####################################
+    # Initiate:
+    agp_requested, sequence_requested, summary_requested, header_set, top_level = args.agp, args.sequence, args.summary, not args.Nohead, args.Toplevel
+    Chr_records, summary_total, summary_output = [],0,'\t'.join(['Chromosome','Scaffold_length','Scaffold_count'])+'\n'
+    filename = args.Output if args.Output != '' else os.getcwd().split('/')[-1]
+    if not (agp_requested or sequence_requested or summary_requested): agp_requested = sequence_requested = summary_requested = True
+    if args.gff == True:
+        print('Option Liftover is given, but does not following by gtf/gff/gff3 file name. Liftover ommited.' )
+        args.gff = '' 
+    if args.gff != '' and os.path.abspath(args.gff) in [os.path.abspath(filename + dx) for dx in ['.gff3', '.gtf', '.unlifted.gff3', '.unlifted.gtf']]:
+        sys.stderr.write('ERROR: Liftover output would overwrite the input annotation {}, please use -o to give another name.\n'.format(args.gff))
+        return 1
+    # Find and read files
+    try:
+        with PROFILE.Stage('fasta_index'): builder = ChrBuilder(args.Scaffold_FASTA, args.split_symbol, args.softmask, args.jobs, verbose = True)
+    except (OSError, ValueError) as err:
+        sys.stderr.write('ERROR: FASTA index of {} can not be built: {}\n'.format(args.Scaffold_FASTA, err))
+        return 1
+    Fai = builder.fai
+    header_info, Chr_list = SyntenyRead(args.Synteny_File)
+
+    #Header info
+    if header_info[3] == '-': header_info[3] = date.today().strftime('%d-%B-%y')
+    agp_output = '##agp-version\t2.0\n#ORGANISM:\t'+header_info[0]+'\n#TAX_ID:\t'+header_info[1]+'\n#ASSEMBLY NAME:\t'+header_info[2]+'\n#ASSEMBLY DATE:\t'+header_info[3]+'\n#GENOME CENTER:\t'+header_info[4]+'\n#DESCRIPTION:\t'+header_info[5]+'\n#COMMENTS:\t'+header_info[6]+'\n' if header_set else ''
+    # Main: synteny lines are checked and turned into AGP, summary and fasta records here, the sequence is written afterwards
+    try:
+        with PROFILE.Stage('synteny'):
+            for dx in builder.Build(Chr_list):
+                agp_output += dx[1]
+                Chr_records.append(dx)
+                if summary_requested:# summary section
+                    summary_output += '\t'.join([dx[0], str(dx[3]),str(dx[4]),str(dx[5])])+'\n'
+                    summary_total += dx[4]
+    except ValueError as err:
+        sys.stderr.write('ERROR: {}\n'.format(err))
+        return 1
+    if top_level:
+        print('Processing unplaced scaffolds.')
+        with PROFILE.Stage('unplaced'): Unplaced_records = list(builder.Unplaced())
+        agp_output += ''.join(dx[1] for dx in Unplaced_records)
+        Chr_records += Unplaced_records
+    if sequence_requested:
+        with PROFILE.Stage('fasta'): builder.WriteFastaFile(Chr_records, filename+'.fa', args.build_cache)
+    builder.close()
+    if agp_requested:
+        with PROFILE.Stage('agp'), open(filename+'.agp','w') as output: output.write(agp_output)
+    if summary_requested:
+        with open(filename+'.txt','w') as output:
+            output.write(summary_output)
+            scaffold_total = sum(Fai[dx][0] for dx in Fai.keys())
+            output.write('\t'.join(['Assembled:',str(summary_total),str(len(builder.used_scaf))])+'\n')
+            output.write('\t'.join(['Total:',str(scaffold_total),str(len(Fai))])+'\n')
+            output.write('Sequence Assembled: {0:3.1f}%'.format(summary_total/scaffold_total*100))
+
+    # Function gff3 liftover
+    if args.gff != '':
+        gff_suffix = '.gtf' if args.gff.lower().endswith('.gtf') else '.gff3'
+        with PROFILE.Stage('liftover'): lifted, unlifted = LiftFile(args.gff, filename + gff_suffix, filename + '.unlifted' + gff_suffix, 'gff', AgpIndex(agp_output.splitlines(), {dx:Fai[dx][0] for dx in Fai}))
+        print('Liftover: {} features written to {}, {} features not lifted{}.'.format(lifted, filename + gff_suffix, sum(unlifted.values()), ' (' + filename + '.unlifted' + gff_suffix + ')' if unlifted else ''))
+    print('\nDONE')
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# Version 2026-10:
+# Build samtools compatible fasta index (.fai) for SynBuild and ChrBuild, replaces the external samtools faidx step.
+# Index columns: name, length, offset, line_bases, line_bytes
+# FaIndex.py Scaffolds.fa [-j N]
+# bgzip compressed fasta is accepted, the .gzi block index is built next to the .fai
+import os
+import sys
+import mmap
+import gzip
+import zlib
+import bisect
+import argparse
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+UMASK = os.umask(0o022) # the umask can only be read by setting it, the old value is put back on the next line
+os.umask(UMASK) # files made by ReplaceFile get the permissions of a plain open()
+
+class ReplaceFile: # with ReplaceFile(path, mode) as handle: written under a unique temporary name next to path, moved over path at the end
+    # Parallel runs never share the temporary file, and it is removed again when writing fails, so path is either the old or the complete new file.
+    def __init__(self, path, mode = 'w'):
+        descriptor, self.temp = tempfile.mkstemp(dir = os.path.dirname(path) or '.', prefix = os.path.basename(path) + '.', suffix = '.tmp')
+        self.path, self.handle = path, os.fdopen(descriptor, mode)
+        try: os.chmod(self.temp, 0o666 & ~UMASK)
+        except OSError: pass
+
+    def __enter__(self): return self.handle
+
+    def __exit__(self, kind, value, trace):
+        try:
+            self.handle.close()
+            if kind is None: os.replace(self.temp, self.path)
+        finally:
+            if os.path.exists(self.temp): os.remove(self.temp)
+
+class BgzfFile: # random access to a bgzip (BGZF) compressed file, sliced like a mmap in uncompressed coordinates
+    # Blocks are located with the .gzi index, decompressed by a thread pool (zlib releases the GIL) and kept in an LRU cache.
+    def __init__(self, path, cache_blocks = 512, threads = os.cpu_count() or 1):
+        self.handle = open(path,'rb')
+        gzi = GziOpen(path)
+        self.coffsets, self.uoffsets = [dx[0] for dx in gzi], [dx[1] for dx in gzi]
+        self.cache, self.cache_blocks = OrderedDict(), cache_blocks
+        self.pool = ThreadPoolExecutor(threads) if threads > 1 else None
+
+    def Compressed(self, index):
+        end = self.coffsets[index + 1] if index + 1 < len(self.coffsets) else os.fstat(self.handle.fileno()).st_size
+        return os.pread(self.handle.fileno(), end - self.coffsets[index], self.coffsets[index])
+
+    def Blocks(self, first, last): # decompressed blocks first..last, only blocks missing from the cache are read
+        missing = [cx for cx in range(first, last + 1) if cx not in self.cache]
+        raw = [self.Compressed(cx) for cx in missing]
+        for cx, block in zip(missing, self.pool.map(lambda dx: zlib.decompress(dx, 31), raw) if self.pool and len(raw) > 1 else map(lambda dx: zlib.decompress(dx, 31), raw)):
+            self.cache[cx] = block
+        blocks = []
+        for cx in range(first, last + 1):
+            self.cache.move_to_end(cx)
+            blocks.append(self.cache[cx])
+        while len(self.cache) > self.cache_blocks: self.cache.popitem(last = False)
+        return blocks
+
+    def __len__(self):
+        return self.uoffsets[-1] + len(self.Blocks(len(self.uoffsets) - 1, len(self.uoffsets) - 1)[0])
+
+    def __getitem__(self, region): # only slices [start:end] are supported
+        start, end = max(region.start or 0, 0), region.stop
+        if end is not None and end <= start: return b''
+        first = bisect.bisect_right(self.uoffsets, start) - 1
+        last = len(self.uoffsets) - 1 if end is None else bisect.bisect_right(self.uoffsets, end - 1) - 1
+        data = b''.join(self.Blocks(first, last))
+        return data[start - self.uoffsets[first]:None if end is None else end - self.uoffsets[first]]
+
+    def close(self):
+        if self.pool: self.pool.shutdown()
+        self.handle.close()
+
+def IsBgzf(path): # gzip magic plus the 'BC' extra subfield that carries the BGZF block size
+    with open(path,'rb') as FAS: head = FAS.read(18)
+    return len(head) == 18 and head[:4] == b'\x1f\x8b\x08\x04' and head[12:14] == b'BC'
+
+def GziBuild(path): # out: [[compressed_offset, uncompressed_offset]] of every block, read from the block headers only
+    gzi, coffset, uoffset = [], 0, 0
+    with open(path,'rb') as BGZ:
+        size = os.fstat(BGZ.fileno()).st_size
+        while coffset < size:
+            head = os.pread(BGZ.fileno(), 18, coffset)
+            if head[:4] != b'\x1f\x8b\x08\x04' or head[12:14] != b'BC': raise ValueError('{} is not BGZF compressed, use bgzip instead of gzip'.format(path))
+            block_size = int.from_bytes(head[16:18], 'little') + 1
+            gzi.append([coffset, uoffset])
+            uoffset += int.from_bytes(os.pread(BGZ.fileno(), 4, coffset + block_size - 4), 'little')
+            coffset += block_size
+    return gzi
+
+def GziOpen(path): # .gzi layout (samtools/htslib): uint64 count, then count pairs of uint64, the first block (0, 0) is implicit
+    gzi_file = path + '.gzi'
+    if os.path.exists(gzi_file) and os.path.getmtime(gzi_file) >= os.path.getmtime(path):
+        with open(gzi_file,'rb') as GZI: data = GZI.read()
+        values = [int.from_bytes(data[cx:cx + 8], 'little') for cx in range(8, len(data), 8)]
+        return [[0, 0]] + [values[cx:cx + 2] for cx in range(0, len(values), 2)]
+    gzi = GziBuild(path)
+    try:
+        with ReplaceFile(gzi_file,'wb') as GZI:
+            GZI.write((len(gzi) - 1).to_bytes(8, 'little') + b''.join(dx[0].to_bytes(8, 'little') + dx[1].to_bytes(8, 'little') for dx in gzi[1:]))
+    except OSError as err: sys.stderr.write('WARNING: {} can not be written ({}).\n'.format(gzi_file, err))
+    return gzi
+
+def FastaMap(path): # whole fasta as a sliceable object: mmap for plain text, BgzfFile for bgzip
+    if IsBgzf(path): return BgzfFile(path)
+    if os.path.getsize(path) == 0: return b''
+    with open(path,'rb') as FAS: return mmap.mmap(FAS.fileno(), 0, access = mmap.ACCESS_READ)
+
+def NextHead(data, pos): # position of the next '>' at a line start, at or after pos, -1 if there is none
+    if pos == 0 and data[:1] == b'>': return 0
+    found = data.find(b'\n>', max(pos - 1, 0))
+    return found + 1 if found != -1 else -1
+
+def FaiScan(fasta_file, start, end): # index all records whose header starts in byte range [start, end) of the fasta file
+    fai, data = [], FastaMap(fasta_file)
+    head = NextHead(data, start)
+    while head != -1 and head < end: # a record is read to its end, even if that lies behind the range
+        seq_start = data.find(b'\n', head) + 1 or len(data)
+        name = (data[head + 1:seq_start].split() or [b''])[0].decode()
+        next_head = NextHead(data, seq_start)
+        length, line_bases, line_bytes = FaiRecord(data[seq_start:next_head if next_head != -1 else len(data)], name)
+        fai.append([name, length, seq_start, line_bases, line_bytes])
+        head = next_head
+    if data: data.close()
+    return fai
+
+def FaiStream(lines): # same index as FaiScan from an iterator of lines, used for compressed fasta that can not be memory mapped
+    fai, offset, record, closed = [], 0, None, False # closed: a short or blank line was seen, the record may not continue
+    for line in lines:
+        if line[:1] == b'>':
+            name = (line[1:].split() or [b''])[0].decode()
+            record, closed = [name, 0, offset + len(line), 0, 0], False
+            fai.append(record)
+        elif record is not None:
+            bases = len(line.rstrip(b'\r\n'))
+            if bases and closed or bases > record[3] > 0 or (bases == record[3] and line[-1:] == b'\n' and len(line) != record[4]):
+                raise ValueError('different line length in sequence ' + record[0])
+            if bases and not record[3]: record[3], record[4] = bases, len(line)
+            if bases < record[3] or line[-1:] != b'\n': closed = True
+            record[1] += bases
+        offset += len(line)
+    for dx in fai: # single line without newline at the end of the file
+        if dx[3] and dx[4] == dx[3]: dx[4] += 1
+    return fai
+
+def FaiRecord(body, name): # out: [length, line_bases, line_bytes] of one sequence, ValueError if line width is not consistent
+    first = body.find(b'\n')
+    eol = 2 if first > 0 and body[first - 1:first] == b'\r' else 1
+    body = body.rstrip(b'\r\n') # tolerate blank lines at the end of a record
+    if not body: return [0, 0, 0]
+    if first == -1 or first >= len(body): return [len(body), len(body), len(body) + eol] # single line sequence
+    line_bytes = first + 1
+    line_bases = line_bytes - eol
+    length = len(body) - body.count(b'\n') - (body.count(b'\r') if eol == 2 else 0)
+    full, rest = length // line_bases, length % line_bases
+    newlines = full if rest else full - 1 # the last line has no newline after rstrip
+    # every full line has to end exactly every line_bytes bytes, and only the last line may be shorter
+    if len(body) != full * line_bytes + (rest if rest else -eol) or body.count(b'\n') != newlines or body[line_bytes - 1::line_bytes].count(b'\n') != newlines:
+        raise ValueError('different line length in sequence ' + name)
+    return [length, line_bases, line_bytes]
+
+def FaiBuild(fasta_file, jobs = 1, chunk_size = 1 << 26):
+    # The file is split in byte ranges of at least chunk_size, records are indexed by the range that holds their header.
+    if IsBgzf(fasta_file):
+        with gzip.open(fasta_file,'rb') as FAS: return FaiStream(FAS)
+    size = os.path.getsize(fasta_file)
+    jobs = max(1, min(jobs, size // chunk_size))
+    ranges = [[fasta_file, size * cx // jobs, size * (cx + 1) // jobs] for cx in range(jobs)]
+    if jobs == 1: return FaiScan(*ranges[0])
+    with multiprocessing.get_context('fork').Pool(jobs) as pool: return [dx for fai in pool.starmap(FaiScan, ranges) for dx in fai]
+
+def FaiWrite(fai, fai_file): # written to a temporary file first, a crash never leaves a partial index behind
+    with ReplaceFile(fai_file) as FAI:
+        for dx in fai: FAI.write('\t'.join(map(str, dx)) + '\n')
+
+def FaiOpen(fasta_file, jobs = os.cpu_count() or 1): # out: {name:[length, offset, line_bases, line_bytes]}, index is (re)built if missing or older than the fasta
+    fai_file = fasta_file + '.fai'
+    if not os.path.exists(fai_file) or os.path.getmtime(fai_file) < os.path.getmtime(fasta_file):
+        sys.stderr.write('Indexing {}\n'.format(fasta_file))
+        fai = FaiBuild(fasta_file, jobs)
+        try: FaiWrite(fai, fai_file)
+        except OSError as err: sys.stderr.write('WARNING: {} can not be written ({}), index is kept in memory.\n'.format(fai_file, err))
+        return {dx[0]:dx[1:] for dx in fai}
+    with open(fai_file,'r') as FAI: return {dx.split('\t')[0]:list(map(int,dx.split('\t')[1:])) for dx in FAI}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='FaIndex', description='Build a samtools compatible .fai index of a fasta file. Requires python 3.4+')
+    parser.add_argument('FASTA', help = 'Input fasta file.')
+    parser.add_argument('-j', dest='jobs', action = 'store', type = int, default = os.cpu_count() or 1, metavar='N', help = 'Number of worker processes (default = all cores).')
+    args = parser.parse_args()
+    try: FaiWrite(FaiBuild(args.FASTA, args.jobs), args.FASTA + '.fai')
+    except ValueError as err:
+        sys.stderr.write('ERROR: {} in {}\n'.format(err, args.FASTA))
+        exit(1)
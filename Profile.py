@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# Version 2026-10:
+# Stage instrumentation for SynBuild and ChrBuild (--profile). Wall and cpu time, call count, bytes read/written and peak memory per named stage.
+# Results are written as PREFIX.profile.json and PREFIX.profile.tsv, --profile-stage NAME adds a cProfile dump PREFIX.NAME.prof.
+# Usage in the tools: with PROFILE.Stage('name'): ... Nested stages are reported as 'outer/inner'.
+# Disabled (default) Stage() returns one shared object that does nothing, so instrumented code costs one method call per stage.
+import sys
+import json
+import time
+import resource
+
+COLUMNS = ['stage', 'calls', 'seconds', 'cpu_seconds', 'children_cpu_seconds', 'bytes_read', 'bytes_written', 'peak_rss_kb']
+
+def ProcRead(path): # out: {field:int} of a /proc/self key: value file, {} where /proc is not available
+    try:
+        with open(path,'r') as PROC: return {dx.split(':')[0]:int(dx.split(':')[1].split()[0]) for dx in PROC if ':' in dx and dx.split(':')[1].split()[:1] and dx.split(':')[1].split()[0].isdigit()}
+    except OSError: return {}
+
+def PeakRss(): # out: peak RSS in kB since the last reset (VmHWM), the process lifetime peak without /proc
+    peak = ProcRead('/proc/self/status').get('VmHWM')
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin': peak //= 1024 # bytes on macOS
+    return peak
+
+def PeakReset(): # Linux 4.0+, without it peaks are only exact for the first stage that reaches them. out: False when the peak could not be reset
+    try:
+        with open('/proc/self/clear_refs','w') as REFS: REFS.write('5')
+        return True
+    except OSError: return False
+
+class NullStage: # stage of a disabled profiler
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def Io(self, read = 0, written = 0): pass
+
+NULL_STAGE = NullStage()
+
+class Stage:
+    # system = False skips the /proc counters at the borders, for small stages entered many times (sequence fetch, hit grouping).
+    # Such stages only count bytes given to Io(), system stages take bytes from /proc/self/io (memory mapped reads are not included there).
+    def __init__(self, profiler, name, system):
+        self.profiler, self.name, self.system = profiler, name, system
+
+    def __enter__(self):
+        profiler = self.profiler
+        profiler.stack.append(self)
+        self.key = '/'.join(dx.name for dx in profiler.stack)
+        if self.key not in profiler.stages: profiler.stages[self.key] = dict((dx, 0 if self.system or dx not in ('children_cpu_seconds', 'peak_rss_kb') else None) for dx in COLUMNS[1:])
+        self.record = profiler.stages[self.key]
+        if self.system:
+            profiler.Peak() # the peak so far belongs to the open outer stages, before it is reset for this one
+            PeakReset()
+            self.io = ProcRead('/proc/self/io')
+            self.children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.cprofile = profiler.cprofile if profiler.cprofile_stage in (self.name, self.key) else None
+        if self.cprofile: self.cprofile.enable()
+        self.cpu, self.wall = time.process_time(), time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall, cpu = time.perf_counter() - self.wall, time.process_time() - self.cpu
+        if self.cprofile: self.cprofile.disable()
+        record = self.record
+        record['calls'] += 1
+        record['seconds'] += wall
+        record['cpu_seconds'] += cpu
+        if self.system:
+            io, children = ProcRead('/proc/self/io'), resource.getrusage(resource.RUSAGE_CHILDREN)
+            record['bytes_read'] += io.get('rchar', 0) - self.io.get('rchar', 0)
+            record['bytes_written'] += io.get('wchar', 0) - self.io.get('wchar', 0)
+            record['children_cpu_seconds'] += (children.ru_utime + children.ru_stime) - (self.children.ru_utime + self.children.ru_stime)
+            self.profiler.Peak()
+        self.profiler.stack.pop()
+        return False
+
+    def Io(self, read = 0, written = 0):
+        self.record['bytes_read'] += read
+        self.record['bytes_written'] += written
+
+class Profiler:
+    def __init__(self):
+        self.enabled, self.stack, self.stages = False, [], {}
+        self.prefix, self.cprofile_stage, self.cprofile = '', '', None
+
+    def Start(self, prefix, cprofile_stage = '', tool = ''):
+        self.enabled, self.prefix, self.tool, self.stack, self.stages = True, prefix, tool, [], {}
+        self.cprofile_stage = cprofile_stage
+        if cprofile_stage:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        PeakReset()
+
+    def Stage(self, name, system = True):
+        if not self.enabled: return NULL_STAGE
+        return Stage(self, name, system)
+
+    def Peak(self): # the current peak counts for every open stage that measures memory
+        peak = PeakRss()
+        for dx in self.stack:
+            if dx.system and peak > dx.record['peak_rss_kb']: dx.record['peak_rss_kb'] = peak
+
+    def Write(self): # PREFIX.profile.json / .tsv (and the cProfile dump), the profiler is disabled afterwards
+        if not self.enabled: return
+        self.enabled = False
+        stages = [dict([['stage', dx]] + [[cx, round(ex, 4) if isinstance(ex, float) else ex] for cx, ex in record.items()]) for dx, record in self.stages.items()]
+        total = {'seconds':round(time.perf_counter() - self.wall, 4), 'cpu_seconds':round(time.process_time() - self.cpu, 4), 'peak_rss_kb':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+        try:
+            with open(self.prefix + '.profile.json','w') as JSON: json.dump({'tool':self.tool, 'argv':sys.argv, 'total':total, 'stages':stages}, JSON, indent = 1)
+            with open(self.prefix + '.profile.tsv','w') as TSV:
+                TSV.write('\t'.join(COLUMNS) + '\n')
+                for dx in stages: TSV.write('\t'.join('' if dx[cx] is None else str(dx[cx]) for cx in COLUMNS) + '\n') # empty: not measured for this stage
+            if self.cprofile:
+                self.cprofile.dump_stats(self.prefix + '.' + self.cprofile_stage.replace('/', '.') + '.prof')
+                self.cprofile = None
+        except OSError as err: sys.stderr.write('WARNING: profile can not be written ({}).\n'.format(err))
+
+def AddArguments(group): # --profile/--profile-stage for an argparse group of the tools
+    group.add_argument('--profile', dest='profile', action = 'store', nargs = '?', const = True, default = None, metavar='PREFIX', help = 'Write time, calls, bytes and peak memory per stage to PREFIX.profile.json/.tsv (default PREFIX = output name). Stages inside -j workers count in the stage that started them.')
+    group.add_argument('--profile-stage', dest='profile_stage', action = 'store', default = '', metavar='STAGE', help = 'With --profile, also dump cProfile statistics of one stage to PREFIX.STAGE.prof.')
+
+PROFILE = Profiler() # shared by all modules of one run, disabled until Start
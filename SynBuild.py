@@ -11,20 +11,64 @@
 #   Update SvgObj.ChrBox module, add option for other species, and complex loci highlighting
 # Version 2018-12-01:
 #   Add chromosome G-banding prediction for scaffold
+# Version 2026-10:
+#   BLAST hits are cached in a binary columnar file (<blastn>.hitcache), later runs on the same table skip parsing
+#   BLAST table is parsed in binary blocks, E values are compared numerically (2e-50, 1.5e-120, e-100 and 0.0 all accepted)
+#   RepeatFilter counts hits per window with hashed counters (linear per scaffold), RepeatFilterBatch filters the whole table in one pass
+#   HitGrouping blocks are memoized per (scaffold, chr, noise_suppress) and kept in <blastn>.groupcache for -c, -a, -g and -b
+#   Query .fai is built internally (FaIndex.py) when missing or outdated, the fasta itself is accepted as faindex
+#   -c All renders every chromosome in one run, -j N spreads the chromosomes over N processes
+#   Importable: parse/filter/group/render stages take explicit FilterSensitivity/SynConfig objects, the command line is main(). wand/img2pdf load only for -pdf
+#   -a ScaffoldAlignment finds the closest scaffold end by bisect on a sorted end list (used ends skipped by pointers), ComboCheck looks the scaffold up directly
+#   ReferenceProfile: reference lengths (MM10 table or -r .fai) and complex regions (MM10 table or --regions BED/TSV with colours) loaded once per run
+#   -s bins the hits to figure resolution and merges co-linear bins into ribbons, streamed to the SVG file (--full-detail: one line per hit)
+#   -pdf rasterizes in memory (no temp.png, parallel runs in one directory are safe), --dpi sets the resolution, --multipage puts -c pages in one pdf
+#   -g: ChrBand uses prefix sums (linear per scaffold), --band-res 100K-1M, --cytoband loads UCSC cytoBand tables once per run, -g All renders every scaffold in one pass
+#   -b statistics are aggregated while the BLAST table is parsed (kept in the hit cache), no second read of the table
+#   -j N also parses the BLAST table in N processes (line aligned byte ranges, merged in file order) and repeat filters whole scaffolds in parallel
+#   --profile writes time, calls, bytes and peak memory per stage (Profile.py), --profile-stage adds a cProfile dump of one stage
 # Todo:
 #    generate cmap and xmap for irysview
-#    internal .fasta.fai
 #    Should support referene genome other than Mus Mus
 
 import os
 import sys
+import mmap
+import json
+import bisect
 import argparse
-import img2pdf
-import operator
+import multiprocessing
 import statistics
-from wand.image import Image
+from array import array
+from collections import Counter
+from FaIndex import FaiOpen, ReplaceFile
+from Profile import PROFILE, AddArguments as ProfileArguments
 
 ########################################## Functions #############################################
+# GRCm38/MM10 chromosome lengths and complex regions, [length, [[start, end], ...]], the default reference (-r MM10)
+MM10_CHR = {
+    'chr1':[195471971,[[9400000,9600000],[21200000,21400000],[46200000,46800000],[53200000,53800000],[58600000,59000000],[82800000,83000000],[84800000,85800000],[88000000,88400000],[92400000,92600000],[93800000,94200000],[103400000,103600000],[107000000,107400000],[117600000,118200000],[139600000,140200000],[153200000,153600000],[166400000,166800000],[171400000,172000000],[173200000,173400000],[177800000,178200000],[195200000,195400000]]],
+    'chr2':[182113224,[[27400000,27600000],[37200000,37400000],[77800000,78000000],[88000000,88200000],[88200000,88400000],[116400000,116600000],[122400000,122600000],[149000000,149200000],[150000000,150600000],[151000000,151600000],[154000000,154400000],[173800000,174000000],[175000000,175200000],[177000000,178200000],[181800000,182000000]]],
+    'chr3':[160039680,[[3000000,3400000],[14600000,14800000],[15200000,16000000],[28800000,29000000],[31400000,31800000],[35600000,35800000],[40800000,41000000],[64000000,64800000],[77200000,77400000],[88600000,89000000],[90600000,92400000],[93600000,94800000],[97000000,97600000],[98400000,98800000],[106000000,106400000],[113200000,113400000],[142400000,142800000],[144600000,145000000]]],
+    'chr4':[156508116,[[3000000,3800000],[12000000,12200000],[49200000,49600000],[60000000,60200000],[61400000,62200000],[63200000,63400000],[88600000,89000000],[112600000,114400000],[115200000,115600000],[118600000,119000000],[121200000,122800000],[137400000,137600000],[143400000,144400000],[145400000,148000000],[149600000,149800000],[156200000,156400000]]],
+    'chr5':[151834684,[[3000000,4400000],[10800000,12000000],[13600000,14000000],[14800000,15800000],[23200000,23400000],[25800000,26400000],[27800000,28000000],[31200000,31600000],[73000000,73200000],[77400000,77800000],[79400000,80000000],[86800000,87400000],[88000000,88400000],[103800000,105000000],[108800000,110200000],[120800000,121000000],[137800000,138600000],[145000000,146600000],[151400000,151800000]]],
+    'chr6':[149736546,[[3000000,3600000],[41800000,42200000],[43000000,43200000],[47000000,47200000],[48200000,48400000],[57000000,58800000],[59400000,60600000],[66600000,66800000],[67400000,70800000],[82600000,82800000],[85600000,86000000],[89000000,90200000],[116400000,116600000],[121400000,122400000],[123000000,124200000],[128600000,129200000],[130000000,134000000],[136200000,137000000],[137800000,138000000]]],
+    'chr7':[145441459,[[3000000,3200000],[3600000,8600000],[11000000,11200000],[11600000,11800000],[12000000,12200000],[12600000,12800000],[13600000,16000000],[17200000,17400000],[18200000,18800000],[19800000,20200000],[23200000,24800000],[25400000,27200000],[27600000,28000000],[28800000,29000000],[30800000,34200000],[38200000,39600000],[41000000,44200000],[46600000,48200000],[60200000,61800000],[64000000,64200000],[84800000,86200000],[103000000,105000000],[106200000,106800000],[107800000,109000000],[131000000,131200000],[134800000,135000000],[140200000,140800000],[142200000,142400000],[143600000,143800000]]],
+    'chr8':[129401213,[[3000000,3200000],[13800000,14000000],[19200000,21800000],[27200000,27400000],[28200000,28600000],[37000000,37200000],[55200000,55800000],[59800000,60000000],[69400000,69800000],[70800000,71200000],[71600000,72000000],[99600000,99800000]]],
+    'chr9':[124595110,[[3000000,3400000],[35800000,36000000],[38400000,39400000],[40000000,40200000],[55800000,56200000],[78200000,78400000],[88400000,89400000],[98800000,99000000],[109400000,109800000],[114000000,114400000],[115000000,115200000],[124200000,124600000]]],
+    'chr10':[130694993,[[3200000,3400000],[7200000,7600000],[22000000,22600000],[24000000,24600000],[33400000,34000000],[51400000,51600000],[55000000,55200000],[57400000,57600000],[58200000,58400000],[79000000,79600000],[82200000,82600000],[85600000,86000000],[86400000,86800000],[112000000,112200000],[118000000,118400000],[122000000,122200000]]],
+    'chr11':[122082543,[[3000000,3200000],[21400000,21600000],[46600000,46800000],[48800000,49600000],[51000000,51200000],[52000000,52600000],[60400000,60800000],[71000000,71400000],[73400000,74200000],[82800000,83800000],[98600000,98800000],[99600000,99800000],[116600000,116800000],[121800000,122000000]]],
+    'chr12':[120129022,[[3000000,3200000],[8400000,8600000],[17800000,21200000],[21600000,24600000],[87400000,88400000],[102600000,102800000],[103600000,104400000],[105000000,105600000],[113200000,116000000]]],
+    'chr13':[120421639,[[3000000,3600000],[12600000,14000000],[19200000,19400000],[33200000,33600000],[49800000,51000000],[60800000,62800000],[65200000,68600000],[74400000,74600000],[100200000,100600000],[113000000,113200000],[119800000,120400000]]],
+    'chr14':[124902244,[[4000000,4400000],[5800000,7000000],[13000000,13200000],[19000000,19800000],[26200000,26800000],[36000000,36200000],[41200000,42600000],[43000000,45000000],[51000000,52000000],[55800000,56200000],[57000000,57200000],[59200000,59400000]]],
+    'chr15':[104043685,[[3000000,3200000],[8800000,9400000],[14800000,15000000],[63800000,64000000],[75000000,75600000],[77400000,77800000],[82400000,82800000],[91200000,91600000],[98200000,98400000],[101600000,101800000],[103600000,104000000]]],
+    'chr16':[98207768,[[3000000,3800000],[19000000,19400000],[20800000,21200000],[32600000,32800000],[44600000,45000000],[59200000,59400000],[93400000,93800000],[98000000,98200000]]],
+    'chr17':[94987271,[[3000000,3200000],[6200000,7600000],[7800000,8200000],[13000000,14200000],[17000000,17400000],[18000000,20000000],[21000000,21200000],[21600000,24000000],[27200000,27400000],[30200000,31400000],[33000000,33200000],[33800000,34600000],[35200000,37000000],[38400000,39000000],[48000000,48400000],[53600000,54000000],[71400000,71600000],[94600000,94800000]]],
+    'chr18':[90702639,[[3000000,3200000],[20600000,20800000],[36800000,37000000]]],
+    'chr19':[61431566,[[3000000,3400000],[8000000,8600000],[9200000,9800000],[12000000,12400000],[13000000,14000000],[33400000,33600000],[34400000,34800000],[39400000,40200000],[61000000,61400000]]],
+    'chrx':[171031299,[[3200000,3400000],[4400000,4600000],[5000000,6200000],[8200000,9600000],[31000000,31400000],[32600000,32800000],[37400000,37800000],[39800000,40000000],[46000000,46200000],[50400000,50800000],[53400000,54400000],[55200000,56200000],[62400000,62600000],[70200000,70600000],[73000000,73400000],[74400000,75000000],[75600000,75800000],[77800000,78400000],[86200000,86400000],[91200000,92200000],[94600000,95000000],[102600000,103400000],[123000000,123400000],[124000000,124200000],[135000000,135600000],[136200000,137000000],[147200000,148000000],[148800000,149000000],[149600000,150000000],[153000000,153200000],[154800000,155200000],[161000000,161200000]]],
+    'other':[91744698,[]]}
+
 class SvgObj:
     def __init__(self): # colours available for up to 40 different chromosome's.
         self.chr_color = {'chr1':'#ffaaaa','chr2':'#ff9955','chr3':'#ffd42a','chr4':'#ccff00','chr5':'#66ff00','chr6':'#00ffcc','chr7':'#000080','chr8':'#80b3ff','chr9':'#b380ff','chr10':'#f4d7ee','chr11':'#ff0000','chr12':'#803300','chr13':'#a0892c','chr14':'#677821','chr15':'#5aa02c','chr16':'#165016','chr17':'#0066ff','chr18':'#214478','chr19':'#c837ab','chr20':'#ef9504', 'chr21':'#4c2418','chr22':'#e8e8a0','chr23':'#5e5e31','chr24':'#315e53','chr25':'#79fce6','chr26':'#f442e5','chr27':'#751d6d','chr28':'#a3609d','chr29':'#c3bee2','chr30':'#919607','chr31':'#d5eaa4','chr32':'#d69f77','chr33':'#28ff89','chr34':'#fdff87','chr35':'#a00303','chr36':'#bfaddb','chr37':'#aa874e','chr38':'#e28cba','chrx':'#4400aa','other':'#b0b0b0'}
@@ -74,40 +118,10 @@ class SvgObj:
         chr_ = text.lower() if text.lower() in self.chr_color.keys() else 'other'
         # defines position of complex region of each chr
         if not chr_detail:
-            if genome == 'MM10': # indicator of complex region on available for mus musculus
-                chr_detail = {
-                'MM10':{
-                'chr1':[195471971,[[9400000,9600000],[21200000,21400000],[46200000,46800000],[53200000,53800000],[58600000,59000000],[82800000,83000000],[84800000,85800000],[88000000,88400000],[92400000,92600000],[93800000,94200000],[103400000,103600000],[107000000,107400000],[117600000,118200000],[139600000,140200000],[153200000,153600000],[166400000,166800000],[171400000,172000000],[173200000,173400000],[177800000,178200000],[195200000,195400000]]],
-                'chr2':[182113224,[[27400000,27600000],[37200000,37400000],[77800000,78000000],[88000000,88200000],[88200000,88400000],[116400000,116600000],[122400000,122600000],[149000000,149200000],[150000000,150600000],[151000000,151600000],[154000000,154400000],[173800000,174000000],[175000000,175200000],[177000000,178200000],[181800000,182000000]]],
-                'chr3':[160039680,[[3000000,3400000],[14600000,14800000],[15200000,16000000],[28800000,29000000],[31400000,31800000],[35600000,35800000],[40800000,41000000],[64000000,64800000],[77200000,77400000],[88600000,89000000],[90600000,92400000],[93600000,94800000],[97000000,97600000],[98400000,98800000],[106000000,106400000],[113200000,113400000],[142400000,142800000],[144600000,145000000]]],
-                'chr4':[156508116,[[3000000,3800000],[12000000,12200000],[49200000,49600000],[60000000,60200000],[61400000,62200000],[63200000,63400000],[88600000,89000000],[112600000,114400000],[115200000,115600000],[118600000,119000000],[121200000,122800000],[137400000,137600000],[143400000,144400000],[145400000,148000000],[149600000,149800000],[156200000,156400000]]],
-                'chr5':[151834684,[[3000000,4400000],[10800000,12000000],[13600000,14000000],[14800000,15800000],[23200000,23400000],[25800000,26400000],[27800000,28000000],[31200000,31600000],[73000000,73200000],[77400000,77800000],[79400000,80000000],[86800000,87400000],[88000000,88400000],[103800000,105000000],[108800000,110200000],[120800000,121000000],[137800000,138600000],[145000000,146600000],[151400000,151800000]]],
-                'chr6':[149736546,[[3000000,3600000],[41800000,42200000],[43000000,43200000],[47000000,47200000],[48200000,48400000],[57000000,58800000],[59400000,60600000],[66600000,66800000],[67400000,70800000],[82600000,82800000],[85600000,86000000],[89000000,90200000],[116400000,116600000],[121400000,122400000],[123000000,124200000],[128600000,129200000],[130000000,134000000],[136200000,137000000],[137800000,138000000]]],
-                'chr7':[145441459,[[3000000,3200000],[3600000,8600000],[11000000,11200000],[11600000,11800000],[12000000,12200000],[12600000,12800000],[13600000,16000000],[17200000,17400000],[18200000,18800000],[19800000,20200000],[23200000,24800000],[25400000,27200000],[27600000,28000000],[28800000,29000000],[30800000,34200000],[38200000,39600000],[41000000,44200000],[46600000,48200000],[60200000,61800000],[64000000,64200000],[84800000,86200000],[103000000,105000000],[106200000,106800000],[107800000,109000000],[131000000,131200000],[134800000,135000000],[140200000,140800000],[142200000,142400000],[143600000,143800000]]],
-                'chr8':[129401213,[[3000000,3200000],[13800000,14000000],[19200000,21800000],[27200000,27400000],[28200000,28600000],[37000000,37200000],[55200000,55800000],[59800000,60000000],[69400000,69800000],[70800000,71200000],[71600000,72000000],[99600000,99800000]]],
-                'chr9':[124595110,[[3000000,3400000],[35800000,36000000],[38400000,39400000],[40000000,40200000],[55800000,56200000],[78200000,78400000],[88400000,89400000],[98800000,99000000],[109400000,109800000],[114000000,114400000],[115000000,115200000],[124200000,124600000]]],
-                'chr10':[130694993,[[3200000,3400000],[7200000,7600000],[22000000,22600000],[24000000,24600000],[33400000,34000000],[51400000,51600000],[55000000,55200000],[57400000,57600000],[58200000,58400000],[79000000,79600000],[82200000,82600000],[85600000,86000000],[86400000,86800000],[112000000,112200000],[118000000,118400000],[122000000,122200000]]],
-                'chr11':[122082543,[[3000000,3200000],[21400000,21600000],[46600000,46800000],[48800000,49600000],[51000000,51200000],[52000000,52600000],[60400000,60800000],[71000000,71400000],[73400000,74200000],[82800000,83800000],[98600000,98800000],[99600000,99800000],[116600000,116800000],[121800000,122000000]]],
-                'chr12':[120129022,[[3000000,3200000],[8400000,8600000],[17800000,21200000],[21600000,24600000],[87400000,88400000],[102600000,102800000],[103600000,104400000],[105000000,105600000],[113200000,116000000]]],
-                'chr13':[120421639,[[3000000,3600000],[12600000,14000000],[19200000,19400000],[33200000,33600000],[49800000,51000000],[60800000,62800000],[65200000,68600000],[74400000,74600000],[100200000,100600000],[113000000,113200000],[119800000,120400000]]],
-                'chr14':[124902244,[[4000000,4400000],[5800000,7000000],[13000000,13200000],[19000000,19800000],[26200000,26800000],[36000000,36200000],[41200000,42600000],[43000000,45000000],[51000000,52000000],[55800000,56200000],[57000000,57200000],[59200000,59400000]]],
-                'chr15':[104043685,[[3000000,3200000],[8800000,9400000],[14800000,15000000],[63800000,64000000],[75000000,75600000],[77400000,77800000],[82400000,82800000],[91200000,91600000],[98200000,98400000],[101600000,101800000],[103600000,104000000]]],
-                'chr16':[98207768,[[3000000,3800000],[19000000,19400000],[20800000,21200000],[32600000,32800000],[44600000,45000000],[59200000,59400000],[93400000,93800000],[98000000,98200000]]],
-                'chr17':[94987271,[[3000000,3200000],[6200000,7600000],[7800000,8200000],[13000000,14200000],[17000000,17400000],[18000000,20000000],[21000000,21200000],[21600000,24000000],[27200000,27400000],[30200000,31400000],[33000000,33200000],[33800000,34600000],[35200000,37000000],[38400000,39000000],[48000000,48400000],[53600000,54000000],[71400000,71600000],[94600000,94800000]]],
-                'chr18':[90702639,[[3000000,3200000],[20600000,20800000],[36800000,37000000]]],
-                'chr19':[61431566,[[3000000,3400000],[8000000,8600000],[9200000,9800000],[12000000,12400000],[13000000,14000000],[33400000,33600000],[34400000,34800000],[39400000,40200000],[61000000,61400000]]],
-                'chrx':[171031299,[[3200000,3400000],[4400000,4600000],[5000000,6200000],[8200000,9600000],[31000000,31400000],[32600000,32800000],[37400000,37800000],[39800000,40000000],[46000000,46200000],[50400000,50800000],[53400000,54400000],[55200000,56200000],[62400000,62600000],[70200000,70600000],[73000000,73400000],[74400000,75000000],[75600000,75800000],[77800000,78400000],[86200000,86400000],[91200000,92200000],[94600000,95000000],[102600000,103400000],[123000000,123400000],[124000000,124200000],[135000000,135600000],[136200000,137000000],[147200000,148000000],[148800000,149000000],[149600000,150000000],[153000000,153200000],[154800000,155200000],[161000000,161200000]]],
-                'other':[91744698,[]]}}[genome][chr_]
-                for dx in chr_detail[1]: complexR = complexR + '<rect x="' + str(x + int(dx[0]/1e5)) + '" y="' + str(y-1) + '" width="' + str(int((dx[1]-dx[0])/1e5)+1) +'" height="' + str(101) + '" style="fill:black;"/>\n'
-            else:
-                RefGenome = open(genome,'r')
-                chrom_length_dict, gen_dict = {}, {}
-                for line in RefGenome:
-                    splitted_line = line.split('\t')
-                    chrom_length_dict[splitted_line[0].lower()] = splitted_line[1]
-                for chrom in chrom_length_dict.keys(): gen_dict[chrom] = [chrom_length_dict[chrom]]
-                chr_detail = {args.Ref_genome: gen_dict}[genome][chr_]
-                complexR = ''
+            reference = genome if isinstance(genome, ReferenceProfile) else ReferenceProfile.Open(genome)
+            chr_name = text.lower() if text.lower() in reference.length else chr_
+            chr_detail = [reference.length[chr_name], []]
+            for dx in reference.boxes.get(chr_name, []): complexR = complexR + '<rect x="' + str(x + dx[0]) + '" y="' + str(y-1) + '" width="' + str(dx[1]) +'" height="' + str(101) + '" style="fill:' + dx[2] + ';"/>\n'
 
         width = int(chr_detail[0])/1e5+1
         box_print = '<rect x="' + str(x) + '" y="' + str(y) + '" width="' + str(width) +'" height="' + str(100) + '" style="fill:'+self.chr_color[chr_]+'"/>\n'
@@ -131,8 +145,50 @@ class SvgObj:
             text_print = '<text text-anchor="middle" x ="' + str(xco) + '" y="' + str(yco) + '" fill="black" font-size="' + str(font_size) +'" > ' + text + '</text>'
         return box_print + complexR, text_print
 
+class ReferenceProfile: # reference chromosomes of the figures, loaded once per run (SynConfig) instead of once per drawn box
+    # Lengths come from MM10_CHR or the -r fasta index, complex regions from MM10_CHR or a --regions file (any reference).
+    opened = {} # profiles of ChrBox calls that give a genome name/file instead of a profile
+    def __init__(self, genome = 'MM10', regions_file = ''):
+        if genome == 'MM10':
+            self.length = dict((dx, ex[0]) for dx, ex in MM10_CHR.items())
+            regions = dict((dx, [[cx[0], cx[1], 'black'] for cx in ex[1]]) for dx, ex in MM10_CHR.items())
+        else:
+            with open(genome,'r') as FAI: self.length = dict((dx.split('\t')[0].lower(), int(dx.split('\t')[1])) for dx in FAI if '\t' in dx)
+            regions = {}
+        if regions_file: regions = RegionRead(regions_file)
+        # region boxes per chromosome [x offset, width, colour] in figure units (100 kb), sorted on start, ChrBox only formats them
+        self.boxes = dict((dx, [[int(cx[0]/1e5), int((cx[1]-cx[0])/1e5)+1, cx[2]] for cx in sorted(ex, key = lambda cx: cx[:2])]) for dx, ex in regions.items())
+
+    @classmethod
+    def Open(cls, genome):
+        if genome not in cls.opened: cls.opened[genome] = cls(genome)
+        return cls.opened[genome]
+
+def RegionRead(regions_file): # out: {chr:[[start, end, colour], ...]}. BED (0-based, colour from itemRgb) or TSV: chrom start end [colour]
+    regions, bed = {}, regions_file.lower().endswith('.bed')
+    with open(regions_file,'r') as REGIONS:
+        for line in REGIONS:
+            if line[0] == '#' or line.startswith(('track', 'browser')) or not line.strip(): continue
+            data = line.rstrip('\n').split('\t')
+            if bed: colour = 'rgb(' + data[8] + ')' if len(data) > 8 and data[8].count(',') == 2 else 'black'
+            else: colour = data[3] if len(data) > 3 and data[3] else 'black'
+            regions.setdefault(data[0].lower(), []).append([int(data[1]), int(data[2]), colour])
+    return regions
+
+ # UCSC cytoBand gieStain -> band level of the G-band emulation (0 = light, 3 = dark)
+CYTOBAND_LEVEL = {'gneg':0, 'gpos25':1, 'gpos33':1, 'gpos50':2, 'gpos66':2, 'gpos75':3, 'gpos100':3, 'acen':3, 'gvar':3, 'stalk':3}
+
 class ChrBand:
-    def __init__(self):
+    # G-band levels of the reference, from the MM10 strings below or a UCSC cytoBand file (loaded once), at 100 kb - 1 Mb resolution
+    def __init__(self, cytoband_file = ''):
+        self.cytoband, self.cache = {}, {} # cytoband: {chr:[starts, ends, levels]} sorted on start, cache: {(chr, resolution):[level per bin]}
+        if cytoband_file:
+            with open(cytoband_file,'r') as CYTO:
+                for line in CYTO:
+                    data = line.rstrip('\n').split('\t')
+                    if line[0] == '#' or len(data) < 5: continue
+                    self.cytoband.setdefault(data[0].lower(), []).append([int(data[1]), int(data[2]), CYTOBAND_LEVEL.get(data[4], 0)])
+            self.cytoband = dict((dx, list(zip(*sorted(ex)))) for dx, ex in self.cytoband.items())
         self.band = { 
         # based on MM10, resolution 1M
         'chr1': '32233333300011111111|00333333333000000000|00022222222222102221|00000111111111100000|11111110000000000000|11103333333310333333|33333300122222222221|00000002333313333100|11110011110000001111|1100000011111111',
@@ -156,28 +212,48 @@ class ChrBand:
         'chr19':'32233333333333332000|00000122222222200022|22222221000011111110|000',
         'chrx' :'32233333333333330011|10000000222221122222|00000000222222221000|00022222210222222100|00233333333033333333|30000000003333333333|03333333333333300000|00111111100000001111|111100000000'
         }
-    def BandEmulation(self,scaffold_length,window_size,group_list): # group_list: {chr:[[Ref_start,Ref_end,Que_start,Que_end,count=xxx][Ref_start,Ref_end,Que_start,Que_end,count=xxx]],chr:[...]}
-        band_list, scaffold_band, scaffold_overlap, scaffold_pattern = [], ['_']*int(scaffold_length/1e6+1), [0]*int(scaffold_length/1e6+1), [0]*int(scaffold_length/1e6+1)
+    def Bands(self, chr_, resolution = 1000000): # out: band level of every resolution sized bin of chr_, [] for chromosomes without bands
+        if (chr_, resolution) not in self.cache:
+            if self.cytoband: starts, ends, levels = self.cytoband.get(chr_, [[], [], []])
+            else: # MM10 strings, one level per Mb
+                levels = [int(dx) for dx in self.band.get(chr_, '').replace('|','')]
+                starts, ends = [cx * 1000000 for cx in range(len(levels))], [(cx + 1) * 1000000 for cx in range(len(levels))]
+            bins = []
+            for cx in range(int((ends[-1] if ends else 0) / resolution)): # level of the band under the bin start
+                found = bisect.bisect_right(starts, cx * resolution) - 1
+                bins.append(levels[found] if found >= 0 and cx * resolution < ends[found] else 0)
+            self.cache[(chr_, resolution)] = bins
+        return self.cache[(chr_, resolution)]
+
+    def BandEmulation(self,scaffold_length,window_size,group_list, resolution = 1000000): # group_list: {chr:[[Ref_start,Ref_end,Que_start,Que_end,count=xxx][Ref_start,Ref_end,Que_start,Que_end,count=xxx]],chr:[...]}
+        # window_size in Mb. Overlap and the window sums are prefix sums, linear in the scaffold length.
+        band_list, size = [], int(scaffold_length/resolution+1)
+        scaffold_band, overlap_step = [None]*size, [0]*(size+1) # None: no synteny block on this bin ('_')
         for chr_ in group_list.keys(): 
-            band_list += [[int(dx[2]/1e6), int(dx[3]/1e6),self.band[chr_].replace('|','')[int(min(dx[0],dx[1])/1e6):int(max(dx[0],dx[1])/1e6)]] for dx in group_list[chr_]]
+            band_list += [[int(dx[2]/resolution), int(dx[3]/resolution),self.Bands(chr_, resolution)[int(min(dx[0],dx[1])/resolution):int(max(dx[0],dx[1])/resolution)]] for dx in group_list[chr_]]
         band_list = sorted(map(lambda dx: dx if dx[0]<dx[1] else [dx[1],dx[0],dx[2][::-1]],band_list),key = lambda ex: ex[0])
         for dx in band_list:
-            for cx in range(dx[0],dx[1]+1): scaffold_overlap[cx] += 1
-            if dx[1]-dx[0]+1 == len(dx[2]): scaffold_band[dx[0]:dx[1]+1] = list(dx[2])
-            elif dx[1]-dx[0]+1 > len(dx[2]) and len(dx[2]) != 0: scaffold_band[dx[0]:dx[0]+len(dx[2])] = list(dx[2])
-            elif dx[1]-dx[0]+1 < len(dx[2]): scaffold_band[dx[0]:dx[1]+1] = list(dx[2])[0:dx[1]-dx[0]+1]
-        for cx in range(len(scaffold_band)):
-            for dx in range(cx-window_size//2, cx+window_size//2+1):
-                if dx >= 0 and dx < len(scaffold_band):
-                    scaffold_pattern[cx] = scaffold_pattern[cx] + int(scaffold_band[dx]) if scaffold_band[dx] != '_' else scaffold_pattern[cx]
+            overlap_step[dx[0]] += 1
+            overlap_step[min(dx[1]+1, size)] -= 1
+            length = min(dx[1]-dx[0]+1, len(dx[2])) # a block longer than its band keeps the rest of the bins, a shorter one is cut
+            scaffold_band[dx[0]:dx[0]+length] = dx[2][:length]
+        scaffold_overlap, band_sum, total = [], [0], 0
+        for cx in range(size):
+            total += overlap_step[cx]
+            scaffold_overlap.append(total)
+            band_sum.append(band_sum[-1] + (scaffold_band[cx] or 0))
+        half = int(window_size*1e6/resolution)//2
+        scaffold_pattern = [band_sum[min(cx+half+1, size)] - band_sum[max(cx-half, 0)] for cx in range(size)]
         return [scaffold_pattern,scaffold_overlap]
 
-    def BandSVG(self,scaffold_length,window_size,group_list,x=0,y=0,height=100):
-        output,maxres = '',window_size*3
-        scaffold_pattern, scaffold_overlap = self.BandEmulation(scaffold_length,window_size,group_list)
+    def BandSVG(self,scaffold_length,window_size,group_list,x=0,y=0,height=100, resolution = 1000000):
+        # one bin is resolution/100 kb wide, the figure keeps the same size at every resolution
+        output, maxres, step = '', (int(window_size*1e6/resolution)//2*2+1)*3, resolution/1e5
+        number = lambda dx: str(int(dx)) if dx == int(dx) else str(round(dx, 2))
+        scaffold_pattern, scaffold_overlap = self.BandEmulation(scaffold_length,window_size,group_list,resolution)
         for cx in range(len(scaffold_pattern)):
-            output += '<rect x="' + str(x+cx*10) + '" y="' + str(y) + '" width="10" height="' + str(height) + '" style="fill:'+SvgObj.ColorGradient(maxres-int(scaffold_pattern[cx]),maxres,'BW')+';"/>\n'
-            output += '<rect x="' + str(x+cx*10) + '" y="' + str(y+height) + '" width="10" height="' + str(scaffold_overlap[cx]*30+10) + '" style="fill:blue"/>\n'
+            output += '<rect x="' + number(x+cx*step) + '" y="' + str(y) + '" width="' + number(step) + '" height="' + str(height) + '" style="fill:'+SvgObj.ColorGradient(maxres-int(scaffold_pattern[cx]),maxres,'BW')+';"/>\n'
+            output += '<rect x="' + number(x+cx*step) + '" y="' + str(y+height) + '" width="' + number(step) + '" height="' + str(scaffold_overlap[cx]*30+10) + '" style="fill:blue"/>\n'
         return output
 
 class IrysObj:
@@ -200,26 +276,70 @@ class FilterSensitivity(): # determines sensitivity of repeatfilter function
         self.O = {'order':3, 'family':5,'genus':3,'species':1}[diversity] # in a scaffold, if hits on chromosome less than sensitivity.O (percentage), it will be omited
         self.F = {'order':5, 'family':5,'genus':5,'species':5}[diversity] # Value for hit filtering. <F continuous hits per scaffold will be deleted in refchr function.
 
-def RepeatFilter(hit_dict):  # in: one scaffold each time, {chr:[(Pos_Que, Pos_Ref)(...)(...)],chr:[(Pos_Que, Pos_Ref)(...)(...)]...}
-    Rpt_list, Qpt_list = {}, {}
-    for chr_name in hit_dict: # step 1, detect and remove likely repeat elements
+def RepeatFilter(hit_dict, sensitivity):  # in: one scaffold each time, {chr:[(Pos_Que, Pos_Ref)(...)(...)],chr:[(Pos_Que, Pos_Ref)(...)(...)]...}
+    que_hits, que_chrs, ref_hits = Counter(), {}, Counter()
+    for chr_name in hit_dict: # step 1, detect and remove likely repeat elements. Hits and distinct chromosomes are counted per R_C window
         for dx in hit_dict[chr_name]:
-            Rpt_list[dx[0]//sensitivity.R_C] = Rpt_list[dx[0]//sensitivity.R_C] + [chr_name] if dx[0]//sensitivity.R_C in list(Rpt_list) else [chr_name] 
-            Qpt_list[dx[1]//sensitivity.R_C] = Qpt_list[dx[1]//sensitivity.R_C] + [chr_name] if dx[1]//sensitivity.R_C in list(Qpt_list) else [chr_name]
-    for dx in list(Rpt_list): # if hit can be found in 3 or more chromosome's, remove hit
-        if len(set(Rpt_list[dx])) < sensitivity.C_D or len(Rpt_list[dx]) < sensitivity.H_D : del Rpt_list[dx]
-    for dx in list(Qpt_list): # if hit goes to 4 different locations on the same chromosome, remove hit
-        if len(Qpt_list[dx]) < sensitivity.H_D : del Qpt_list[dx]
+            que_hits[dx[0]//sensitivity.R_C] += 1
+            que_chrs.setdefault(dx[0]//sensitivity.R_C, set()).add(chr_name)
+            ref_hits[dx[1]//sensitivity.R_C] += 1
+    # if hit can be found in 3 or more chromosome's, remove hit. if hit goes to 4 different locations on the same chromosome, remove hit
+    que_repeat = {dx for dx, count in que_hits.items() if count >= sensitivity.H_D and len(que_chrs[dx]) >= sensitivity.C_D}
+    ref_repeat = {dx for dx, count in ref_hits.items() if count >= sensitivity.H_D}
     for chr_name in hit_dict: # remove everything in the repeat list present in original data
-        hit_dict[chr_name] = [dx for dx in hit_dict[chr_name] if dx[0]//sensitivity.R_C not in list(Rpt_list)]
-        hit_dict[chr_name] = [dx for dx in hit_dict[chr_name] if dx[1]//sensitivity.R_C not in list(Qpt_list)]
+        hit_dict[chr_name] = [dx for dx in hit_dict[chr_name] if dx[0]//sensitivity.R_C not in que_repeat and dx[1]//sensitivity.R_C not in ref_repeat]
+    return OfftargetFilter(hit_dict, sensitivity)
+
+def RepeatFilterBatch(table, sensitivity, jobs = 1): # RepeatFilter on all scaffolds of a HitTable in one pass over its columns, out: filtered hit_list
+    # With jobs > 1 the scaffolds are filtered in worker processes, each on a row range holding whole scaffolds (RepeatFilterShards).
+    global Forked
+    shards = RepeatFilterShards(table, jobs) if jobs > 1 else []
+    if len(shards) < 2: return RepeatFilterRows(table, sensitivity)
+    Forked = [table, sensitivity]
+    try:
+        hit_list = {}
+        with multiprocessing.get_context('fork').Pool(min(jobs, len(shards))) as pool:
+            for part in pool.imap(RepeatFilterWorker, shards): hit_list.update(part) # shards are in scaffold id order, as in a single process run
+    finally: Forked = None
+    return hit_list
+
+def RepeatFilterShards(table, parts): # out: [[first row, end row], ...] of about equal size, split between scaffolds. [] when the hits of a scaffold are not consecutive
+    scaffold = table.scaffold
+    if any(dx > ex for dx, ex in zip(scaffold, scaffold[1:])): return [] # ids follow the BLAST file, so this only happens for a table not grouped on query
+    bounds = sorted({bisect.bisect_left(scaffold, scaffold[cx * len(scaffold) // parts]) for cx in range(parts)} | {len(scaffold)}) if len(scaffold) else []
+    return [[dx, ex] for dx, ex in zip(bounds, bounds[1:])]
+
+def RepeatFilterWorker(rows):
+    return RepeatFilterRows(Forked[0], Forked[1], *rows)
+
+def RepeatFilterRows(table, sensitivity, start = 0, end = None): # RepeatFilterBatch of the table rows start:end, which hold whole scaffolds
+    if end is None: scaffold_column, chr_column, que_column, ref_column = table.scaffold, table.chr, table.que, table.ref
+    else: scaffold_column, chr_column, que_column, ref_column = table.scaffold[start:end], table.chr[start:end], table.que[start:end], table.ref[start:end]
+    que_window = [dx//sensitivity.R_C for dx in que_column]
+    ref_window = [dx//sensitivity.R_C for dx in ref_column]
+    # window keys are (scaffold id, window), counted over the whole table at once
+    que_hits = Counter(zip(scaffold_column, que_window))
+    que_chrs = Counter(dx[:2] for dx in set(zip(scaffold_column, que_window, chr_column)))
+    ref_hits = Counter(zip(scaffold_column, ref_window))
+    que_repeat = {dx for dx, count in que_hits.items() if count >= sensitivity.H_D and que_chrs[dx] >= sensitivity.C_D}
+    ref_repeat = {dx for dx, count in ref_hits.items() if count >= sensitivity.H_D}
+    hit_list = {dx:{} for dx in table.scaffolds} if end is None else {table.scaffolds[dx]:{} for dx in range(scaffold_column[0], scaffold_column[-1] + 1)}
+    for scaffold, chr_, que, ref, que_key, ref_key in zip(scaffold_column, chr_column, que_column, ref_column, que_window, ref_window):
+        # the chr entry is created for filtered hits too, this keeps the chromosome order of RepeatFilter
+        hits = hit_list[table.scaffolds[scaffold]].setdefault(table.chrs[chr_], [])
+        if (scaffold, que_key) not in que_repeat and (scaffold, ref_key) not in ref_repeat: hits.append((que, ref))
+    for scaffold_name in hit_list: hit_list[scaffold_name] = OfftargetFilter(hit_list[scaffold_name], sensitivity)
+    return hit_list
+
+def OfftargetFilter(hit_dict, sensitivity): # in: one scaffold, after repeat removal
     for chr_name in list(hit_dict): # remove every empty object in dictionary 
         if hit_dict[chr_name] == [] : del hit_dict[chr_name]
     total_hit = sum(len(dx) for dx in hit_dict.values()) # step 2, rare non-repeat offtargets (few hits refer to a ref chromosome, remove these (it is due to random hits))
     for chr_name in filter(lambda dx: len(hit_dict[dx])*100/total_hit < sensitivity.O ,list(hit_dict)): del hit_dict[chr_name]
     return hit_dict
 
-def HitGrouping(hit_list, noise_suppress = False): # hitlist = [(Pos_Que, Pos_Ref)(Pos_Que, Pos_Ref)...(Pos_Que, Pos_Ref)]
+def HitGrouping(hit_list, noise_suppress = False, sensitivity = None): # hitlist = [(Pos_Que, Pos_Ref)(Pos_Que, Pos_Ref)...(Pos_Que, Pos_Ref)]
+    sensitivity = sensitivity or FilterSensitivity()
     ## fist hit in list evaluation:
     # check if hit is alone in hitlist (= no second hit available):
     if len(hit_list)<2: 
@@ -273,49 +393,66 @@ def HitGrouping(hit_list, noise_suppress = False): # hitlist = [(Pos_Que, Pos_Re
                 else: groups += [[R_start, R_end_last, Q_start, Q_end_last,'count='+str(hit_count+1)]]
     return groups # out: [[Ref_start,Ref_end,Que_start,Que_end,count=xxx][Ref_start,Ref_end,Que_start,Que_end,count=xxx]...], sorted on Ref
 
+def EndFind(pointer, slot): # first end not yet used, following pointer (next or previous), paths are compressed on the way back
+    root = slot
+    while pointer[root] != root: root = pointer[root]
+    while pointer[slot] != root: pointer[slot], slot = root, pointer[slot]
+    return root
+
 def ScaffoldAlignment(groups, inp, chrom):
     # section 1: sort scaffolds based on ref start of first section of list
     # groups: {scaffold:[[Ref_start,Ref_end,Que_start,Que_end,count=xxx], scaffold:[...]...}
-    sorted_list, grouped_scaffolds, result_list, all_ref_start_ends = [], [], [], []
-    for scaffold in groups.keys():
-        sorted_list.append((scaffold, groups[scaffold][0][0]))
-        all_ref_start_ends.append((scaffold, groups[scaffold][0][0], 'start_of_closest_con')) 
-        all_ref_start_ends.append((scaffold, groups[scaffold][0][1], 'end_of_closest_con'))
-    sorted_list.sort(key=operator.itemgetter(1))
-    sorted_scaffolds = list(zip(*sorted_list))[0]
-    current_scaffold = sorted_scaffolds[0]
-    end_of_chr_flag, end_flag = False, False
-    while end_of_chr_flag == False:
+    # Both ends of every scaffold are kept in one list sorted on (ref position, order), order = 2 * scaffold index in groups (+1 for the end).
+    # Order breaks ties as the linear search did: earlier scaffold first, start before end. Used ends are skipped through next/previous pointers.
+    scaffolds = list(groups.keys())
+    if scaffolds == []: return []
+    ends = sorted((groups[scaffold][0][side], cx * 2 + side) for cx, scaffold in enumerate(scaffolds) for side in (0, 1))
+    end_pos, end_order, slot = [dx[0] for dx in ends], [dx[1] for dx in ends], {}
+    for cx, dx in enumerate(end_order): slot[dx] = cx + 1 # pointer index, 0 and len(ends) + 1 are sentinels that are never used up
+    next_end, previous_end = list(range(len(ends) + 2)), list(range(len(ends) + 2))
+    grouped_scaffolds, result_list = [], []
+    current = min(range(len(scaffolds)), key = lambda cx: (groups[scaffolds[cx]][0][0], cx)) # lowest ref start, first in groups on ties
+    end_flag, remaining = False, len(scaffolds)
+    while True:
+        current_scaffold = scaffolds[current]
         ### run scaffold evaluation
         scaffold_evaluation = ComboCheck(inp, chrom, current_scaffold)
-        
+        if remaining == 1: # only scaffold of the chromosome
+            closest_distance = ('chr_end', 1, 'start_of_closest_con')
+            grouped_scaffolds, result_list = Evaluation(scaffold_evaluation, current_scaffold, closest_distance, grouped_scaffolds, result_list)
+            if grouped_scaffolds != []: result_list.append(grouped_scaffolds)
+            break
+
         ### calculate closest scaffold (and the side of the scaffold) to the current scaffold on the reference chromosome
         # remove current scaffold permanently out list of possibilities
-        all_ref_start_ends = [i for i in all_ref_start_ends if i[0] != current_scaffold] 
+        for dx in (slot[current * 2], slot[current * 2 + 1]): next_end[dx], previous_end[dx] = dx + 1, dx - 1
+        remaining -= 1
         # end_flag checks on what side of the current_scaffold the next scaffold will be build on
-        if end_flag == True: 
-            current_pos = groups[sorted_scaffolds[sorted_scaffolds.index(current_scaffold)]][0][0] 
-        else: current_pos = groups[sorted_scaffolds[sorted_scaffolds.index(current_scaffold)]][0][1]
-        # calculate closest scaffold
-        distance_list = []
-        for con_name, ref_pos, side in all_ref_start_ends:
-            distance_list.append((con_name, abs(current_pos - ref_pos), side))
-        closest_distance = min(distance_list,key=operator.itemgetter(1))
-        
+        current_pos = groups[current_scaffold][0][0 if end_flag else 1]
+        # closest end: first unused end at or right of current_pos, or the first unused end at the position of the last one left of it
+        found = bisect.bisect_left(end_pos, current_pos)
+        right, left = EndFind(next_end, found + 1), EndFind(previous_end, found)
+        candidates = []
+        if right <= len(ends): candidates.append((end_pos[right - 1] - current_pos, end_order[right - 1]))
+        if left > 0:
+            left = EndFind(next_end, bisect.bisect_left(end_pos, end_pos[left - 1]) + 1)
+            candidates.append((current_pos - end_pos[left - 1], end_order[left - 1]))
+        distance, order = min(candidates)
+        closest_distance = (scaffolds[order // 2], distance, 'end_of_closest_con' if order % 2 else 'start_of_closest_con')
+
         ### Update end_flag
-        if closest_distance[2] == 'end_of_closest_con': end_flag = True
-        else: end_flag = False
-        
+        end_flag = closest_distance[2] == 'end_of_closest_con'
+
         ### Determine grouping of scaffolds
         grouped_scaffolds, result_list = Evaluation(scaffold_evaluation, current_scaffold, closest_distance, grouped_scaffolds, result_list)
-        current_scaffold = closest_distance[0] # update scaffold to closest next one
-        if len(all_ref_start_ends) == 2: 
-            end_of_chr_flag = True # last remaining scaffold reached (two sides on one scaffold)
-            scaffold_evaluation = ComboCheck(inp, chrom, current_scaffold)
+        current = order // 2 # update scaffold to closest next one
+        if remaining == 1: # last remaining scaffold reached (two sides on one scaffold)
+            scaffold_evaluation = ComboCheck(inp, chrom, scaffolds[current])
             closest_distance = ('chr_end', 1, 'start_of_closest_con')
-            grouped_scaffolds, result_list = Evaluation(scaffold_evaluation, current_scaffold, closest_distance, grouped_scaffolds, result_list)
-            if grouped_scaffolds != []: result_list.append(grouped_scaffolds) 
-    
+            grouped_scaffolds, result_list = Evaluation(scaffold_evaluation, scaffolds[current], closest_distance, grouped_scaffolds, result_list)
+            if grouped_scaffolds != []: result_list.append(grouped_scaffolds)
+            break
+
     print('grouping: {}'.format(result_list))
     return result_list
 
@@ -357,210 +494,481 @@ def Evaluation(scaffold_evaluation, current_scaffold, closest_distance, grouped_
 
 def ComboCheck(inp, current_chr, scaffold_to_check):
     # input {scaffold:{chrX:[[Ref_start,Ref_end,Que_start,Que_end,count=xxx],...],chrX: [...]}}, with list sorted on Ref
-    for scaffold in inp.keys():
-        if scaffold == scaffold_to_check:
-            # Check if scaffold is composed out of more than one ref chromosome section
-            chr_count = len(inp[scaffold].keys())
-            if chr_count == 1: evaluation = 'continue'
-            else:
-                ref_min, ref_max, ref_min_cur, ref_max_cur = 0, 0, 0, 0
-                for chrom in inp[scaffold].keys():
-                    block = inp[scaffold][chrom] # list of values belonging to certain chrom
-                    for section in block: # for each sublist in list
-                        if chrom == current_chr: # check chromosome 
-                            # avoid possible issues
-                            if ref_min == 0 or ref_max == 0:
-                                ref_min_cur, ref_min = section[2], section[2]
-                                ref_max_cur, ref_max = section[3], section[3]
-                            if ref_min_cur == 0 or ref_max_cur == 0: ref_min_cur, ref_max_cur = section[2],section[3]
-                            
-                            if section[2] < ref_min_cur:
-                                ref_min_cur = section[2]
-                                if ref_min > ref_min_cur: ref_min = ref_min_cur
-                            if section[3] > ref_max_cur:
-                                ref_max_cur = section[3]
-                                if ref_max < ref_max_cur: ref_max = ref_max_cur
-                        
-                        else:
-                            if ref_min == 0 or ref_max == 0: ref_min, ref_max = section[2], section[3]
-                            if ref_min > section[2]: ref_min = section[2]
-                            if ref_max < section[3]: ref_max = section[3]
-                # run check
-                flagL, flagR, count = True, True, 0
-                if ref_min != ref_min_cur:
-                    count += 1
-                    flagL = False
-                if ref_max != ref_max_cur:
-                    count += 1
-                    flagR = False
-
-                if count == 2:
-                    evaluation = 'stop' # current_chr is isolated
-                elif count == 1: 
-                    if flagL == False: evaluation = 'right' # scaffold can be attached to other scaffolds on the right
-                    if flagR == False: evaluation = 'left' # scaffold can be attached to other scaffolds on the left
+    scaffold = scaffold_to_check # direct lookup, every scaffold of the alignment is a key of inp
+    # Check if scaffold is composed out of more than one ref chromosome section
+    chr_count = len(inp[scaffold].keys())
+    if chr_count == 1: evaluation = 'continue'
+    else:
+        ref_min, ref_max, ref_min_cur, ref_max_cur = 0, 0, 0, 0
+        for chrom in inp[scaffold].keys():
+            block = inp[scaffold][chrom] # list of values belonging to certain chrom
+            for section in block: # for each sublist in list
+                if chrom == current_chr: # check chromosome 
+                    # avoid possible issues
+                    if ref_min == 0 or ref_max == 0:
+                        ref_min_cur, ref_min = section[2], section[2]
+                        ref_max_cur, ref_max = section[3], section[3]
+                    if ref_min_cur == 0 or ref_max_cur == 0: ref_min_cur, ref_max_cur = section[2],section[3]
+                    
+                    if section[2] < ref_min_cur:
+                        ref_min_cur = section[2]
+                        if ref_min > ref_min_cur: ref_min = ref_min_cur
+                    if section[3] > ref_max_cur:
+                        ref_max_cur = section[3]
+                        if ref_max < ref_max_cur: ref_max = ref_max_cur
+                
                 else:
-                    evaluation = 'continue' # both sides of the combination consist out of the current_chr
+                    if ref_min == 0 or ref_max == 0: ref_min, ref_max = section[2], section[3]
+                    if ref_min > section[2]: ref_min = section[2]
+                    if ref_max < section[3]: ref_max = section[3]
+        # run check
+        flagL, flagR, count = True, True, 0
+        if ref_min != ref_min_cur:
+            count += 1
+            flagL = False
+        if ref_max != ref_max_cur:
+            count += 1
+            flagR = False
+
+        if count == 2:
+            evaluation = 'stop' # current_chr is isolated
+        elif count == 1: 
+            if flagL == False: evaluation = 'right' # scaffold can be attached to other scaffolds on the right
+            if flagR == False: evaluation = 'left' # scaffold can be attached to other scaffolds on the left
+        else:
+            evaluation = 'continue' # both sides of the combination consist out of the current_chr
     return evaluation
 
-def ContigGrouping(hit_dict,scaffold_name):
+def ContigGrouping(hit_dict,scaffold_name, sensitivity = None):
     group_list = {}
-    for dx in hit_dict[scaffold_name].keys(): group_list[dx] = HitGrouping(hit_dict[scaffold_name][dx], noise_suppress = True)
+    for dx in hit_dict[scaffold_name].keys(): group_list[dx] = HitGrouping(hit_dict[scaffold_name][dx], noise_suppress = True, sensitivity = sensitivity)
     return group_list
 
-def QueryFaiOpen(Call_from):
-    if not args.faindex: 
-        print('Fasta index file is needed for '+Call_from+' function.')
-        exit(1)
-    with open(args.faindex,'r') as FAI: 
+def QueryFaiOpen(faindex, Call_from): # out: {scaffold:length}. faindex may be the .fai or the fasta itself, a missing or outdated index is built next to the fasta
+    # ValueError with the message for the user when there is no usable index
+    if not faindex: raise ValueError('Fasta index file is needed for '+Call_from+' function.')
+    fasta = faindex[:-4] if faindex[-4:] == '.fai' else faindex
+    if fasta == faindex or os.path.exists(fasta):
+        try: return {dx:ex[0] for dx, ex in FaiOpen(fasta).items()}
+        except (OSError, ValueError) as err: raise ValueError('Fasta index of {} can not be built: {}'.format(fasta, err))
+    with open(faindex,'r') as FAI: 
         return {dx.split('\t')[0]:int(dx.split('\t')[1]) for dx in FAI.readlines()}
 
-def output_files(filename, height, box_list, line_list, text_list, pdf):
+class HitTable: # columnar store of E-value filtered BLAST hits, one row per hit, kept in BLAST file order
+    magic = b'SYNHIT2\n'
+    columns = [('scaffold','i'),('chr','i'),('que','q'),('ref','q'),('evalue','d'),('identity','f')] # scaffold/chr are ids into self.scaffolds/self.chrs
+    def __init__(self):
+        self.scaffolds, self.chrs, self.scaffold_id, self.chr_id = [], [], {}, {}
+        self.summary = {} # -b aggregates of all rows (any E value): {(scaffold, chr):[rows, identity sum, hit length sum, gap sum]}
+        for name, typecode in self.columns: setattr(self, name, array(typecode))
+
+    def __len__(self): return len(self.que)
+
+    def Extend(self, lines, threshold): # lines: outfmt 6 rows as bytes, rows with E value > threshold are skipped
+        scaffold_id, chr_id, scaffold_key, chr_key = self.scaffold_id, self.chr_id, None, None
+        scaffold, chr_, que, ref, evalue, identity = [], [], [], [], [], []
+        run_key, run_chr, run = None, None, [] # rows of the current scaffold/chr pair, hits of one pair are consecutive in BLAST output
+        for line in lines:
+            data = line.split(b'\t')
+            if len(data) < 11 or data[0][:1] == b'#': continue # blank lines and outfmt 7 comments
+            if data[0] != run_key or data[1] != run_chr:
+                self.SummaryAdd(run_key, run_chr, run)
+                run_key, run_chr, run = data[0], data[1], []
+            run.append(data)
+            E_value = data[10]
+            E_value = float(b'1' + E_value if E_value[:1] in b'eE' else E_value) # legacy BLAST writes 1e-100 as e-100
+            if E_value > threshold: continue
+            if data[0] != scaffold_key: # BLAST output is grouped on query, only look up the name when it changes
+                scaffold_key, name = data[0], data[0].decode()
+                if name not in scaffold_id:
+                    scaffold_id[name] = len(self.scaffolds)
+                    self.scaffolds.append(name)
+                scaffold_index = scaffold_id[name]
+            if data[1] != chr_key:
+                chr_key, name = data[1], data[1].decode().lower()
+                if name not in chr_id:
+                    chr_id[name] = len(self.chrs)
+                    self.chrs.append(name)
+                chr_index = chr_id[name]
+            scaffold.append(scaffold_index)
+            chr_.append(chr_index)
+            que.append((int(data[6]) + int(data[7]))//2)
+            ref.append((int(data[8]) + int(data[9]))//2)
+            evalue.append(E_value)
+            identity.append(float(data[2]))
+        self.SummaryAdd(run_key, run_chr, run)
+        self.scaffold.extend(scaffold)
+        self.chr.extend(chr_)
+        self.que.extend(que)
+        self.ref.extend(ref)
+        self.evalue.extend(evalue)
+        self.identity.extend(identity)
+
+    def Append(self, other): # rows of another table (the next part of the same BLAST file) added at the end, names mapped onto the ids of this table
+        for names, ids, column, other_names, other_column in [[self.scaffolds, self.scaffold_id, self.scaffold, other.scaffolds, other.scaffold], [self.chrs, self.chr_id, self.chr, other.chrs, other.chr]]:
+            for name in other_names:
+                if name not in ids:
+                    ids[name] = len(names)
+                    names.append(name)
+            column.extend(array(column.typecode, map([ids[dx] for dx in other_names].__getitem__, other_column)))
+        for name, typecode in self.columns[2:]: getattr(self, name).extend(getattr(other, name))
+        for dx, ex in other.summary.items(): # a scaffold/chr pair can be cut by the range border
+            total = self.summary.setdefault(dx, [0, 0.0, 0, 0])
+            for cx in range(4): total[cx] += ex[cx]
+
+    def SummaryAdd(self, scaffold, chr_, rows): # rows: split BLAST lines of one scaffold/chr pair, added to the -b aggregates
+        if not rows: return
+        total = self.summary.setdefault((scaffold.decode(), chr_.decode().lower()), [0, 0.0, 0, 0])
+        total[0] += len(rows)
+        total[1] += sum(map(float, [dx[2] for dx in rows]))
+        total[2] += sum(map(int, [dx[3] for dx in rows]))
+        total[3] += sum(map(int, [dx[4] for dx in rows]))
+
+    def HitList(self): # out: {scaffold:{chr:[(Pos_Que, Pos_Ref)(...)(...)]}}, same insertion order as the BLAST file
+        hit_list = {}
+        for scaffold, chr_, que, ref in zip(self.scaffold, self.chr, self.que, self.ref):
+            hit_list.setdefault(self.scaffolds[scaffold], {}).setdefault(self.chrs[chr_], []).append((que, ref))
+        return hit_list
+
+    def Save(self, path, key):
+        # layout: magic, 8 byte header length, json header, then one 8 byte aligned block per column
+        offset, columns = 0, []
+        for name, typecode in self.columns:
+            columns.append([name, typecode, offset])
+            offset += -(-len(self) * getattr(self, name).itemsize // 8) * 8
+        header = json.dumps({'key':key, 'count':len(self), 'scaffolds':self.scaffolds, 'chrs':self.chrs, 'columns':columns, 'summary':[list(dx) + ex for dx, ex in self.summary.items()]}).encode()
+        header += b' ' * (-(len(self.magic) + 8 + len(header)) % 8)
+        start = len(self.magic) + 8 + len(header)
+        with ReplaceFile(path,'wb') as CACHE:
+            CACHE.write(self.magic + len(header).to_bytes(8,'little') + header)
+            for name, typecode, column_offset in columns:
+                CACHE.seek(start + column_offset)
+                getattr(self, name).tofile(CACHE)
+            CACHE.truncate(start + offset)
+
+    @classmethod
+    def Load(cls, path, key): # returns None when the cache is missing, broken, truncated or was written for another BLAST file/E-value
+        table = cls()
+        try:
+            with open(path,'rb') as CACHE:
+                if CACHE.read(len(cls.magic)) != cls.magic: return None
+                header = json.loads(CACHE.read(int.from_bytes(CACHE.read(8),'little')).decode())
+                if header['key'] != key: return None
+                start, count, columns = CACHE.tell(), header['count'], header['columns']
+                if sorted(dx[:2] for dx in columns) != sorted(list(dx) for dx in cls.columns): return None
+                if os.fstat(CACHE.fileno()).st_size < start + max(offset + count * getattr(table, name).itemsize for name, typecode, offset in columns): return None
+                data = mmap.mmap(CACHE.fileno(), 0, access = mmap.ACCESS_READ) if count else b''
+            try:
+                for name, typecode, offset in columns:
+                    column = getattr(table, name)
+                    column.frombytes(data[start + offset:start + offset + count * column.itemsize])
+                    if len(column) != count: return None
+            finally:
+                if count: data.close()
+            table.scaffolds, table.chrs = header['scaffolds'], header['chrs']
+            table.summary = {(dx[0], dx[1]):dx[2:] for dx in header['summary']}
+        except (OSError, ValueError, KeyError, TypeError, IndexError): return None
+        table.scaffold_id = {dx:cx for cx, dx in enumerate(table.scaffolds)}
+        table.chr_id = {dx:cx for cx, dx in enumerate(table.chrs)}
+        return table
+
+def BlastParse(blast_file, expection, chunk_size = 1 << 26, jobs = 1): # outfmt 6 table -> HitTable, hits with E value above 1e-<expection> are dropped
+    # With jobs > 1 the file is cut into line aligned byte ranges, parsed by worker processes and merged in file order (same table as one process).
+    threshold, size = float('1e-' + str(expection)), os.path.getsize(blast_file)
+    shards = BlastShards(blast_file, min(jobs * 4, size // min(chunk_size, 1 << 24) + 1)) if jobs > 1 else [[0, size]] # ranges of at least 16 MB
+    if len(shards) < 2: return BlastRange([blast_file, 0, size, threshold, chunk_size])
+    table = HitTable()
+    with multiprocessing.get_context('fork').Pool(min(jobs, len(shards))) as pool:
+        for part in pool.imap(BlastRange, [[blast_file, dx, ex, threshold, chunk_size] for dx, ex in shards]): table.Append(part)
+    return table
+
+def BlastShards(blast_file, parts): # out: [[start, end], ...] byte ranges of the file, each starting at the beginning of a line
+    size, bounds = os.path.getsize(blast_file), {0}
+    with open(blast_file,'rb') as BLAST:
+        for cx in range(1, parts):
+            BLAST.seek(size * cx // parts - 1)
+            BLAST.readline() # a range starts after the end of the line that crosses its nominal start
+            bounds.add(BLAST.tell())
+    bounds = sorted(bounds | {size})
+    return [[dx, ex] for dx, ex in zip(bounds, bounds[1:]) if dx < ex]
+
+def BlastRange(shard): # [blast_file, start, end, threshold, chunk_size] -> HitTable of the lines in start:end, also the worker of BlastParse
+    # The range is read in binary blocks of chunk_size bytes, the unfinished last line of a block is carried to the next one.
+    blast_file, start, end, threshold, chunk_size = shard
+    table, rest = HitTable(), b''
+    with open(blast_file,'rb') as BLAST:
+        BLAST.seek(start)
+        while start < end:
+            chunk = BLAST.read(min(chunk_size, end - start))
+            if not chunk: break
+            start += len(chunk)
+            lines = (rest + chunk).split(b'\n')
+            rest = lines.pop()
+            table.Extend(lines, threshold)
+    table.Extend([rest], threshold)
+    return table
+
+def BlastKey(blast_file, expection): # identifies one parse of a BLAST table, stored in the cache headers
+    stat = os.stat(blast_file)
+    return {'size':stat.st_size, 'mtime':stat.st_mtime_ns, 'exp':expection}
+
+def HitTableOpen(blast_file, expection, cache = True, jobs = 1):
+    # The parsed table is cached as <blast_file>.hitcache, keyed on size/mtime of the BLAST file and the -e threshold.
+    if not cache: return BlastParse(blast_file, expection, jobs = jobs)
+    key = BlastKey(blast_file, expection)
+    table = HitTable.Load(blast_file + '.hitcache', key)
+    if table is None:
+        table = BlastParse(blast_file, expection, jobs = jobs)
+        try: table.Save(blast_file + '.hitcache', key)
+        except OSError as err: sys.stderr.write('WARNING: BLAST hit cache can not be written ({}), continue without cache.\n'.format(err))
+    return table
+
+class GroupCache: # HitGrouping result per (scaffold, chr, noise_suppress), each block is computed at most once per run
+    # With a path the table is kept as json in <blastn>.groupcache, keyed on the BLAST key and the -d diversity of the filter.
+    def __init__(self, hit_list, path = '', key = None, sensitivity = None):
+        self.hit_list, self.path, self.key, self.groups, self.added = hit_list, path, key, {}, {}
+        self.sensitivity = sensitivity or FilterSensitivity()
+        if path:
+            try:
+                with open(path,'r') as CACHE: data = json.load(CACHE)
+                if data['key'] == key: self.groups = {(dx[0], dx[1], dx[2]):dx[3] for dx in data['groups']}
+            except (OSError, ValueError, KeyError): pass
+
+    def Get(self, scaffold_name, chr_name, noise_suppress = True):
+        key = (scaffold_name, chr_name, noise_suppress)
+        if key not in self.groups:
+            with PROFILE.Stage('hit_grouping', system = False): self.groups[key] = self.added[key] = HitGrouping(self.hit_list[scaffold_name][chr_name], noise_suppress, self.sensitivity)
+        return self.groups[key]
+
+    def Update(self, added): # merge blocks computed in a worker process
+        self.added.update(added)
+        self.groups.update(added)
+
+    def Save(self):
+        if not self.path or not self.added: return
+        try:
+            with ReplaceFile(self.path) as CACHE: json.dump({'key':self.key, 'groups':[list(dx) + [ex] for dx, ex in self.groups.items()]}, CACHE)
+        except OSError as err: sys.stderr.write('WARNING: hit group cache can not be written ({}).\n'.format(err))
+
+def output_files(filename, height, box_list, line_list, text_list, pdf, dpi = None):
     if filename[-4:] == ".svg" or filename[-4:] == ".pdf": filename = filename[:-4]
+    svg = SvgObj().head(2000, height) + '\n  '.join(box_list)+ '\n  '.join(line_list) + '\n  '.join(text_list) + '</svg>\n'
+    if pdf == True: PdfConvert(filename, dpi, svg) # the svg is rasterized from memory, no .svg file is written
+    else:
+        ## create svg file
+        with PROFILE.Stage('svg_write'), open(filename + '.svg','w') as SVG_out: SVG_out.write(svg)
 
-    ## create svg file
-    with open(filename + '.svg','w') as SVG_out: SVG_out.write(SVG.head(2000, height) + '\n  '.join(box_list)+ '\n  '.join(line_list) + '\n  '.join(text_list) + '</svg>\n')
-    if pdf == True:
-        ## Wand module converts svg to png, than img2pdf is used to convert png to pdf
-        with Image(filename=filename + '.svg') as img:
-            img.alpha_channel = False
-            img.format = 'png'
-            img.save(filename='temp.png')
-        os.remove(filename + '.svg')
-        with open(filename + '.pdf',"wb") as pdf: pdf.write(img2pdf.convert('temp.png'))
-        os.remove('temp.png')
+def PdfPage(svg, dpi = None): # svg text -> png bytes, everything stays in memory, so parallel runs in one directory do not share files
+    ## Wand module converts svg to png, than img2pdf is used to convert png to pdf. ImageMagick is only loaded when pdf is requested.
+    from wand.image import Image
+    with Image(blob = svg.encode(), format = 'svg', **({'resolution':dpi} if dpi else {})) as img:
+        img.alpha_channel = False
+        return img.make_blob('png')
 
-############################################## argparse module ################################################
+def PdfPageFile(page): # worker of PdfBook: [svg_file, dpi] -> png bytes
+    with open(page[0],'r') as SVG: return PdfPage(SVG.read(), page[1])
 
-cwd = os.getcwd()
-dir_name = cwd.split('/')
-dir_name = dir_name[-1]
-
-parser = argparse.ArgumentParser(prog='SynChroBuild', description='Build synteny maps from BLAST results (Synteny Builder) and output the synteny data into AGP, fasta or summary files. Uses python 3.4+')
-parser.add_argument('blastn', help = 'Input file name of BLASTN result (for synteny map) or fasta file (for AGP, fasta and summary files)')
-parser.add_argument('faindex', help = 'Input fasta index file (for synteny map) or synteny file (for AGP, fasta and summary files)')
-
-# Blast file input
-parser_syn2 = parser.add_argument_group('Synteny builder - main functions:')
-parser_syn2.add_argument('-s','--scaf', dest='scaffold_name', action ='store', default = '', metavar = 'SCAF', help = 'Generate SVG file with detailed blastn hits of a specified scaffold')
-parser_syn2.add_argument('-c','--chr', dest='ref_chr', action ='store', nargs = '?', const = 'All', default = False, metavar='CHROM', help = 'Build synteny on chosen chromosome (default = all chromosomes).')
-parser_syn2.add_argument('-a','--align', dest='scaf_aligner', action ='store_true', default = False, help = 'Align contigious scaffolds into groups in the SVG output file.')
-
-parser_syn3 = parser.add_argument_group('Synteny builder - secundary functions:')
-parser_syn3.add_argument('-x','--xmap', dest='Xmap_function', action ='store_true', help = 'Output list as Irysview .cmap and .xmap format.')
-parser_syn3.add_argument('-g','--g_band', dest='G_scaffold', action ='store', default = '', metavar = 'SCAF', help='Generating G-banding simulation of scaffold based on synteny. Output .SVG format.') 
-parser_syn3.add_argument('-b','--blast_sum', dest='blastn_summary', action='store_true', help='Give statistics about the BLASTN result and list all significant scaffolds')
-# create text file = density of blast (hit ratio), simularity between both species, average
-
-parser_syn1 = parser.add_argument_group('Synteny builder - settings:')
-parser_syn1.add_argument('-r','--ref',dest='Ref_genome',action = 'store',default = 'MM10', metavar='FAIDEX', help='Information of Reference genome loaded from a fasta index file, default = GRCm38/MM10.')
-parser_syn1.add_argument('-d','--div',dest='diversity',action ='store',default = 'order', metavar='VALUE', help='Set diversity value between Query and Reference(order/family/genus/species)')
-parser_syn1.add_argument('-m','--offset', dest='offset', action ='store', default = '0', metavar='BP', help = 'Shift the scaffold to right (+) or left (-) compared to the reference chromosome. Units in basepair, K,M,G also accepted. Example: -m"-1000" = -m"-1K"')
-parser_syn1.add_argument('-e','--exp', dest='exp_value', action ='store', default = '200', metavar='VALUE', help = 'Set threshold for expectation (E) value of BLAST results, e.g. -e 80 indicate E value < 1e-80.')
-parser_syn1.add_argument('-o', dest='output', action = 'store', metavar='NAME', nargs='?', const = dir_name, default = dir_name, help = 'Assign a custom name to the output file(s).')
-parser_syn1.add_argument('-pdf', dest='pdf_flag', action ='store_true', default = False, help='Output file in pdf format instead of svg format.')
-args = parser.parse_args()
-
-############################################## script ################################################
-
-### Check input parameters
-## Check for excessive arguments
-if sum([args.blastn_summary, args.ref_chr!= False, args.scaffold_name != '', args.Xmap_function], args.G_scaffold != '') != 1:
-    parser.print_help()
-    exit(1)
-
-if args.blastn[-4:] == '.fai': # input has been switched by accident
-    faindex = args.blastn
-    args.blastn = args.faindex
-    args.faindex = faindex
-
-if args.Ref_genome != 'MM10':
-    genome = args.Ref_genome
-else: genome = 'MM10'
-
-## Check offset section (-m): Moves scaffold (requires -f option)
-input_offset = args.offset
-# if input is a positive number
-if input_offset.isdigit(): offset = int(input_offset)/1e5
-# if input is a negative number 
-elif input_offset[0] == '-' and input_offset[1:].isdigit(): offset = int(input_offset)/1e5
-# if input uses K, M or G and is positive
-elif input_offset[-1] in ['K','M','G'] and input_offset[:-1].isdigit(): offset = int(input_offset[:-1])*{'K':1e-2,'M':10,'G':1e4, 'k':1e-2,'m':10,'g':1e4}[input_offset[-1]]
-# if input uses K, M or G and is negative 
-elif input_offset[-1] in ['K','M','G'] and input_offset[0] == '-' and input_offset[1:-1].isdigit(): offset = int(input_offset[1:-1])*{'K':1e-2,'M':10,'G':1e4, 'k':1e-2,'m':10,'g':1e4}[input_offset[-1]]
-else:
-    print('--offset argument: must be a number, or end with K,M,G.')
-    exit(1)
-
-### Create hit_list dictionary fron blast input
-# structure of hit_list: hit_list = {scaffold:{chr:[(scaffold_position, chr_position)(...)(...)]} } => chr_pos is centre of blast hit location on both ref and scaffold
-hit_list = {} 
-
-# set repeats filter sensitivity + set threshold E-value for BLAST results
-sensitivity = FilterSensitivity(parser.parse_args().diversity) 
-expection = int(parser.parse_args().exp_value)
-
-hit_sort, data = [], []
-with open(args.blastn,'r') as BLAST: 
-    while True:
-        data = BLAST.readline().split('\t')
-        if data == [''] : break
-        scaffold_name, chr_name = data[0], data[1]
-        scaffold_start, match_start, match_end, scaffold_end, E_value = int(data[6]), int(data[7]), int(data[8]), int(data[9]), data[10]
-        if E_value == '0.0' or (E_value.split('-')[0] == '1e' and int(E_value.split('-')[1]) == expection) or int(E_value.split('-')[1]) > expection:
-            # if scaffold already exists in hit_list
-            if scaffold_name in hit_list.keys(): 
-                if chr_name.lower() in hit_list[scaffold_name].keys(): 
-                    hit_list[scaffold_name][chr_name.lower()] += [tuple([(scaffold_start + match_start)//2,(match_end + scaffold_end)//2])] 
-                else: hit_list[scaffold_name][chr_name.lower()] = [tuple([(scaffold_start + match_start)//2,(match_end + scaffold_end)//2])]
-            # if scaffold is not yet present in hit_list
-            else:
-                hit_list[scaffold_name] = {chr_name.lower():[tuple([(scaffold_start + match_start)//2,(match_end + scaffold_end)//2])]}
-        # update list of chromosomes if not yet added for all chromosomes
-
-### Filter blast result: Remove repeats
-for scaffold_name in hit_list.keys(): hit_list[scaffold_name] = RepeatFilter(hit_list[scaffold_name])
-
-### Create summary of BLASTN result
-if args.blastn_summary:
-    # BLASTN hit count for each scaffold/chr
-    simularity_sum, hit_length_sum, gap_length_sum, average_count = 0, 0, 0, 0
-    chr_hit_count, scaffold_count = 0, 0
-    prev_scaffold_name, prev_chr_name = '', ''
-    chr_hit_dict, scaffold_dict = {}, {}
-    BLAST = open(args.blastn, 'r')
-    for line in BLAST.readlines():
-        line = line.split('\t')
-        scaffold_name, chr_name, simularity, hit_length, gap_length = line[0], line[1], line[2], line[3], line[4]
-        if scaffold_name in hit_list.keys(): # Filter scaffolds
-            # statistics
-            simularity_sum += float(simularity)
-            hit_length_sum += int(hit_length)
-            gap_length_sum += int(gap_length)
-            average_count += 1
-            # scaffold data
-            if prev_scaffold_name == '': prev_scaffold_name = scaffold_name
-            if scaffold_name != prev_scaffold_name:
-                chr_hit_dict[prev_chr_name.lower()] = chr_hit_count
-                scaffold_dict[prev_scaffold_name] = chr_hit_dict
-                chr_hit_dict = {}
-                scaffold_count += 1
-                chr_hit_count = 0
-            if chr_name != prev_chr_name:
-                chr_hit_dict[prev_chr_name.lower()] = chr_hit_count
-                chr_hit_count = 0
-            chr_hit_count += 1
-            prev_scaffold_name, prev_chr_name = scaffold_name, chr_name
+def PdfConvert(filename, dpi = None, svg = None): # svg text (or filename.svg, removed afterwards) -> filename.pdf
+    with PROFILE.Stage('pdf'):
+        import img2pdf
+        svg_file = None
+        if svg is None:
+            svg_file = filename + '.svg'
+            with open(svg_file,'r') as SVG: svg = SVG.read()
+        with open(filename + '.pdf','wb') as PDF: PDF.write(img2pdf.convert(PdfPage(svg, dpi)))
+        if svg_file: os.remove(svg_file)
+
+def PdfBook(pdf_file, svg_files, dpi = None, jobs = 1): # one page per svg file (in the given order), rasterized by jobs worker processes. svg files are removed
+    with PROFILE.Stage('pdf'):
+        import img2pdf
+        pages = [[dx, dpi] for dx in svg_files]
+        if jobs > 1 and len(pages) > 1:
+            with multiprocessing.get_context('fork').Pool(min(jobs, len(pages))) as pool: pages = pool.map(PdfPageFile, pages, chunksize = 1)
+        else: pages = [PdfPageFile(dx) for dx in pages]
+        with open(pdf_file,'wb') as PDF: PDF.write(img2pdf.convert(pages))
+        for dx in svg_files: os.remove(dx)
+
+class SvgStream: # SVG file written element by element, nothing of the figure is kept in memory. filename '' writes to stdout
+    def __init__(self, filename, width, height, pdf = False, dpi = None):
+        if filename[-4:] == ".svg" or filename[-4:] == ".pdf": filename = filename[:-4]
+        self.filename, self.pdf, self.dpi = filename, pdf, dpi
+        self.handle = open(filename + '.svg','w', buffering = 1 << 20) if filename else sys.stdout
+        self.handle.write(SvgObj().head(width, height) + '\n')
+
+    def Write(self, element):
+        self.handle.write('  ' + element.rstrip('\n') + '\n')
+
+    def Close(self):
+        with PROFILE.Stage('svg_write'):
+            self.handle.write('</svg>\n')
+            if self.handle is sys.stdout: return
+            self.handle.close()
+        if self.pdf == True: PdfConvert(self.filename, self.dpi)
+
+class SynConfig: # settings of the render stages, filled from the command line by main() or set directly when SynBuild is imported
+    def __init__(self, genome = 'MM10', diversity = 'order', output = '', pdf_flag = False, scaf_aligner = False, offset = 0, regions = '', full_detail = False, pdf_dpi = None, cytoband = '', band_resolution = 1000000):
+        self.genome, self.diversity, self.output, self.pdf_flag, self.full_detail = genome, diversity, output, pdf_flag, full_detail # full_detail: -s draws every hit
+        self.pdf_dpi = pdf_dpi # resolution of the -pdf rasterization, None keeps the ImageMagick default
+        self.reference = ReferenceProfile(genome, regions) # OSError/ValueError if the -r index or --regions file can not be read
+        self.scaf_aligner, self.offset = scaf_aligner, offset # offset in units of 100 kb (-m). Run settings only, the chromosome of a figure is an argument of ChrSynteny
+        self.sensitivity = FilterSensitivity(diversity)
+        self.bands, self.band_resolution = ChrBand(cytoband), band_resolution # -g: band levels (MM10 or --cytoband), bin size in bp (--band-res)
+
+def ChrSynteny(chr_name, hit_list, group_cache, scaffold_length, config): # synteny figure of one reference chromosome
+    optionP = False # optionP is a flag used to indicate the usage of the scaffold align option, also used as counter if True.
+    SVG = SvgObj()
+    # Determines ref chromosome and name
+    box_print, text_print = SVG.ChrBox(0, 300, chr_name, config.reference, False, optionP)
+    box_list, text_list = [box_print], [text_print]
+    line_list, boundary_list, groups = [], [], {} 
+    
+    for scaffold_name in hit_list.keys():
+        if chr_name in hit_list[scaffold_name].keys():
+            groups[scaffold_name] = group_cache.Get(scaffold_name, chr_name)
+            for dx in hit_list[scaffold_name].keys():
+                if len(hit_list[scaffold_name][dx]) > config.sensitivity.O and dx != chr_name and scaffold_name not in boundary_list:
+                    boundary_list.append(scaffold_name)
+    groups = dict((dx, ex) for dx, ex in groups.items() if ex != [])
     
+    ## Section specific for obtaining pseudochromosome data
+    if config.scaf_aligner != False:
+        input_dictionary = {}
+        for dx in groups:
+            chr_specific_scaffolds = {}
+            for chr_ in hit_list[dx].keys():
+                block_list = []
+                chr_block = group_cache.Get(dx, chr_)
+                if chr_block != []:
+                    for block in chr_block:
+                        block_list.append(block)
+                    #dict1 = {chr_:block_list}
+                    chr_specific_scaffolds.update({chr_:block_list})
+            input_dictionary.update({dx:chr_specific_scaffolds})
+        with PROFILE.Stage('scaffold_alignment'): result_list = ScaffoldAlignment(groups, input_dictionary, chr_name)
+        
+        # create index_list that gives scaffolds in the same group the same id
+        indexnumber, indexed_list = 1, []
+        while indexnumber <= len(result_list):
+            for scaffold in result_list[indexnumber - 1]:
+                indexed_list.append([indexnumber, scaffold])
+            indexnumber += 1
+        index = indexed_list
+
+    else: index = enumerate(groups)
+
+    ## Set position parameters of each object in svg file and create svg object
+    # Set position parameters:
+    previous_cx = 0
+    added_length = 0
+    counter = 1
+    for cx, dx in index: # create index of remaining scaffolds
+        baseline, bottomline = 400, 0
+        if config.scaf_aligner != False: 
+            optionP = counter
+            if cx != previous_cx: 
+                # added_length = 0
+                chr_hit_list = []
+                for hit in hit_list[dx][chr_name.lower()]:
+                    chr_hit_list.append(hit[1])
+                chr_median = statistics.median(chr_hit_list) / 1e5
+                if chr_median > 160000000: chr_median = 160000000
+                added_length = chr_median - 100
+            xco = round(added_length)
+            if cx % 3 == 0: yco = 600
+            elif cx % 4 == 0: yco, baseline, bottomline = 10, 300, 100
+            elif cx % 2 == 0: yco, baseline, bottomline = 120, 300, 100
+            else: yco = 800
+            
+            # update loop values
+            previous_cx = cx
+            added_length += scaffold_length[dx]/1e5 + 5
+            counter += 1
+            
+        else:
+            xco = int((groups[dx][0][0]-min(groups[dx][0][2:4]))/1e5)
+            yco = 500 + cx*100
+
+        # Create svg object
+        # determines scaffold box and name
+        box_print, text_print = SVG.ChrBox(xco, yco, str(dx), config.reference, False, optionP, chr_detail = [scaffold_length[dx],[]])
+        box_list.append(box_print)
+        text_list.append(text_print)
+
+        previous_chr = ''
+        if dx in boundary_list:
+            for chr_ in hit_list[dx].keys():
+                chr_block = group_cache.Get(dx, chr_)
+                if chr_block != []:
+                    for _,_,start,end,_ in chr_block:
+                        if previous_chr != chr_:
+                            # Create chr blocks for each scaffold
+                            box_print, text_print = SVG.ChrBox(xco + (min(start,end)/1e5),yco, chr_, config.reference, False, optionP, chr_detail=[abs(end-start),[]])
+                            box_list.append(box_print) 
+                            text_list.append(text_print)
+                        else:
+                            box_print,_ = SVG.ChrBox(xco + (min(start,end)/1e5),yco, chr_, config.reference, False, optionP, chr_detail=[abs(end-start),[]])
+                            box_list.append(box_print)
+
+                        # update loop values
+                        previous_chr = chr_
+
+        # creates the connecting figure between the ref chrom and the scaffold 
+        for ex in range(len(groups[dx])):
+            corner1 = '"M'+str(int(groups[dx][ex][0]/1e5)) + ' ' + str(baseline)
+            corner2 = ' L'+str(int(groups[dx][ex][1]/1e5)) + ' ' + str(baseline)
+            corner3 = ' L'+str(xco + (int(groups[dx][ex][3])/1e5)) + ' ' + str(yco + bottomline)
+            corner4 = ' L'+str(xco + (int(groups[dx][ex][2])/1e5)) + ' ' + str(yco + bottomline) + ' Z"'
+            line_list.append('<path d='+corner1+corner2+corner3+corner4+' fill="black" stroke="none" fill-opacity="0.4" />')
+    ## output (only when at least one scaffold hits the chromosome)
+    if groups:
+        if config.output != '':
+            filename = config.output
+            if filename[-4:] == ".svg" or filename[-4:] == ".pdf":
+                filename = filename[:-4]
+            filename = filename + '_' + chr_name
+            output_files(filename, len(groups)*100+700, box_list, line_list, text_list, config.pdf_flag, config.pdf_dpi)
+        else: print(SVG.head(2000, len(groups)*100+700) + '\n  ' + '\n  '.join(list(box_list)) + '\n  '.join(line_list) + '\n  '.join(text_list) + '</svg>\n')
+    return group_cache.added # blocks grouped here, merged into the parent cache when running in a worker
+
+Forked = None # [hit_list, group_cache, scaffold_length, config] of ChrSyntenyAll or [table, sensitivity] of RepeatFilterBatch, handed to the workers by fork instead of pickling
+
+def ChrSyntenyWorker(chr_name):
+    return ChrSynteny(chr_name, *Forked)
+
+def ChrSyntenyAll(chr_list, hit_list, group_cache, scaffold_length, config, jobs = 1):
+    global Forked
+    if jobs > 1 and len(chr_list) > 1:
+        # chromosomes are independent, render them in a process pool. Largest chromosome first, so the slowest one starts early.
+        # 'fork' is required, workers use hit_list/scaffold_length of this process without pickling them.
+        chr_list = sorted(chr_list, key = lambda chr_name: -sum(len(hit_list[dx].get(chr_name, [])) for dx in hit_list))
+        Forked = [hit_list, group_cache, scaffold_length, config]
+        try:
+            with multiprocessing.get_context('fork').Pool(min(jobs, len(chr_list))) as pool:
+                for added in pool.map(ChrSyntenyWorker, chr_list, chunksize = 1): group_cache.Update(added)
+        finally: Forked = None
+    else:
+        for chr_name in chr_list: ChrSynteny(chr_name, hit_list, group_cache, scaffold_length, config)
+
+def BlastSummary(hit_table, hit_list, group_cache, scaffold_length, summary_file): # -b: BLASTN statistics and the filtered scaffolds, written to summary_file
+    # Statistics cover all BLAST rows of the scaffolds left after filtering, from the aggregates collected by BlastParse (or the hit cache).
+    simularity_sum, hit_length_sum, gap_length_sum, average_count = 0, 0, 0, 0
+    scaffold_dict = {} # BLASTN hit count for each scaffold/chr: {scaffold:{chr:hits}}, all rows of the pair wherever they are in the table
+    for (scaffold_name, chr_name), dx in hit_table.summary.items():
+        if scaffold_name in hit_list: # Filter scaffolds
+            scaffold_dict.setdefault(scaffold_name, {})[chr_name] = dx[0]
+            average_count += dx[0]
+            simularity_sum += dx[1]
+            hit_length_sum += dx[2]
+            gap_length_sum += dx[3]
+
     # counting chromosomes hit
-    scaffold_length = QueryFaiOpen('ListAll')
     result_list, total_length = [], 0
     for scaffold_name in hit_list.keys():
         if scaffold_name in scaffold_dict.keys():
             result_list.append(str(scaffold_name + '\t' + str(scaffold_length[scaffold_name]) + '\t' + str(sum(scaffold_dict[scaffold_name].values())) + '\n'))
             total_length += scaffold_length[scaffold_name]
             for chr_name in hit_list[scaffold_name].keys():
-                hitgroup = HitGrouping(hit_list[scaffold_name][chr_name])
+                hitgroup = group_cache.Get(scaffold_name, chr_name, noise_suppress = False)
                 for value in hitgroup: # [[1,2,3,4,5],[1,2,3,4,5]] or [1,2,3,4,5]
                     if type(value) == list:
                         hitgroup = value # [1,2,3,4,5]
@@ -570,35 +978,83 @@ if args.blastn_summary:
                         break
 
     # statistics
+    average_count = max(average_count, 1)
     simularity_file = str(round(simularity_sum/average_count,2)) + '%'
     hit_length_file = str(round(hit_length_sum/average_count)) + ' bp'
     gap_length_file = str(round(gap_length_sum/average_count)) + ' bp'
-    statistics = '### BLASTN statistics ###\nAmount of scaffolds: ' + str(scaffold_count) + '\n' + 'Combined scaffold length: ' + str(total_length) + ' bp\n' + 'Average simularity: ' + simularity_file + '\n' + 'Average hit length: ' + hit_length_file + '\n' + 'Average gap length: ' + gap_length_file + '\n\n'
+    blast_statistics = '### BLASTN statistics ###\nAmount of scaffolds: ' + str(len(scaffold_dict)) + '\n' + 'Combined scaffold length: ' + str(total_length) + ' bp\n' + 'Average simularity: ' + simularity_file + '\n' + 'Average hit length: ' + hit_length_file + '\n' + 'Average gap length: ' + gap_length_file + '\n\n'
     
-    output_file = open(dir_name + '_BLASTN_summary.txt','w')
-    output_file.write(statistics)
+    output_file = open(summary_file,'w')
+    output_file.write(blast_statistics)
     output_file.write('### list of filtered scaffolds ###\n# scaffold   scaffold length   blast hits\n# chr   hits/chr   [Ref_chr_start, Ref_chr_end, Target_chr_start, Target_chr_end]\n# ...')
-    print(statistics)
+    print(blast_statistics)
     for line in result_list:
         output_file.write(line)
     output_file.close()
-    exit(0)
 
-### Generate a SVG file for one specific scaffold
-if args.scaffold_name != '':
+# hit colours of -s, slightly different from the colours of the reference chromosomes
+HIT_COLOR = {'chr1':'#F06565','chr2':'#F77D2C','chr3':'#EEBE00','chr4':'#A3CB00','chr5':'#56D800','chr6':'#00D0A6','chr7':'#00005C','chr8':'#2E78E6','chr9':'#8F4EF2','chr10':'#EFA6E0','chr11':'#CE0505','chr12':'#652800','chr13': '#846C0B','chr14':'#A28512','chr15': '#428714','chr16': '#082B08','chr17': '#004CBD','chr18': '#132D54','chr19': '#B20F91', 'chr20':'#C67D00', 'chr21':'#150804','chr22':'#C3C354','chr23':'#3F3F1C','chr24':'#1C4A3E','chr25':'#2FD4B8','chr26':'#D11ABF','chr27':'#4A0743','chr28':'#803578','chr29':'#958EC0','chr30':'#5B5E01','chr31':'#A5B779','chr32':'#BF7B48','chr33':'#00DB66','chr34':'#DEE43A','chr35':'#4D0000','chr36':'#9476C0','chr37':'#805F25','chr38':'#D15095','chrx': '#2C016E','other': '#7B797D'}
+
+def HitPaths(hits, cx, scaffold_x, color, lower_x): # --full-detail: one path per BLAST hit, identical paths written once
+    # lower_x: x of the hit at the bottom of the scaffold box on the rows of the other chromosomes, kept as drawn by earlier versions
+    seen = set()
+    for rec in hits:
+        if cx == -1: # if section of scaffold contains the same chrom as the ref chrom
+            path = '<path d= "M ' + str(int(rec[1])/1e5) + ' ' + str(300 + cx*200) +' L ' + str(int(rec[1])/1e5) + ' ' + str(400+ cx*200) + ' L ' + str(int(scaffold_x(rec[0]))) + ' 300 L ' + str(int(scaffold_x(rec[0]))) + ' 400" fill = "none" stroke = "' + color + '" stroke-width="1" />'
+        else: # if section of scaffold contains a different chrom than the ref chrom
+            path = '<path d= "M ' + str(int(scaffold_x(rec[0]))) + ' 300 L ' + str(lower_x(rec[0])) + ' 400 L ' + str(int(rec[1])/1e5) + ' ' + str(300 + cx*200) +' L ' + str(int(rec[1])/1e5) + ' ' + str(400+ cx*200) +'" fill = "none" stroke = "'+ color + '" stroke-width="1" />'
+        if path not in seen:
+            seen.add(path)
+            yield path
+
+def HitRibbons(hits, cx, scaffold_x, color, join = 2):
+    # Level of detail: hits are binned to figure units (1 unit = 100 kb, about one pixel) on both the scaffold and the chromosome.
+    # Bins that follow each other within join units on the scaffold and move one way on the chromosome are merged into a ribbon,
+    # a filled polygon between both boxes. Its opacity shows the hit density. A bin that joins nothing is drawn as a single line.
+    # Open runs are found by their last chr x: a bin only looks at the runs ending within join units of it, the oldest matching run is extended.
+    bins = Counter((int(scaffold_x(rec[0])), int(rec[1]/1e5)) for rec in hits)
+    runs, ends = [], {} # run: [first scaffold x, first chr x, last scaffold x, last chr x, direction, hits, bins, number], ends: {last chr x:[open runs]}
+    for (scaf, ref), count in sorted(bins.items()):
+        found = None
+        for end in range(ref - join, ref + join + 1):
+            if end not in ends: continue
+            ends[end] = [dx for dx in ends[end] if scaf - dx[2] <= join] # bins come in scaffold order, a run left behind stays closed
+            if not ends[end]:
+                del ends[end]
+                continue
+            for dx in ends[end]:
+                if (ref - dx[3]) * dx[4] >= 0 and (found is None or dx[7] < found[7]): found = dx
+        if found:
+            ends[found[3]].remove(found)
+            step = ref - found[3]
+            found[2], found[3], found[4], found[5], found[6] = scaf, ref, found[4] or (step > 0) - (step < 0), found[5] + count, found[6] + 1
+        else:
+            found = [scaf, ref, scaf, ref, 0, count, 1, len(runs)]
+            runs.append(found)
+        ends.setdefault(ref, []).append(found)
+    ref_far, ref_near = (300 + cx*200, 400 + cx*200) if cx == -1 else (400 + cx*200, 300 + cx*200)
+    scaf_near, scaf_far = (300, 400) if cx == -1 else (400, 300)
+    density = max([dx[5] / dx[6] for dx in runs] or [1])
+    for dx in runs:
+        if dx[6] == 1 and dx[0] == dx[2]:
+            yield '<path d= "M ' + str(dx[1]) + ' ' + str(ref_far) + ' L ' + str(dx[1]) + ' ' + str(ref_near) + ' L ' + str(dx[0]) + ' ' + str(scaf_near) + ' L ' + str(dx[0]) + ' ' + str(scaf_far) + '" fill = "none" stroke = "' + color + '" stroke-width="1" />'
+        else:
+            points = [[dx[1], ref_far], [dx[1], ref_near], [dx[0], scaf_near], [dx[0], scaf_far], [dx[2], scaf_far], [dx[2], scaf_near], [dx[3], ref_near], [dx[3], ref_far]]
+            yield '<path d= "M ' + ' L '.join(str(ex[0]) + ' ' + str(ex[1]) for ex in points) + ' Z" fill = "' + color + '" fill-opacity = "' + str(round(0.3 + 0.6 * dx[5] / dx[6] / density, 2)) + '" stroke = "' + color + '" stroke-width="0.5" />'
 
+def ScaffoldSynteny(scaffold_name, hit_list, scaffold_length, config): # -s: SVG file with the blastn hits of one scaffold
     reverse = False
     ## check if an inverted scaffold orientation is needed:
     all_scaf_hits, all_chr_hits = [], []
-    for chrom in hit_list[args.scaffold_name].keys():
-        for hit in hit_list[args.scaffold_name][chrom]:
+    for chrom in hit_list[scaffold_name].keys():
+        for hit in hit_list[scaffold_name][chrom]:
             all_scaf_hits.append(hit[0])
             all_chr_hits.append(hit[1])
     scaf_median = statistics.median(all_scaf_hits)
-    stored_index = []
-    ## filter hit outliers
-    for hit in all_scaf_hits:
-        if hit < scaf_median + 3000000 and hit > scaf_median - 3000000: stored_index.append(all_scaf_hits.index(hit))
+    ## filter hit outliers, a repeated position stands for its first occurrence
+    first_index = {}
+    for cx, hit in enumerate(all_scaf_hits): first_index.setdefault(hit, cx)
+    stored_index = [first_index[hit] for hit in all_scaf_hits if hit < scaf_median + 3000000 and hit > scaf_median - 3000000]
     all_scaf_hits = [all_scaf_hits[i] for i in stored_index]
     all_chr_hits = [all_chr_hits[i] for i in stored_index]
     min_chr_index = all_scaf_hits.index(min(all_scaf_hits))
@@ -606,195 +1062,218 @@ if args.scaffold_name != '':
     if all_chr_hits[max_chr_index] < all_chr_hits[min_chr_index]: reverse = True
 
     ## Generate reference chromosome svg data
-    scaffold_length = QueryFaiOpen('Figure')
+    offset = config.offset
     SVG = SvgObj()
-    line_list = []
     chr_median = statistics.median(all_chr_hits)
     if chr_median > 175000000: chr_median = 175000000
     # defines scaffold name printed in svg file
-    box_print, text_print = SVG.ChrBox(round(chr_median/1e5 + int(offset)),300, args.scaffold_name, genome, False, optionP = False, chr_detail = [scaffold_length[args.scaffold_name],[]])
+    box_print, text_print = SVG.ChrBox(round(chr_median/1e5 + int(offset)),300, scaffold_name, config.reference, False, optionP = False, chr_detail = [scaffold_length[scaffold_name],[]])
     # lists will be printed in the end during svg creation (box_print contains svg path object data, text_print contains text data)
     box_list, text_list = [box_print], [text_print]
-    total_hit = sum(len(dx) for dx in hit_list[args.scaffold_name].values())
-    hit_sort = sorted(zip([dx for dx in hit_list[args.scaffold_name].keys()],[len(hit_list[args.scaffold_name][dx]) for dx in hit_list[args.scaffold_name].keys()]), key = lambda dx: dx[1], reverse = True)
-    
-    ## Generate scaffold svg data
-    count = 0.0
+    total_hit = sum(len(dx) for dx in hit_list[scaffold_name].values())
+    hit_sort = sorted(zip([dx for dx in hit_list[scaffold_name].keys()],[len(hit_list[scaffold_name][dx]) for dx in hit_list[scaffold_name].keys()]), key = lambda dx: dx[1], reverse = True)
+
+    ## Generate scaffold svg data: chromosomes with most hits first, until 95% of the hits are shown
+    count, rows = 0.0, []
     for cx,chr_name in enumerate(hit_sort):
         if cx == 0: cx = -1
         # defines chr name printed in svg file
-        box_print, text_print = SVG.ChrBox(0,300+cx*200,chr_name[0], genome, True, optionP = False, chr_detail=[])
+        box_print, text_print = SVG.ChrBox(0,300+cx*200,chr_name[0], config.reference, True, optionP = False, chr_detail=[])
         box_list.append(box_print)
         text_list.append(text_print)
-        for rec in hit_list[args.scaffold_name][chr_name[0]]:
-            # Slightly different colours compared to the colours of reference chromosomes
-            hit_col_dict = {'chr1':'#F06565','chr2':'#F77D2C','chr3':'#EEBE00','chr4':'#A3CB00','chr5':'#56D800','chr6':'#00D0A6','chr7':'#00005C','chr8':'#2E78E6','chr9':'#8F4EF2','chr10':'#EFA6E0','chr11':'#CE0505','chr12':'#652800','chr13': '#846C0B','chr14':'#A28512','chr15': '#428714','chr16': '#082B08','chr17': '#004CBD','chr18': '#132D54','chr19': '#B20F91', 'chr20':'#C67D00', 'chr21':'#150804','chr22':'#C3C354','chr23':'#3F3F1C','chr24':'#1C4A3E','chr25':'#2FD4B8','chr26':'#D11ABF','chr27':'#4A0743','chr28':'#803578','chr29':'#958EC0','chr30':'#5B5E01','chr31':'#A5B779','chr32':'#BF7B48','chr33':'#00DB66','chr34':'#DEE43A','chr35':'#4D0000','chr36':'#9476C0','chr37':'#805F25','chr38':'#D15095','chrx': '#2C016E','other': '#7B797D'}
-            if cx == -1: # if section of scaffold contains the same chrom as the ref chrom
-                if reverse == True: line_list.append('<path d= "M ' + str(int(rec[1])/1e5) + ' ' + str(300 + cx*200) +' L ' + str(int(rec[1])/1e5) + ' ' + str(400+ cx*200) + ' L ' + str(int(int(scaffold_length[args.scaffold_name])/1e5 - int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 300 L ' + str(int(int(scaffold_length[args.scaffold_name])/1e5 - int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 400" fill = "none" stroke = "' + hit_col_dict[chr_name[0]] + '" stroke-width="1" />')
-                else: line_list.append('<path d= "M ' + str(int(rec[1])/1e5) + ' ' + str(300 + cx*200) +' L ' + str(int(rec[1])/1e5) + ' ' + str(400+ cx*200) + ' L ' + str(int(int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 300 L ' + str(int(int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 400" fill = "none" stroke = "' + hit_col_dict[chr_name[0]] + '" stroke-width="1" />')
-            else: # if section of scaffold contains a different chrom than the ref chrom
-                if reverse == True: line_list.append('<path d= "M ' + str(int(int(scaffold_length[args.scaffold_name])/1e5 - int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 300 L ' + str(int(int(scaffold_length[args.scaffold_name])/1e5 - int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 400 L ' + str(int(rec[1])/1e5) + ' ' + str(300 + cx*200) +' L ' + str(int(rec[1])/1e5) + ' ' + str(400+ cx*200) +'" fill = "none" stroke = "' + hit_col_dict[chr_name[0]] + '" stroke-width="1" />')
-                else: line_list.append('<path d= "M ' + str(int(int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 300 L ' + str(int(int(rec[0])/1e5) + chr_median/1e5 + offset) + ' 400 L ' + str(int(rec[1])/1e5) + ' ' + str(300 + cx*200) +' L ' + str(int(rec[1])/1e5) + ' ' + str(400+ cx*200) +'" fill = "none" stroke = "'+ hit_col_dict[chr_name[0]] + '" stroke-width="1" />')
-        count = count + len(hit_list[args.scaffold_name][chr_name[0]])
-        if count / total_hit > 0.95: 
+        rows.append([cx, chr_name[0]])
+        count = count + chr_name[1]
+        if count / total_hit > 0.95:
             height = 800 + cx*200
             break
-    line_list = list(set(line_list))
-    
-    ## output
-    if args.output != '':
-        filename = args.output + '_' + args.scaffold_name
-        output_files(filename, height, box_list, line_list, text_list, args.pdf_flag)
-    else: print(SVG.head(2000, len(height)*100+700) + '\n  ' + '\n  '.join(list(box_list)) + '\n  '.join(line_list) + '\n  '.join(text_list) + '</svg>\n')
-    exit(0)
-
-### Generate a svg file containing all scaffolds of a reference chromosome.
-if args.ref_chr != False:
-    optionP = False # optionP is a flag used to indicate the usage of the scaffold align option, also used as counter if True.
-    chr_list = []
-    if args.ref_chr != 'All': 
-        chr_name = args.ref_chr.lower()
-        chr_list.append(chr_name)
+    if reverse == True:
+        scaffold_x = lambda que: int(scaffold_length[scaffold_name])/1e5 - int(que)/1e5 + chr_median/1e5 + offset
+        lower_x = lambda que: int(scaffold_x(que))
     else:
-        ## create list of all chromosomes
-        chr_list = []
-        for scaffold_name in hit_list.keys():
-            for chromosome in hit_list[scaffold_name].keys():
-                in_list = chromosome.lower() in chr_list
-                if in_list == False: chr_list.append(chromosome)
-            if 'chry' in chr_list: 
-                chr_list[chr_list.index('chry')] = 'other'
-
-    ## hitgrouping (group hits per scaffold)
-    # INPUT HitGrouping: hit_list: {scaffold:{chr:[(Que, Ref)(Que, Ref)(...)(...)],chr:[(...)(...)(...)]}}
-    # OUTPUT HitGrouping: groups: {ctgname:[[Ref_start,Ref_end,Que_start,Que_end,count=xxx],[Ref_start,Ref_end,Que_start,Que_end,count=xxx]]...}
-    for chr_name in chr_list:
-        scaffold_length = QueryFaiOpen('Synteny')
-        SVG = SvgObj()
-        # Determines ref chromosome and name
-        box_print, text_print = SVG.ChrBox(0, 300, chr_name, genome, False, optionP)
-        box_list, text_list = [box_print], [text_print]
-        line_list, boundary_list, groups = [], [], {} 
-        
-        for scaffold_name in hit_list.keys():
-            if chr_name in hit_list[scaffold_name].keys():
-                groups[scaffold_name] = HitGrouping(hit_list[scaffold_name][chr_name], noise_suppress = True)
-                for dx in hit_list[scaffold_name].keys():
-                    if len(hit_list[scaffold_name][dx]) > sensitivity.O and dx != chr_name and scaffold_name not in boundary_list:
-                        boundary_list.append(scaffold_name)
-        groups = dict((dx, ex) for dx, ex in groups.items() if ex != [])
-        
-        ## Section specific for obtaining pseudochromosome data
-        if args.scaf_aligner != False:
-            input_dictionary = {}
-            for dx in groups:
-                chr_specific_scaffolds = {}
-                for chr_ in hit_list[dx].keys():
-                    block_list = []
-                    chr_block = HitGrouping(hit_list[dx][chr_], noise_suppress = True)
-                    if chr_block != []:
-                        for block in chr_block:
-                            block_list.append(block)
-                        #dict1 = {chr_:block_list}
-                        chr_specific_scaffolds.update({chr_:block_list})
-                input_dictionary.update({dx:chr_specific_scaffolds})
-            result_list = ScaffoldAlignment(groups, input_dictionary, args.ref_chr)
-            
-            # create index_list that gives scaffolds in the same group the same id
-            indexnumber, indexed_list = 1, []
-            while indexnumber <= len(result_list):
-                for scaffold in result_list[indexnumber - 1]:
-                    indexed_list.append([indexnumber, scaffold])
-                indexnumber += 1
-            index = indexed_list
-
-        else: index = enumerate(groups)
-
-        ## Set position parameters of each object in svg file and create svg object
-        # Set position parameters:
-        previous_cx = 0
-        added_length = 0
-        counter = 1
-        for cx, dx in index: # create index of remaining scaffolds
-            baseline, bottomline = 400, 0
-            if args.scaf_aligner != False: 
-                optionP = counter
-                if cx != previous_cx: 
-                    # added_length = 0
-                    chr_hit_list = []
-                    for hit in hit_list[dx][chr_name.lower()]:
-                        chr_hit_list.append(hit[1])
-                    chr_median = statistics.median(chr_hit_list) / 1e5
-                    if chr_median > 160000000: chr_median = 160000000
-                    added_length = chr_median - 100
-                xco = round(added_length)
-                if cx % 3 == 0: yco = 600
-                elif cx % 4 == 0: yco, baseline, bottomline = 10, 300, 100
-                elif cx % 2 == 0: yco, baseline, bottomline = 120, 300, 100
-                else: yco = 800
-                
-                # update loop values
-                previous_cx = cx
-                added_length += scaffold_length[dx]/1e5 + 5
-                counter += 1
-                
-            else:
-                xco = int((groups[dx][0][0]-min(groups[dx][0][2:4]))/1e5)
-                yco = 500 + cx*100
-
-            # Create svg object
-            # determines scaffold box and name
-            box_print, text_print = SVG.ChrBox(xco, yco, str(dx), genome, False, optionP, chr_detail = [scaffold_length[dx],[]])
-            box_list.append(box_print)
-            text_list.append(text_print)
-
-            previous_chr = ''
-            if dx in boundary_list:
-                for chr_ in hit_list[dx].keys():
-                    chr_block = HitGrouping(hit_list[dx][chr_], noise_suppress = True)
-                    if chr_block != []:
-                        for _,_,start,end,_ in chr_block:
-                            if previous_chr != chr_:
-                                # Create chr blocks for each scaffold
-                                box_print, text_print = SVG.ChrBox(xco + (min(start,end)/1e5),yco, chr_, genome, False, optionP, chr_detail=[abs(end-start),[]])
-                                box_list.append(box_print) 
-                                text_list.append(text_print)
-                            else:
-                                box_print,_ = SVG.ChrBox(xco + (min(start,end)/1e5),yco, chr_, genome, False, optionP, chr_detail=[abs(end-start),[]])
-                                box_list.append(box_print)
-
-                            # update loop values
-                            previous_chr = chr_
-
-            # creates the connecting figure between the ref chrom and the scaffold 
-            for ex in range(len(groups[dx])):
-                corner1 = '"M'+str(int(groups[dx][ex][0]/1e5)) + ' ' + str(baseline)
-                corner2 = ' L'+str(int(groups[dx][ex][1]/1e5)) + ' ' + str(baseline)
-                corner3 = ' L'+str(xco + (int(groups[dx][ex][3])/1e5)) + ' ' + str(yco + bottomline)
-                corner4 = ' L'+str(xco + (int(groups[dx][ex][2])/1e5)) + ' ' + str(yco + bottomline) + ' Z"'
-                line_list.append('<path d='+corner1+corner2+corner3+corner4+' fill="black" stroke="none" fill-opacity="0.4" />')
-    
-            ## output
-            if args.output != '':
-                filename = args.output
-                if filename[-4:] == ".svg" or filename[-4:] == ".pdf":
-                    filename = filename[:-4]
-                filename = filename + '_' + chr_name
-                output_files(filename, len(groups)*100+700, box_list, line_list, text_list, args.pdf_flag)
-            else: print(SVG.head(2000, len(groups)*100+700) + '\n  ' + '\n  '.join(list(box_list)) + '\n  '.join(line_list) + '\n  '.join(text_list) + '</svg>\n')
-
-### G-banding section
-if args.G_scaffold != '':
-    scaffold_length = QueryFaiOpen('G-banding')
+        scaffold_x = lambda que: int(que)/1e5 + chr_median/1e5 + offset
+        lower_x = lambda que: int(int(que)/1e5) + chr_median/1e5 + offset # only the position is truncated here
+
+    ## output, hit paths are streamed to the file (or stdout without -o) as they are made
+    svg = SvgStream(config.output + '_' + scaffold_name if config.output != '' else '', 2000, height, config.pdf_flag, config.pdf_dpi)
+    for dx in box_list: svg.Write(dx)
+    for cx, chr_name in rows:
+        color = HIT_COLOR.get(chr_name, HIT_COLOR['other'])
+        if config.full_detail: paths = HitPaths(hit_list[scaffold_name][chr_name], cx, scaffold_x, color, lower_x)
+        else: paths = HitRibbons(hit_list[scaffold_name][chr_name], cx, scaffold_x, color)
+        for dx in paths: svg.Write(dx)
+    for dx in text_list: svg.Write(dx)
+    svg.Close()
+
+def GBand(scaffold_name, group_cache, scaffold_length, config, filename = None): # -g: G-banding simulation of one scaffold, written to filename (default config.output)
     group_list = {}
-    Band_SVG = ChrBand()
     SVG = SvgObj()
-    for chr_ in hit_list[args.G_scaffold].keys():
+    for chr_ in group_cache.hit_list[scaffold_name].keys():
         # group_list: {chr:[[Ref_start,Ref_end,Que_start,Que_end,count=xxx][Ref_start,Ref_end,Que_start,Que_end,count=xxx]],chr:[...]}
-        group_list[chr_] = HitGrouping(hit_list[args.G_scaffold][chr_], noise_suppress=True)
-    
-    if args.output != '':
-        with open(args.output,'w') as SVG_out:
-            SVG_out.write(SVG.head(int(scaffold_length[args.G_scaffold]/1e6/7*100), 500) + '\n  ' + Band_SVG.BandSVG(scaffold_length[args.G_scaffold],7,group_list,x=0,y=0,height=100)+ '</svg>\n')
-    else:
-        print(SVG.head(int(scaffold_length[args.G_scaffold]/1e6/7*100), 500) + '\n' + Band_SVG.BandSVG(scaffold_length[args.G_scaffold],7,group_list,x=0,y=0,height=100)+ '</svg>\n')
+        group_list[chr_] = group_cache.Get(scaffold_name, chr_)
+    head = SVG.head(int(scaffold_length[scaffold_name]/1e6/7*100), 500)
+    bands = config.bands.BandSVG(scaffold_length[scaffold_name],7,group_list,x=0,y=0,height=100,resolution=config.band_resolution)
+    filename = config.output if filename is None else filename
+    if filename != '':
+        with open(filename,'w') as SVG_out: SVG_out.write(head + '\n  ' + bands + '</svg>\n')
+    else: print(head + '\n' + bands + '</svg>\n')
+
+def GBandAll(scaffold_names, group_cache, scaffold_length, config): # -g All: one NAME_scaffold.svg per scaffold, bands and groups shared by the whole pass
+    stem = config.output[:-4] if config.output[-4:] == '.svg' else config.output
+    for scaffold_name in scaffold_names:
+        if scaffold_name in scaffold_length: GBand(scaffold_name, group_cache, scaffold_length, config, stem + '_' + scaffold_name + '.svg' if stem else '')
+
+def BandResolution(input_resolution): # --band-res value in bp, ValueError outside 100 kb - 1 Mb
+    resolution = int(round(OffsetParse(input_resolution)*1e5))
+    if not 100000 <= resolution <= 1000000: raise ValueError('--band-res argument: must be between 100K and 1M.')
+    return resolution
+
+def OffsetParse(input_offset): # -m value in units of 100 kb, ValueError if it is not a number with an optional K/M/G
+    # if input is a positive number
+    if input_offset.isdigit(): return int(input_offset)/1e5
+    # if input is a negative number 
+    elif input_offset[0] == '-' and input_offset[1:].isdigit(): return int(input_offset)/1e5
+    # if input uses K, M or G and is positive
+    elif input_offset[-1] in ['K','M','G'] and input_offset[:-1].isdigit(): return int(input_offset[:-1])*{'K':1e-2,'M':10,'G':1e4, 'k':1e-2,'m':10,'g':1e4}[input_offset[-1]]
+    # if input uses K, M or G and is negative 
+    elif input_offset[-1] in ['K','M','G'] and input_offset[0] == '-' and input_offset[1:-1].isdigit(): return int(input_offset[1:-1])*{'K':1e-2,'M':10,'G':1e4, 'k':1e-2,'m':10,'g':1e4}[input_offset[-1]]
+    raise ValueError('--offset argument: must be a number, or end with K,M,G.')
+
+############################################## argparse module ################################################
+def main(argv = None):
+    cwd = os.getcwd()
+    dir_name = cwd.split('/')
+    dir_name = dir_name[-1]
+
+    parser = argparse.ArgumentParser(prog='SynChroBuild', description='Build synteny maps from BLAST results (Synteny Builder) and output the synteny data into AGP, fasta or summary files. Uses python 3.4+')
+    parser.add_argument('blastn', help = 'Input file name of BLASTN result (for synteny map) or fasta file (for AGP, fasta and summary files)')
+    parser.add_argument('faindex', help = 'Input fasta index file (for synteny map) or synteny file (for AGP, fasta and summary files)')
+
+    # Blast file input
+    parser_syn2 = parser.add_argument_group('Synteny builder - main functions:')
+    parser_syn2.add_argument('-s','--scaf', dest='scaffold_name', action ='store', default = '', metavar = 'SCAF', help = 'Generate SVG file with detailed blastn hits of a specified scaffold')
+    parser_syn2.add_argument('-c','--chr', dest='ref_chr', action ='store', nargs = '?', const = 'All', default = False, metavar='CHROM', help = 'Build synteny on chosen chromosome (default = all chromosomes).')
+    parser_syn2.add_argument('-j','--jobs', dest='jobs', action ='store', type = int, default = 1, metavar='N', help = 'Number of worker processes used for BLAST parsing, repeat filtering and rendering chromosomes with -c (default = 1).')
+    parser_syn2.add_argument('-a','--align', dest='scaf_aligner', action ='store_true', default = False, help = 'Align contigious scaffolds into groups in the SVG output file.')
+
+    parser_syn3 = parser.add_argument_group('Synteny builder - secundary functions:')
+    parser_syn3.add_argument('-x','--xmap', dest='Xmap_function', action ='store_true', help = 'Output list as Irysview .cmap and .xmap format.')
+    parser_syn3.add_argument('-g','--g_band', dest='G_scaffold', action ='store', default = '', nargs = '?', const = 'All', metavar = 'SCAF', help='Generating G-banding simulation of scaffold based on synteny (default = all scaffolds, NAME_scaffold.svg each). Output .SVG format.') 
+    parser_syn3.add_argument('-b','--blast_sum', dest='blastn_summary', action='store_true', help='Give statistics about the BLASTN result and list all significant scaffolds')
+    # create text file = density of blast (hit ratio), simularity between both species, average
+
+    parser_syn1 = parser.add_argument_group('Synteny builder - settings:')
+    parser_syn1.add_argument('-r','--ref',dest='Ref_genome',action = 'store',default = 'MM10', metavar='FAIDEX', help='Information of Reference genome loaded from a fasta index file, default = GRCm38/MM10.')
+    parser_syn1.add_argument('--regions', dest='regions', action = 'store', default = '', metavar='FILE', help='Complex/segmental duplication regions drawn on the reference chromosomes, BED (itemRgb colours) or TSV: chrom start end [colour]. Replaces the MM10 regions.')
+    parser_syn1.add_argument('--cytoband', dest='cytoband', action = 'store', default = '', metavar='FILE', help='-g: UCSC cytoBand table of the reference (chrom start end name gieStain). Replaces the MM10 bands.')
+    parser_syn1.add_argument('--band-res', dest='band_resolution', action = 'store', default = '1M', metavar='BP', help='-g: resolution of the G-band emulation, 100K to 1M (default = 1M).')
+    parser_syn1.add_argument('-d','--div',dest='diversity',action ='store',default = 'order', metavar='VALUE', help='Set diversity value between Query and Reference(order/family/genus/species)')
+    parser_syn1.add_argument('-m','--offset', dest='offset', action ='store', default = '0', metavar='BP', help = 'Shift the scaffold to right (+) or left (-) compared to the reference chromosome. Units in basepair, K,M,G also accepted. Example: -m"-1000" = -m"-1K"')
+    parser_syn1.add_argument('-e','--exp', dest='exp_value', action ='store', default = '200', metavar='VALUE', help = 'Set threshold for expectation (E) value of BLAST results, e.g. -e 80 indicate E value < 1e-80.')
+    parser_syn1.add_argument('-o', dest='output', action = 'store', metavar='NAME', nargs='?', const = dir_name, default = dir_name, help = 'Assign a custom name to the output file(s).')
+    parser_syn1.add_argument('--full-detail', dest='full_detail', action ='store_true', default = False, help='-s: draw one line per BLAST hit instead of merging the hits at figure resolution.')
+    parser_syn1.add_argument('-pdf', dest='pdf_flag', action ='store_true', default = False, help='Output file in pdf format instead of svg format.')
+    parser_syn1.add_argument('--dpi', dest='pdf_dpi', action ='store', type = int, default = None, metavar='DPI', help='Resolution of the -pdf pages (default = ImageMagick default).')
+    parser_syn1.add_argument('--multipage', dest='multipage', action ='store_true', default = False, help='With -c and -pdf: all chromosomes in one multi-page NAME.pdf, pages rasterized by the -j workers.')
+    parser_syn1.add_argument('--nocache', dest='hit_cache', action ='store_false', default = True, help='Do not read or write the binary BLAST hit cache (<blastn>.hitcache).')
+    ProfileArguments(parser_syn1)
+    args = parser.parse_args(argv)
+    if args.profile is not None or args.profile_stage: PROFILE.Start(args.output if args.profile in (None, True) else args.profile, args.profile_stage, 'SynBuild')
+    try: return SynRun(args, parser, dir_name)
+    finally: PROFILE.Write()
+
+def SynRun(args, parser, dir_name): # main() after argument parsing, every return value is the exit code
+    ############################################## script ################################################
+
+    ### Check input parameters
+    ## Check for excessive arguments
+    if sum([args.blastn_summary, args.ref_chr!= False, args.scaffold_name != '', args.Xmap_function], args.G_scaffold != '') != 1:
+        parser.print_help()
+        return 1
+    if args.multipage and (args.ref_chr == False or not args.pdf_flag): parser.error('--multipage requires -c and -pdf')
+
+    if args.blastn[-4:] == '.fai': # input has been switched by accident
+        faindex = args.blastn
+        args.blastn = args.faindex
+        args.faindex = faindex
+
+    ## Check offset section (-m): Moves scaffold (requires -f option)
+    try: offset = OffsetParse(args.offset)
+    except ValueError as err:
+        print(err)
+        return 1
+    try: band_resolution = BandResolution(args.band_resolution)
+    except ValueError as err:
+        print(err)
+        return 1
+    try: config = SynConfig(args.Ref_genome, args.diversity, args.output, args.pdf_flag, args.scaf_aligner, offset, args.regions, args.full_detail, args.pdf_dpi, args.cytoband, band_resolution)
+    except (OSError, ValueError, IndexError) as err:
+        print('Reference genome {}, region file {} or cytoband file {} can not be read: {}'.format(args.Ref_genome, args.regions, args.cytoband, err))
+        return 1
+
+    ### Create hit_list dictionary fron blast input
+    # structure of hit_list: hit_list = {scaffold:{chr:[(scaffold_position, chr_position)(...)(...)]} } => chr_pos is centre of blast hit location on both ref and scaffold
+    # set repeats filter sensitivity + set threshold E-value for BLAST results
+    expection = int(args.exp_value)
+    with PROFILE.Stage('blast_parse'): hit_table = HitTableOpen(args.blastn, expection, args.hit_cache, args.jobs)
+
+    ### Filter blast result: Remove repeats
+    with PROFILE.Stage('repeat_filter'): hit_list = RepeatFilterBatch(hit_table, config.sensitivity, args.jobs)
+    # hit groups are shared by all modes, and kept next to the hit cache for later runs
+    with PROFILE.Stage('group_cache'): group_cache = GroupCache(hit_list, args.blastn + '.groupcache' if args.hit_cache else '', dict(BlastKey(args.blastn, expection), diversity = args.diversity), config.sensitivity)
+
+    # every mode except -x needs the scaffold lengths of the query fasta index
+    call_from = 'ListAll' if args.blastn_summary else 'Figure' if args.scaffold_name != '' else 'Synteny' if args.ref_chr != False else 'G-banding' if args.G_scaffold != '' else ''
+    if call_from:
+        try:
+            with PROFILE.Stage('fasta_index'): scaffold_length = QueryFaiOpen(args.faindex, call_from)
+        except ValueError as err:
+            print(err)
+            return 1
+
+    ### Create summary of BLASTN result
+    if args.blastn_summary:
+        with PROFILE.Stage('blast_summary'): BlastSummary(hit_table, hit_list, group_cache, scaffold_length, dir_name + '_BLASTN_summary.txt')
+        group_cache.Save()
+        return 0
+
+    ### Generate a SVG file for one specific scaffold
+    if args.scaffold_name != '':
+        with PROFILE.Stage('scaffold_synteny'): ScaffoldSynteny(args.scaffold_name, hit_list, scaffold_length, config)
+        return 0
+
+    ### Generate a svg file containing all scaffolds of a reference chromosome.
+    if args.ref_chr != False:
+        chr_list = []
+        if args.ref_chr != 'All': 
+            chr_name = args.ref_chr.lower()
+            chr_list.append(chr_name)
+        else:
+            ## create list of all chromosomes
+            chr_list = []
+            for scaffold_name in hit_list.keys():
+                for chromosome in hit_list[scaffold_name].keys():
+                    in_list = chromosome.lower() in chr_list
+                    if in_list == False: chr_list.append(chromosome)
+                if 'chry' in chr_list: 
+                    chr_list[chr_list.index('chry')] = 'other'
+
+        ## hitgrouping (group hits per scaffold)
+        # INPUT HitGrouping: hit_list: {scaffold:{chr:[(Que, Ref)(Que, Ref)(...)(...)],chr:[(...)(...)(...)]}}
+        # OUTPUT HitGrouping: groups: {ctgname:[[Ref_start,Ref_end,Que_start,Que_end,count=xxx],[Ref_start,Ref_end,Que_start,Que_end,count=xxx]]...}
+        if args.multipage and args.pdf_flag: config.pdf_flag = False # pages are collected as svg first, rasterized together below
+        with PROFILE.Stage('chr_synteny'): ChrSyntenyAll(chr_list, hit_list, group_cache, scaffold_length, config, args.jobs)
+        group_cache.Save()
+        if args.multipage and args.pdf_flag:
+            stem = args.output[:-4] if args.output[-4:] in ('.svg', '.pdf') else args.output
+            PdfBook(stem + '.pdf', [stem + '_' + dx + '.svg' for dx in chr_list if os.path.exists(stem + '_' + dx + '.svg')], args.pdf_dpi, args.jobs)
+
+    ### G-banding section
+    if args.G_scaffold != '':
+        with PROFILE.Stage('g_band'):
+            if args.G_scaffold == 'All': GBandAll(sorted(dx for dx in hit_list if hit_list[dx]), group_cache, scaffold_length, config) # scaffolds left with hits after filtering
+            else: GBand(args.G_scaffold, group_cache, scaffold_length, config)
+        group_cache.Save()
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
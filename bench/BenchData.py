@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+# Version 2026-10:
+# Deterministic synthetic inputs for the SynBuild/ChrBuild benchmarks (BenchRun.py). The same seed and scale always give the same files.
+# BenchData.py OUTDIR [--scale tiny|small|large] [--seed N] [--scaffolds N] [--genome-size BP] [--hits N] [--repeat-density F] [--genes N]
+# Files: scaffolds.fa (+ .fai), blast.tbl (outfmt 6), synteny.txt, scaffolds.gff3
+import os
+import sys
+import json
+import random
+import argparse
+
+# MM10 chromosome lengths, the blast table refers to these so SynBuild can draw them with its built in reference
+MM10_LENGTH = {'chr1':195471971,'chr2':182113224,'chr3':160039680,'chr4':156508116,'chr5':151834684,'chr6':149736546,'chr7':145441459,'chr8':129401213,'chr9':124595110,'chr10':130694993,'chr11':122082543,'chr12':120129022,'chr13':120421639,'chr14':124902244,'chr15':104043685,'chr16':98207768,'chr17':94987271,'chr18':90702639,'chr19':61431566,'chrX':171031299}
+# presets of --scale: scaffolds, genome size, blast hits, repeat density, genes
+SCALE = {
+    'tiny':  {'scaffolds':50,   'genome_size':20000000,   'hits':200000,   'repeat_density':0.05, 'genes':2000},
+    'small': {'scaffolds':500,  'genome_size':200000000,  'hits':1000000,  'repeat_density':0.05, 'genes':20000},
+    'large': {'scaffolds':2000, 'genome_size':2500000000, 'hits':10000000, 'repeat_density':0.05, 'genes':200000}}
+BASES = bytes(b'ACGT'[cx % 4] for cx in range(256)) # random bytes -> bases by one translate
+
+def ScaffoldLengths(rng, scaffolds, genome_size): # heavy tailed, like a real scaffold assembly, at least 1 kb each
+    weights = [rng.paretovariate(1.2) for cx in range(scaffolds)]
+    total = sum(weights)
+    return [max(1000, int(genome_size * dx / total)) for dx in weights]
+
+def FastaGenerate(path, rng, lengths, width = 60, chunk_size = 1 << 20):
+    # Random sequence with soft-masked stretches and N runs. The .fai is written from the known line geometry, no second pass.
+    lower = bytes.maketrans(b'ACGT', b'acgt')
+    with open(path,'wb') as FAS, open(path + '.fai','w') as FAI:
+        offset = 0
+        for cx, length in enumerate(lengths):
+            name = 'Scaf_{}'.format(cx)
+            head = '>{} synthetic\n'.format(name).encode()
+            FAS.write(head)
+            offset += len(head)
+            FAI.write('\t'.join(map(str, [name, length, offset, width, width + 1])) + '\n')
+            line, done = b'', 0
+            while done < length:
+                size = min(chunk_size, length - done)
+                seq = rng.getrandbits(8 * size).to_bytes(size, 'little').translate(BASES)
+                if rng.random() < 0.3: # repeat masked stretch
+                    start = rng.randrange(size)
+                    seq = seq[:start] + seq[start:start + 5000].translate(lower) + seq[start + 5000:]
+                if rng.random() < 0.1: # assembly gap
+                    start = rng.randrange(size)
+                    seq = seq[:start] + b'N' * len(seq[start:start + 1000]) + seq[start + 1000:]
+                seq, done = line + seq, done + size
+                full = len(seq) - len(seq) % width
+                FAS.write(b''.join(seq[ex:ex + width] + b'\n' for ex in range(0, full, width)))
+                line = seq[full:]
+            if line: FAS.write(line + b'\n')
+            offset += length + -(-length // width)
+
+def BlastGenerate(path, rng, lengths, hits, repeat_density):
+    # Each scaffold is made of 1-3 syntenic blocks on MM10 chromosomes (either orientation), hits are spread over the blocks.
+    # A repeat_density share of the hits comes in bursts of 6 hits of one 1 kb window to several chromosomes, RepeatFilter removes those.
+    chrs, total = list(MM10_LENGTH), sum(lengths)
+    with open(path,'w') as BLAST:
+        for cx, length in enumerate(lengths):
+            name, count = 'Scaf_{}'.format(cx), max(10, int(hits * length / total))
+            cuts = sorted(rng.randrange(1, length) for ex in range(rng.randint(0, 2)))
+            blocks = []
+            for start, end in zip([0] + cuts, cuts + [length]):
+                chr_name = rng.choice(chrs)
+                ref_start = rng.randrange(max(1, MM10_LENGTH[chr_name] - (end - start)))
+                blocks.append([start, end, chr_name, ref_start, rng.random() < 0.5])
+            rows = []
+            while len(rows) < count:
+                if rng.random() < repeat_density:
+                    window = rng.randrange(length // 1000 + 1) * 1000
+                    for ex in range(6): rows.append(Hit(rng, name, window + rng.randrange(1000), rng.choice(chrs), None))
+                    continue
+                start, end, chr_name, ref_start, reverse = rng.choice(blocks)
+                que = rng.randrange(start, end)
+                ref = ref_start + (end - que if reverse else que - start) + rng.randint(-2000, 2000)
+                rows.append(Hit(rng, name, que, chr_name, max(1, ref)))
+            BLAST.writelines(rows)
+
+def Hit(rng, scaffold, que, chr_name, ref): # one outfmt 6 row around que/ref (ref None: random position on chr_name)
+    if ref is None: ref = rng.randrange(1, MM10_LENGTH[chr_name])
+    length = rng.randint(100, 1000)
+    mismatch = rng.randint(0, length // 5)
+    exp = rng.randint(20, 200)
+    evalue = '0.0' if exp > 180 else '{}e-{}'.format(rng.randint(1, 9), exp)
+    que_start = max(1, que - length // 2)
+    ref_start, ref_end = (ref - length // 2, ref + length // 2) if rng.random() < 0.5 else (ref + length // 2, ref - length // 2)
+    return '{}\t{}\t{:.2f}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n'.format(scaffold, chr_name, 100 - mismatch * 100 / length, length, mismatch, rng.randint(0, 5), que_start, que_start + length - 1, max(1, ref_start), max(1, ref_end), evalue, length * 2)
+
+def SyntenyGenerate(path, rng, lengths, chromosomes = 20):
+    # The larger scaffolds are placed on chromosomes, with '-' reverse complemented scaffolds, ':' split scaffolds, '+' gaps and '@' anchors.
+    placed = sorted(range(len(lengths)), key = lambda cx:-lengths[cx])[:max(chromosomes, len(lengths) * 2 // 3)]
+    rng.shuffle(placed)
+    with open(path,'w') as SYN:
+        SYN.write('Mus bench\t10090\tbench1\t-\tIGC\tsynthetic assembly\tgenerated by BenchData.py\n# synteny lines\n')
+        for cx in range(chromosomes):
+            items, chr_length = [], 0
+            for ex in placed[cx::chromosomes]:
+                name, length = 'Scaf_{}'.format(ex), lengths[ex]
+                if items:
+                    if rng.random() < 0.1: # anchor the next scaffold at an absolute position
+                        anchor = chr_length + rng.randint(1000, 100000)
+                        items.append('@{}'.format(anchor))
+                        chr_length = anchor - 1
+                    else:
+                        gap = rng.choice(['+100', '+10K', '+100K'])
+                        items.append(gap)
+                        chr_length += int(gap[1:-1]) * 1000 if gap[-1] == 'K' else int(gap[1:])
+                strand = '-' if rng.random() < 0.4 else ''
+                if rng.random() < 0.2 and length > 2000: # split in two pieces with a gap in between
+                    half = length // 2
+                    items += [strand + name + ':1-' + str(half), '+500', strand + name + ':' + str(half + 1) + '-' + str(length)]
+                    chr_length += length + 500
+                else:
+                    items.append(strand + name)
+                    chr_length += length
+            if items: SYN.write('Chr{} {}\n'.format(cx + 1, ','.join(items)))
+
+def GffGenerate(path, rng, lengths, genes):
+    total = sum(lengths)
+    with open(path,'w') as GFF:
+        GFF.write('##gff-version 3\n')
+        for cx, length in enumerate(lengths):
+            name = 'Scaf_{}'.format(cx)
+            GFF.write('##sequence-region {} 1 {}\n'.format(name, length))
+            for ex in range(max(1, int(genes * length / total))):
+                start, strand, gene = rng.randrange(1, max(2, length - 20000)), rng.choice('+-'), '{}.g{}'.format(name, ex)
+                exons, position = [], start
+                for fx in range(rng.randint(2, 6)):
+                    exon_start = position + rng.randint(50, 1500)
+                    exons.append([exon_start, min(length, exon_start + rng.randint(50, 500))])
+                    position = exons[-1][1]
+                    if position >= length: break
+                end = exons[-1][1]
+                GFF.write('\t'.join([name, 'bench', 'gene', str(start), str(end), '.', strand, '.', 'ID=' + gene]) + '\n')
+                GFF.write('\t'.join([name, 'bench', 'mRNA', str(start), str(end), '.', strand, '.', 'ID={0}.t1;Parent={0}'.format(gene)]) + '\n')
+                for fx, [exon_start, exon_end] in enumerate(exons):
+                    GFF.write('\t'.join([name, 'bench', 'exon', str(exon_start), str(exon_end), '.', strand, '.', 'ID={0}.t1.exon{1};Parent={0}.t1'.format(gene, fx + 1)]) + '\n')
+                    GFF.write('\t'.join([name, 'bench', 'CDS', str(exon_start), str(exon_end), '.', strand, '0', 'ID={0}.t1.CDS{1};Parent={0}.t1'.format(gene, fx + 1)]) + '\n')
+
+def Generate(outdir, seed = 1, **settings):
+    # Writes all inputs to outdir, files of an earlier run with the same settings (params.json) are kept as they are.
+    settings['seed'] = seed
+    params_file = os.path.join(outdir, 'params.json')
+    try:
+        with open(params_file,'r') as PARAMS:
+            if json.load(PARAMS) == settings: return settings
+    except (OSError, ValueError): pass
+    os.makedirs(outdir, exist_ok = True)
+    lengths = ScaffoldLengths(random.Random(seed), settings['scaffolds'], settings['genome_size'])
+    # every file has its own random stream, changing one generator does not change the others
+    FastaGenerate(os.path.join(outdir, 'scaffolds.fa'), random.Random(seed + 1), lengths)
+    BlastGenerate(os.path.join(outdir, 'blast.tbl'), random.Random(seed + 2), lengths, settings['hits'], settings['repeat_density'])
+    SyntenyGenerate(os.path.join(outdir, 'synteny.txt'), random.Random(seed + 3), lengths)
+    GffGenerate(os.path.join(outdir, 'scaffolds.gff3'), random.Random(seed + 4), lengths, settings['genes'])
+    with open(params_file,'w') as PARAMS: json.dump(settings, PARAMS)
+    return settings
+
+def ScaleSettings(args): # preset of --scale, overridden by the single options that are given
+    settings = dict(SCALE[args.scale])
+    for dx in settings:
+        if getattr(args, dx) is not None: settings[dx] = getattr(args, dx)
+    return settings
+
+def AddArguments(parser):
+    parser.add_argument('--scale', dest='scale', action = 'store', choices = sorted(SCALE), default = 'tiny', help = 'Preset size of the inputs (default = tiny).')
+    parser.add_argument('--seed', dest='seed', action = 'store', type = int, default = 1, help = 'Random seed, the same seed gives the same files.')
+    parser.add_argument('--scaffolds', dest='scaffolds', action = 'store', type = int, metavar='N', help = 'Number of scaffolds.')
+    parser.add_argument('--genome-size', dest='genome_size', action = 'store', type = int, metavar='BP', help = 'Total scaffold length.')
+    parser.add_argument('--hits', dest='hits', action = 'store', type = int, metavar='N', help = 'Approximate number of BLAST hits.')
+    parser.add_argument('--repeat-density', dest='repeat_density', action = 'store', type = float, metavar='F', help = 'Share of BLAST hits that are repeat bursts (0-1).')
+    parser.add_argument('--genes', dest='genes', action = 'store', type = int, metavar='N', help = 'Number of genes in the GFF3 file.')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='BenchData', description='Generate deterministic synthetic inputs for the SynBuild/ChrBuild benchmarks. Requires python 3.4+')
+    parser.add_argument('OUTDIR', help = 'Output directory.')
+    AddArguments(parser)
+    args = parser.parse_args()
+    print(json.dumps(Generate(args.OUTDIR, args.seed, **ScaleSettings(args))))
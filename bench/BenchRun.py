@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+# Version 2026-10:
+# Benchmark of the SynBuild and ChrBuild pipeline stages on the synthetic inputs of BenchData.py, results written as json.
+# BenchRun.py [--scale tiny|small|large] [-w WORKDIR] [-o results.json] [-j N] [--compare BASELINE.json] [--tolerance F]
+# Every stage reports wall time, cpu time and its own peak RSS (VmHWM is reset before each stage where the kernel allows it).
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import contextlib
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR)) # SynBuild, ChrBuild and FaIndex live one level up
+import BenchData
+import SynBuild
+import ChrBuild
+import FaIndex
+from Profile import PeakReset, PeakRss, ProcRead # same RSS measurement as --profile
+
+class StageLog: # runs the stages one after the other and keeps one result row per stage
+    def __init__(self, quiet = False):
+        self.stages, self.quiet = [], quiet
+
+    def Run(self, name, function, *args):
+        peak_scope = 'stage' if PeakReset() else 'process'
+        rss_start = ProcRead('/proc/self/status').get('VmRSS') # None without /proc
+        wall, cpu = time.perf_counter(), time.process_time()
+        with open(os.devnull,'w') as NULL, contextlib.redirect_stdout(NULL): result = function(*args) # progress output of the tools is not timed on a terminal
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        rss_end, peak = ProcRead('/proc/self/status').get('VmRSS'), PeakRss()
+        self.stages.append({'stage':name, 'seconds':round(wall, 4), 'cpu_seconds':round(cpu, 4), 'rss_start_kb':rss_start, 'rss_end_kb':rss_end, 'peak_rss_kb':peak, 'peak_scope':peak_scope})
+        if not self.quiet: sys.stderr.write('{:<20}{:>10.3f} s{:>12} kB peak\n'.format(name, wall, peak))
+        return result
+
+    def Command(self, name, argv, cwd): # one complete tool run in a child process, peak RSS of the child from wait4
+        wall = time.perf_counter()
+        with open(os.devnull,'w') as NULL: pid = subprocess.Popen([sys.executable] + argv, cwd = cwd, stdout = NULL, stderr = NULL).pid
+        status, usage = os.wait4(pid, 0)[1:]
+        wall = time.perf_counter() - wall
+        peak = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+        self.stages.append({'stage':name, 'seconds':round(wall, 4), 'cpu_seconds':round(usage.ru_utime + usage.ru_stime, 4), 'peak_rss_kb':peak, 'peak_scope':'process', 'exit_code':os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1})
+        if not self.quiet: sys.stderr.write('{:<20}{:>10.3f} s{:>12} kB peak\n'.format(name, wall, peak))
+
+def SynStages(log, data_dir, out_dir, jobs):
+    blast_file, fai_file = os.path.join(data_dir, 'blast.tbl'), os.path.join(data_dir, 'scaffolds.fa.fai')
+    config = SynBuild.SynConfig(output = os.path.join(out_dir, 'bench'))
+    table = log.Run('syn.parse', SynBuild.BlastParse, blast_file, 200, 1 << 26, jobs)
+    hit_list = log.Run('syn.repeat_filter', SynBuild.RepeatFilterBatch, table, config.sensitivity, jobs)
+    group_cache = SynBuild.GroupCache(hit_list, sensitivity = config.sensitivity)
+    pairs = [[dx, ex] for dx in hit_list for ex in hit_list[dx]]
+    log.Run('syn.grouping', lambda: [group_cache.Get(dx, ex, noise) for dx, ex in pairs for noise in [True, False]])
+    scaffold_length = SynBuild.QueryFaiOpen(fai_file, 'Synteny')
+    chr_list = sorted({ex for dx, ex in pairs})
+    log.Run('syn.render', SynBuild.ChrSyntenyAll, chr_list, hit_list, group_cache, scaffold_length, config, jobs)
+    # -a on the chromosome with most hits, ScaffoldAlignment dominates this stage
+    top_chr = max(chr_list, key = lambda ex: sum(len(hit_list[dx].get(ex, [])) for dx in hit_list))
+    align_config = SynBuild.SynConfig(output = os.path.join(out_dir, 'bench_align'), scaf_aligner = True)
+    log.Run('syn.align', SynBuild.ChrSynteny, top_chr, hit_list, group_cache, scaffold_length, align_config)
+    top_scaffold = max(hit_list, key = lambda dx: sum(len(ex) for ex in hit_list[dx].values()))
+    log.Run('syn.scaffold', SynBuild.ScaffoldSynteny, top_scaffold, hit_list, scaffold_length, config)
+    log.Run('syn.gband', SynBuild.GBand, top_scaffold, group_cache, scaffold_length, config)
+    log.Run('syn.summary', SynBuild.BlastSummary, table, hit_list, group_cache, scaffold_length, os.path.join(out_dir, 'bench_BLASTN_summary.txt'))
+
+def ChrStages(log, data_dir, out_dir, jobs):
+    fasta_file = os.path.join(data_dir, 'scaffolds.fa')
+    log.Run('chr.index', FaIndex.FaiBuild, fasta_file, jobs)
+    builder = log.Run('chr.open', ChrBuild.ChrBuilder, fasta_file, ':', False, jobs)
+    header_info, chr_list = ChrBuild.SyntenyRead(os.path.join(data_dir, 'synteny.txt'))
+    records = log.Run('chr.build', lambda: list(builder.Build(chr_list)) + list(builder.Unplaced()))
+    with open(os.path.join(out_dir, 'bench.fa'),'wb') as FAS: log.Run('chr.fasta', builder.WriteFasta, records, FAS)
+    agp_index = log.Run('chr.agp_index', ChrBuild.AgpIndex, ''.join(dx[1] for dx in records).splitlines(), {dx:builder.fai[dx][0] for dx in builder.fai})
+    log.Run('chr.liftover', ChrBuild.LiftFile, os.path.join(data_dir, 'scaffolds.gff3'), os.path.join(out_dir, 'bench.gff3'), os.path.join(out_dir, 'bench.unlifted.gff3'), 'gff', agp_index)
+    builder.close()
+
+def CommandStages(log, data_dir, out_dir, jobs): # the command line tools as a user runs them, including start up and file output
+    tool_dir = os.path.dirname(BENCH_DIR)
+    log.Command('cli.synbuild', [os.path.join(tool_dir, 'SynBuild.py'), os.path.join(data_dir, 'blast.tbl'), os.path.join(data_dir, 'scaffolds.fa.fai'), '-c', '-j', str(jobs), '--nocache', '-o', 'cli'], out_dir)
+    log.Command('cli.chrbuild', [os.path.join(tool_dir, 'ChrBuild.py'), os.path.join(data_dir, 'scaffolds.fa'), os.path.join(data_dir, 'synteny.txt'), '-t', '-j', str(jobs), '-o', 'cli', '-L', os.path.join(data_dir, 'scaffolds.gff3')], out_dir)
+
+def GitRevision():
+    try: return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd = BENCH_DIR, stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError): return ''
+
+def Compare(results, baseline_file, tolerance): # out: stages slower than tolerance x baseline, a table of all shared stages goes to stderr
+    with open(baseline_file,'r') as BASE: baseline = {dx['stage']:dx for dx in json.load(BASE)['stages']}
+    slower = []
+    sys.stderr.write('\n{:<20}{:>12}{:>12}{:>8}{:>14}\n'.format('stage', 'baseline s', 'now s', 'ratio', 'peak kB ratio'))
+    for dx in results['stages']:
+        if dx['stage'] not in baseline: continue
+        base = baseline[dx['stage']]
+        ratio = dx['seconds'] / base['seconds'] if base['seconds'] else 1.0
+        memory = dx['peak_rss_kb'] / base['peak_rss_kb'] if base['peak_rss_kb'] else 1.0
+        slow = ratio > tolerance and dx['seconds'] - base['seconds'] > 0.05 # timer noise of very short stages is not a regression
+        if slow: slower.append(dx['stage'])
+        sys.stderr.write('{:<20}{:>12.3f}{:>12.3f}{:>8.2f}{:>14.2f}{}\n'.format(dx['stage'], base['seconds'], dx['seconds'], ratio, memory, '  SLOWER' if slow else ''))
+    return slower
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog='BenchRun', description='Time the SynBuild/ChrBuild stages on deterministic synthetic data and write the results as json. Requires python 3.4+')
+    BenchData.AddArguments(parser)
+    parser.add_argument('-w', dest='workdir', action = 'store', default = 'bench_data', metavar='DIR', help = 'Directory of the generated inputs, reused while the settings are the same (default = bench_data).')
+    parser.add_argument('-o', dest='output', action = 'store', default = 'bench_results.json', metavar='FILE', help = 'Json result file (default = bench_results.json).')
+    parser.add_argument('-j', dest='jobs', action = 'store', type = int, default = 1, metavar='N', help = 'Worker processes for the stages that support them (default = 1).')
+    parser.add_argument('--stages', dest='stages', action = 'store', default = 'syn,chr,cli', metavar='LIST', help = 'Comma separated stage groups to run: syn, chr, cli (default = all).')
+    parser.add_argument('--compare', dest='compare', action = 'store', default = '', metavar='FILE', help = 'Earlier result file, stages slower than --tolerance times the baseline give exit code 2.')
+    parser.add_argument('--tolerance', dest='tolerance', action = 'store', type = float, default = 1.2, metavar='F', help = 'Allowed slow down against --compare (default = 1.2).')
+    parser.add_argument('-q', dest='quiet', action = 'store_true', default = False, help = 'No progress output.')
+    args = parser.parse_args(argv)
+
+    if not args.quiet: sys.stderr.write('Generating inputs in {}\n'.format(args.workdir))
+    settings = BenchData.Generate(os.path.join(args.workdir, 'input'), args.seed, **BenchData.ScaleSettings(args))
+    out_dir = os.path.join(args.workdir, 'output')
+    shutil.rmtree(out_dir, ignore_errors = True)
+    os.makedirs(out_dir)
+    log, groups = StageLog(args.quiet), args.stages.split(',')
+    data_dir = os.path.join(args.workdir, 'input')
+    if 'syn' in groups: SynStages(log, data_dir, out_dir, args.jobs)
+    if 'chr' in groups: ChrStages(log, data_dir, out_dir, args.jobs)
+    if 'cli' in groups: CommandStages(log, data_dir, out_dir, args.jobs)
+    results = {'settings':dict(settings, scale = args.scale, jobs = args.jobs), 'machine':{'python':platform.python_version(), 'platform':platform.platform(), 'cpus':os.cpu_count()},
+               'revision':GitRevision(), 'date':time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages':log.stages}
+    with open(args.output,'w') as OUT: json.dump(results, OUT, indent = 1)
+    if args.compare and Compare(results, args.compare, args.tolerance): return 2
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,178 @@
+# Regression tests of ChrBuild.py, run with: python -m pytest tests
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # ChrBuild lives one level up
+import pytest
+import ChrBuild
+
+def FastaRead(fasta_file): # out: {name:sequence}
+    records, name = {}, None
+    with open(fasta_file,'r') as FAS:
+        for line in FAS:
+            if line[0] == '>': name = line[1:].split()[0]; records[name] = []
+            else: records[name].append(line.strip())
+    return {dx:''.join(ex) for dx, ex in records.items()}
+
+def test_split_scaffold_coordinates(tmp_path, monkeypatch):
+    # Scaffold:start-end is 1-based inclusive on the strand given in the synteny line, the fasta has end-start+1 bases as the AGP says.
+    # Before 2026-10 the fasta got the 0-based slice [start:end] (one base less per piece) and K/M/G in split coordinates failed.
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(3)
+    scaffolds = {'Scaf_A':''.join(rng.choice('ACGT') for dx in range(3000)), 'Scaf_B':''.join(rng.choice('ACGT') for dx in range(2500))}
+    with open('scaf.fa','w') as FAS: FAS.write(''.join('>' + dx + '\n' + '\n'.join(ex[cx:cx+60] for cx in range(0, len(ex), 60)) + '\n' for dx, ex in scaffolds.items()))
+    with open('syn.txt','w') as SYN: SYN.write('Mus test\t10090\tasm1\t01-January-20\tIGC\tdesc\tcomment\nChr1 Scaf_A:11-20,+5,-Scaf_A:1-10\nChr2 Scaf_B:1-1K,Scaf_B:1001-2K\n')
+    assert ChrBuild.main(['scaf.fa', 'syn.txt', '-H', '--nocache', '-o', 'out']) == 0
+    with open('out.agp','r') as AGP: agp = [dx.rstrip('\n').split('\t') for dx in AGP]
+    assert agp == [['Chr1', '1', '10', '1', 'W', 'Scaf_A[11-20]', '1', '10', '+'],
+                   ['Chr1', '11', '15', '2', 'N', '5', 'scaffold', 'no', 'na'],
+                   ['Chr1', '16', '25', '3', 'W', 'Scaf_A[1-10]', '1', '10', '-'],
+                   ['Chr2', '1', '1000', '1', 'W', 'Scaf_B[1-1000]', '1', '1000', '+'],
+                   ['Chr2', '1001', '2000', '2', 'W', 'Scaf_B[1001-2000]', '1', '1000', '+']]
+    fasta = FastaRead('out.fa')
+    assert fasta['Chr1'] == scaffolds['Scaf_A'][10:20] + 'N' * 5 + ChrBuild.Reverse(scaffolds['Scaf_A'])[0:10]
+    assert fasta['Chr2'] == scaffolds['Scaf_B'][0:2000]
+
+def FastaWrite(fasta_file, records, width = 60): # records: {name:sequence}
+    with open(fasta_file,'w') as FAS: FAS.write(''.join('>' + dx + '\n' + '\n'.join(ex[cx:cx+width] for cx in range(0, len(ex), width)) + '\n' for dx, ex in records.items()))
+
+def CachedBuild(fasta_file, lines, output, monkeypatch): # out: names of the records built (not copied from the build cache), output fasta as text
+    builder, built = ChrBuild.ChrBuilder(fasta_file), []
+    write_fasta = builder.WriteFasta
+    def WriteFasta(records, handle, *args, **kwargs):
+        built.extend(dx[0] for dx in records)
+        return write_fasta(records, handle, *args, **kwargs)
+    monkeypatch.setattr(builder, 'WriteFasta', WriteFasta)
+    builder.WriteFastaFile(list(builder.Build(lines)), output)
+    with open(output,'r') as FAS: return built, FAS.read()
+
+def NocacheBuild(fasta_file, lines, output):
+    builder = ChrBuild.ChrBuilder(fasta_file)
+    builder.WriteFastaFile(list(builder.Build(lines)), output, cache = False)
+    with open(output,'r') as FAS: return FAS.read()
+
+@pytest.fixture
+def build_input(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(5)
+    scaffolds = {'Scaf_' + str(cx):''.join(rng.choice('ACGTacgt') for dx in range(rng.randint(500, 3000))) for cx in range(8)}
+    FastaWrite('scaf.fa', scaffolds)
+    return scaffolds, ['Chr1 Scaf_0,+100,-Scaf_1', 'Chr2 Scaf_2:1-400,+20,Scaf_3', 'Chr3 -Scaf_4,+50,Scaf_5', 'Chr4 Scaf_6,Scaf_2:401-500']
+
+def test_build_cache_fasta_edit(build_input, monkeypatch):
+    # a changed base in the scaffold fasta is never copied from the old output, the result equals a build without the cache
+    scaffolds, lines = build_input
+    assert CachedBuild('scaf.fa', lines, 'out.fa', monkeypatch)[0] == ['Chr1', 'Chr2', 'Chr3', 'Chr4']
+    assert CachedBuild('scaf.fa', lines, 'out.fa', monkeypatch)[0] == [] # nothing changed, every record is copied
+    scaffolds['Scaf_3'] = scaffolds['Scaf_3'][:200] + ('A' if scaffolds['Scaf_3'][200] != 'A' else 'C') + scaffolds['Scaf_3'][201:]
+    FastaWrite('scaf.fa', scaffolds)
+    stat = os.stat('scaf.fa')
+    os.utime('scaf.fa', ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9)) # same size, the mtime has to tell the edit apart
+    built, fasta = CachedBuild('scaf.fa', lines, 'out.fa', monkeypatch)
+    assert 'Chr2' in built
+    assert fasta == NocacheBuild('scaf.fa', lines, 'nocache.fa')
+    assert FastaRead('out.fa')['Chr2'][420:] == scaffolds['Scaf_3'].upper()
+
+def test_build_cache_synteny_edit(build_input, monkeypatch):
+    # only the record of a changed synteny line is built again
+    scaffolds, lines = build_input
+    CachedBuild('scaf.fa', lines, 'out.fa', monkeypatch)
+    lines[2] = 'Chr3 -Scaf_4,+60,Scaf_5'
+    built, fasta = CachedBuild('scaf.fa', lines, 'out.fa', monkeypatch)
+    assert built == ['Chr3']
+    assert fasta == NocacheBuild('scaf.fa', lines, 'nocache.fa')
+    assert sorted(os.listdir('.')) == ['nocache.fa', 'out.fa', 'out.fa.buildcache', 'scaf.fa', 'scaf.fa.fai']
+
+# Liftover of one record per format through a hand written AGP:
+# ChrA = Scaf_1 (+), 10 N, Scaf_2 (-)          ChrB = Scaf_3[1-20] (+), 5 N, Scaf_3[1-20] (-) = reverse complement of Scaf_3 31-50
+LIFT_AGP = ['ChrA\t1\t100\t1\tW\tScaf_1\t1\t100\t+\n', 'ChrA\t101\t110\t2\tN\t10\tscaffold\tno\tna\n', 'ChrA\t111\t170\t3\tW\tScaf_2\t1\t60\t-\n',
+            'ChrB\t1\t20\t1\tW\tScaf_3[1-20]\t1\t20\t+\n', 'ChrB\t21\t25\t2\tN\t5\tscaffold\tno\tna\n', 'ChrB\t26\t45\t3\tW\tScaf_3[1-20]\t1\t20\t-\n']
+
+@pytest.fixture
+def lift_input(tmp_path, monkeypatch): # out: [AgpIndex, FastaSeq of the scaffolds, {chr:sequence} as the AGP builds it, scaffolds]
+    monkeypatch.chdir(tmp_path)
+    rng = random.Random(11)
+    scaffolds = {'Scaf_1':100, 'Scaf_2':60, 'Scaf_3':50, 'Scaf_4':30}
+    scaffolds = {dx:''.join(rng.choice('ACGT') for cx in range(ex)) for dx, ex in scaffolds.items()}
+    FastaWrite('scaf.fa', scaffolds)
+    chrs = {'ChrA':scaffolds['Scaf_1'] + 'N' * 10 + ChrBuild.Reverse(scaffolds['Scaf_2']), 'ChrB':scaffolds['Scaf_3'][:20] + 'N' * 5 + ChrBuild.Reverse(scaffolds['Scaf_3'])[:20]}
+    fai = ChrBuild.FaiOpen('scaf.fa')
+    fas = ChrBuild.FastaSeq('scaf.fa', fai)
+    yield [ChrBuild.AgpIndex(LIFT_AGP, {dx:ex[0] for dx, ex in fai.items()}), fas, chrs, scaffolds]
+    fas.close()
+
+def Lift(lines, record_format, agp_index, fas = None): # out: [lifted lines, unlifted lines, {reason:count}]
+    with open('in.txt','w') as IN: IN.write(''.join(dx + '\n' for dx in lines))
+    lifted, unlifted = ChrBuild.LiftFile('in.txt', 'out.txt', 'unlifted.txt', record_format, agp_index, fas)
+    with open('out.txt','r') as OUT: out = [dx.rstrip('\n') for dx in OUT]
+    assert len([dx for dx in out if dx[:1] != '#' and '\t' in dx]) == lifted
+    if not os.path.exists('unlifted.txt'): return [out, [], unlifted]
+    with open('unlifted.txt','r') as UNLIFTED: return [out, [dx.rstrip('\n') for dx in UNLIFTED], unlifted]
+
+def test_agp_index_component_borders(lift_input):
+    agp_index = lift_input[0]
+    assert agp_index.objects == {'ChrA':170, 'ChrB':45}
+    assert agp_index.Lift('Scaf_1', 1, 1) == ['ChrA', 1, 1, False] and agp_index.Lift('Scaf_1', 100, 100) == ['ChrA', 100, 100, False]
+    assert agp_index.Lift('Scaf_2', 1, 1) == ['ChrA', 170, 170, True] and agp_index.Lift('Scaf_2', 60, 60) == ['ChrA', 111, 111, True]
+    assert agp_index.Lift('Scaf_3', 20, 20) == ['ChrB', 20, 20, False] and agp_index.Lift('Scaf_3', 21, 21) is None
+    assert agp_index.Lift('Scaf_3', 30, 30) is None and agp_index.Lift('Scaf_3', 31, 31) == ['ChrB', 45, 45, True] and agp_index.Lift('Scaf_3', 50, 50) == ['ChrB', 26, 26, True]
+    assert agp_index.Lift('Scaf_1', 100, 101) is None and agp_index.Lift('Scaf_3', 15, 35) is None
+    assert agp_index.Why('Scaf_3', 15, 35) == 'across the gap between two scaffold components'
+    assert agp_index.Why('Scaf_3', 15, 25) == 'partly outside the used scaffold regions'
+    assert agp_index.Why('Scaf_3', 22, 28) == 'outside the used scaffold regions'
+    assert agp_index.Why('Scaf_4', 1, 5) == 'scaffold not in the assembly'
+
+def test_liftover_gff(lift_input):
+    agp_index, fas, chrs, scaffolds = lift_input
+    out, unlifted, reasons = Lift(['##gff-version 3', '##sequence-region Scaf_1 1 100', 'Scaf_1\tsrc\tgene\t5\t10\t.\t+\t.\tID=a', 'Scaf_2\tsrc\tgene\t1\t10\t.\t+\t.\tID=b',
+        'Scaf_3\tsrc\tgene\t31\t35\t.\t-\t.\tID=c', 'Scaf_3\tsrc\tgene\t15\t35\t.\t+\t.\tID=d', 'Scaf_4\tsrc\tgene\t1\t5\t.\t+\t.\tID=e', 'Scaf_1\tsrc\tgene\tx\t5\t.\t+\t.\tID=f'], 'gff', agp_index)
+    assert out == ['##gff-version 3', 'ChrA\tsrc\tgene\t5\t10\t.\t+\t.\tID=a', 'ChrA\tsrc\tgene\t161\t170\t.\t-\t.\tID=b', 'ChrB\tsrc\tgene\t41\t45\t.\t+\t.\tID=c']
+    assert chrs['ChrA'][160:170] == ChrBuild.Reverse(scaffolds['Scaf_2'][0:10]) and chrs['ChrB'][40:45] == ChrBuild.Reverse(scaffolds['Scaf_3'][30:35])
+    assert [dx.split('\t')[-1] for dx in unlifted] == ['ID=d', 'ID=e', 'ID=f']
+    assert reasons == {'across the gap between two scaffold components':1, 'scaffold not in the assembly':1, 'malformed':1}
+
+def test_liftover_bed(lift_input):
+    agp_index, fas, chrs, scaffolds = lift_input
+    out, unlifted, reasons = Lift(['track name=t', 'Scaf_1\t0\t100\tp\t0\t+', 'Scaf_2\t0\t10\tq\t0\t+\t0\t10\t0\t2\t3,4,\t0,6,', 'Scaf_3\t19\t21\tr'], 'bed', agp_index)
+    # blocks 1-3 and 7-10 of Scaf_2 are ChrA 168-170 and 161-164 on the other strand
+    assert out == ['track name=t', 'ChrA\t0\t100\tp\t0\t+', 'ChrA\t160\t170\tq\t0\t-\t160\t170\t0\t2\t4,3,\t0,7,']
+    assert unlifted == ['Scaf_3\t19\t21\tr'] and reasons == {'partly outside the used scaffold regions':1}
+
+def test_liftover_vcf(lift_input):
+    agp_index, fas, chrs, scaffolds = lift_input
+    Scaf_1, Scaf_2 = scaffolds['Scaf_1'], scaffolds['Scaf_2']
+    records = ['Scaf_1\t10\t.\t' + Scaf_1[9] + '\tN\t.\t.\t.', # SNP on a + component
+               'Scaf_2\t5\t.\t' + Scaf_2[4] + '\t' + ('A' if Scaf_2[4] != 'A' else 'C') + '\t.\t.\t.', # SNP on a - component
+               'Scaf_2\t5\t.\t' + Scaf_2[4:6] + '\t' + Scaf_2[4] + '\t.\t.\t.', # deletion of base 6, the padding base moves to base 7
+               'Scaf_3\t25\t.\tA\tC\t.\t.\t.']
+    out, unlifted, reasons = Lift(['##fileformat=VCFv4.2', '##contig=<ID=Scaf_1,length=100>', '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO'] + records, 'vcf', agp_index, fas)
+    assert out[:4] == ['##fileformat=VCFv4.2', '##contig=<ID=ChrA,length=170>', '##contig=<ID=ChrB,length=45>', '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO']
+    lifted = [dx.split('\t') for dx in out[4:]]
+    assert [dx[:2] for dx in lifted] == [['ChrA', '10'], ['ChrA', '166'], ['ChrA', '164']]
+    for chr_name, pos, id_, ref, alt in [dx[:5] for dx in lifted]: assert chrs[chr_name][int(pos) - 1:int(pos) - 1 + len(ref)] == ref # REF reads off the new sequence
+    assert lifted[1][3] == ChrBuild.Reverse(Scaf_2[4]) and lifted[1][4] == ChrBuild.Reverse(records[1].split('\t')[4])
+    assert lifted[2][3] == ChrBuild.Reverse(Scaf_2[5:7]) and lifted[2][4] == ChrBuild.Reverse(Scaf_2[6])
+    assert reasons == {'outside the used scaffold regions':1} and unlifted == records[3:]
+    out, unlifted, reasons = Lift([records[2]], 'vcf', agp_index) # without the scaffold fasta the padding base is not known
+    assert out == [] and reasons == {'indel on a reverse complemented scaffold needs the scaffold fasta':1}
+
+def test_liftover_paf(lift_input):
+    agp_index = lift_input[0]
+    out, unlifted, reasons = Lift(['q1\t50\t0\t10\t+\tScaf_2\t60\t0\t10\t10\t10\t60\tcg:Z:3M1I6M', 'q2\t50\t0\t10\t+\tScaf_1\t100\t20\t30\t10\t10\t60',
+                                   'q3\t50\t0\t10\t*\tScaf_2\t60\t20\t30\t10\t10\t60', 'q4\t50\t0\t10\t-\tScaf_1\t100\t95\t105\t10\t10\t60'], 'paf', agp_index)
+    assert out == ['q1\t50\t0\t10\t-\tChrA\t170\t160\t170\t10\t10\t60\tcg:Z:6M1I3M', 'q2\t50\t0\t10\t+\tChrA\t170\t20\t30\t10\t10\t60']
+    assert reasons == {'malformed':1, 'partly outside the used scaffold regions':1} and len(unlifted) == 2
+    out, unlifted, reasons = Lift(['Scaf_3\t50\t30\t35\t+\tt1\t80\t0\t5\t5\t5\t60'], 'paf_query', agp_index)
+    assert out == ['ChrB\t45\t40\t45\t-\tt1\t80\t0\t5\t5\t5\t60'] and reasons == {}
+
+def test_jobs_equal_serial(build_input):
+    # -j writes the records in worker processes, the output files equal the single process run
+    scaffolds, lines = build_input
+    with open('syn.txt','w') as SYN: SYN.write('Mus test\t10090\tasm1\t01-January-20\tIGC\tdesc\tcomment\n' + ''.join(dx + '\n' for dx in lines))
+    for jobs in ['1', '2', '3']: assert ChrBuild.main(['scaf.fa', 'syn.txt', '-t', '-m', '--nocache', '-j', jobs, '-o', 'j' + jobs]) == 0
+    for suffix in ['.fa', '.agp', '.txt']:
+        with open('j1' + suffix,'r') as ONE: serial = ONE.read()
+        for jobs in ['2', '3']:
+            with open('j' + jobs + suffix,'r') as MANY: assert MANY.read() == serial, jobs + suffix
+    assert sorted(FastaRead('j1.fa')) == ['Chr1', 'Chr2', 'Chr3', 'Chr4', 'Scaf_7']
@@ -0,0 +1,94 @@
+# Regression tests of FaIndex.py, run with: python -m pytest tests
+import os
+import sys
+import zlib
+import random
+import struct
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # FaIndex lives one level up
+import pytest
+import FaIndex
+import ChrBuild
+
+def FastaText(records, width = 60): # records: [[name, sequence]], out: fasta as bytes
+    return b''.join(b'>' + dx.encode() + b' description\n' + b''.join(ex[cx:cx + width].encode() + b'\n' for cx in range(0, len(ex), width)) for dx, ex in records)
+
+def BgzfWrite(data, path, block_size = 4000): # bgzip layout: gzip members of at most 64 KB with the BC extra field, empty member at the end
+    with open(path,'wb') as BGZ:
+        for cx in list(range(0, len(data), block_size)) + [len(data)]:
+            chunk = data[cx:cx + block_size]
+            deflate = zlib.compressobj(6, zlib.DEFLATED, -15)
+            body = deflate.compress(chunk) + deflate.flush()
+            BGZ.write(b'\x1f\x8b\x08\x04' + b'\0' * 4 + b'\0\xff' + struct.pack('<H', 6) + b'BC' + struct.pack('<HH', 2, 25 + len(body)) + body + struct.pack('<II', zlib.crc32(chunk), len(chunk)))
+
+def FaiExpected(records, width = 60): # samtools faidx index of FastaText(records, width)
+    fai, offset = [], 0
+    for name, seq in records:
+        offset += len('>' + name + ' description\n')
+        fai.append([name, len(seq), offset, width, width + 1])
+        offset += len(seq) + -(-len(seq) // width)
+    return fai
+
+@pytest.fixture
+def fasta_records():
+    rng = random.Random(13)
+    return [['Scaf_' + str(cx), ''.join(rng.choice('ACGTN') for dx in range(rng.randint(1, 900)))] for cx in range(40)] + [['Scaf_60', 'A' * 60]]
+
+def test_fai_plain_and_bgzip(tmp_path, fasta_records):
+    data = FastaText(fasta_records)
+    with open(str(tmp_path / 'plain.fa'),'wb') as FAS: FAS.write(data)
+    BgzfWrite(data, str(tmp_path / 'bgzip.fa.gz'))
+    assert FaIndex.FaiBuild(str(tmp_path / 'plain.fa')) == FaiExpected(fasta_records)
+    assert FaIndex.FaiBuild(str(tmp_path / 'bgzip.fa.gz')) == FaiExpected(fasta_records) # offsets are uncompressed positions, as samtools writes them
+    assert not FaIndex.IsBgzf(str(tmp_path / 'plain.fa')) and FaIndex.IsBgzf(str(tmp_path / 'bgzip.fa.gz'))
+    plain, bgzip = FaIndex.FastaMap(str(tmp_path / 'plain.fa')), FaIndex.FastaMap(str(tmp_path / 'bgzip.fa.gz'))
+    assert len(bgzip) == len(data) and bgzip[:] == data
+    for start, end in [[0, 1], [3990, 4010], [100, 12000], [len(data) - 5, len(data)], [len(data) - 5, len(data) + 100]]: assert bgzip[start:end] == plain[start:end]
+    plain.close()
+    bgzip.close()
+    fai = FaIndex.FaiOpen(str(tmp_path / 'bgzip.fa.gz'))
+    fas, name = ChrBuild.FastaSeq(str(tmp_path / 'bgzip.fa.gz'), fai), fasta_records[7][0]
+    assert fas.Fetch(name, softmask = True).decode() == fasta_records[7][1] and fas.Fetch(name, rc = True, softmask = True, start = 5, end = 50).decode() == ChrBuild.Reverse(fasta_records[7][1][5:50])
+    fas.close()
+
+def test_gzi_round_trip(tmp_path, fasta_records):
+    path = str(tmp_path / 'bgzip.fa.gz')
+    BgzfWrite(FastaText(fasta_records), path, block_size = 1000)
+    gzi = FaIndex.GziOpen(path) # built from the block headers and written to path.gzi
+    assert gzi == FaIndex.GziBuild(path) and len(gzi) > 10 and gzi[0] == [0, 0]
+    assert [dx[1] for dx in gzi[:-1]] == list(range(0, len(gzi) * 1000 - 1000, 1000)) # uncompressed start of every block, the empty last block included
+    with open(path + '.gzi','rb') as GZI: assert int.from_bytes(GZI.read(8),'little') == len(gzi) - 1 # the first block is implicit
+    assert FaIndex.GziOpen(path) == gzi # read back from the file
+    assert sorted(os.listdir(str(tmp_path))) == ['bgzip.fa.gz', 'bgzip.fa.gz.gzi']
+    with open(str(tmp_path / 'plain.fa'),'wb') as FAS: FAS.write(FastaText(fasta_records))
+    with pytest.raises(ValueError): FaIndex.GziBuild(str(tmp_path / 'plain.fa'))
+
+def test_fai_parallel_equals_serial(tmp_path, fasta_records):
+    path = str(tmp_path / 'plain.fa')
+    with open(path,'wb') as FAS: FAS.write(FastaText(fasta_records))
+    data, serial = FastaText(fasta_records), FaIndex.FaiBuild(path)
+    for jobs, chunk_size in [[2, len(data) // 2], [3, len(data) // 3], [7, 1000]]:
+        bounds = [len(data) * cx // jobs for cx in range(1, jobs)] # a record crossing a range border is indexed by the range of its header
+        assert any(data[dx:dx + 1] != b'>' for dx in bounds)
+        assert FaIndex.FaiBuild(path, jobs, chunk_size) == serial
+
+def test_fai_open_rebuilds_stale_index(tmp_path, fasta_records):
+    path = str(tmp_path / 'plain.fa')
+    with open(path,'wb') as FAS: FAS.write(FastaText(fasta_records[:5]))
+    assert FaIndex.FaiOpen(path) == {dx[0]:dx[1:] for dx in FaiExpected(fasta_records[:5])}
+    with open(path + '.fai','r') as FAI: assert [dx.rstrip('\n').split('\t') for dx in FAI] == [list(map(str, dx)) for dx in FaiExpected(fasta_records[:5])]
+    with open(path,'wb') as FAS: FAS.write(FastaText(fasta_records[3:9]))
+    stat = os.stat(path + '.fai')
+    os.utime(path, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10**9)) # the fasta is newer than its index
+    assert FaIndex.FaiOpen(path) == {dx[0]:dx[1:] for dx in FaiExpected(fasta_records[3:9])}
+    assert FaIndex.FaiOpen(path) == {dx[0]:dx[1:] for dx in FaiExpected(fasta_records[3:9])} # read from the new index
+    assert sorted(os.listdir(str(tmp_path))) == ['plain.fa', 'plain.fa.fai']
+
+@pytest.mark.parametrize('body', [b'ACGT\nACG\nACGT\n', b'ACGT\nACGTA\nAC\n', b'ACGT\n\nACGT\n', b'ACGT\r\nACGT\nAC\n'])
+def test_fai_ragged_lines(tmp_path, body):
+    # only the last line of a record may be shorter, as samtools faidx requires
+    data = b'>good\nACGTACGT\nACG\n>bad\n' + body + b'>last\nAC\n'
+    with open(str(tmp_path / 'plain.fa'),'wb') as FAS: FAS.write(data)
+    BgzfWrite(data, str(tmp_path / 'bgzip.fa.gz'), block_size = 7)
+    for path in [str(tmp_path / 'plain.fa'), str(tmp_path / 'bgzip.fa.gz')]:
+        with pytest.raises(ValueError, match = 'bad'): FaIndex.FaiBuild(path)
@@ -0,0 +1,215 @@
+# Regression tests of SynBuild.py, run with: python -m pytest tests
+import os
+import sys
+import random
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # SynBuild lives one level up
+import pytest
+import SynBuild
+
+def SyntenyTable(outdir, seed = 1, scaffolds = 30): # out: [blast.tbl, scaffolds.fa.fai], scaffolds with co-linear hits on one or two chromosomes
+    rng, chrs, rows, lengths = random.Random(seed), ['chr1', 'chr2', 'chr3', 'chrX', 'chr7'], [], {}
+    for cx in range(scaffolds):
+        name, length = 'Scaf_' + str(cx), rng.randint(2000000, 12000000)
+        lengths[name] = length
+        blocks = [[rng.choice(chrs), rng.randint(0, 100000000), rng.random() < 0.3] for dx in range(2 if rng.random() < 0.3 else 1)]
+        size = length // len(blocks)
+        for ex, (chr_name, offset, reverse) in enumerate(blocks):
+            que = ex * size + rng.randint(1, 5000)
+            while que < (ex + 1) * size - 2000:
+                hit = rng.randint(100, 1500)
+                ref = offset + size - (que - ex * size) if reverse else max(1, offset + que - ex * size + rng.randint(-200, 200))
+                rows.append([name, chr_name, '{:.2f}'.format(rng.uniform(80, 100)), str(hit), str(rng.randint(0, 40)), '0', str(que), str(que + hit), str(ref + hit if reverse else ref), str(ref if reverse else ref + hit), '0.0', '500'])
+                que += rng.randint(2000, 30000)
+    rows.sort(key = lambda dx: dx[:2]) # BLAST output is grouped on query and subject
+    with open(os.path.join(outdir, 'blast.tbl'),'w') as BLAST: BLAST.write(''.join('\t'.join(dx) + '\n' for dx in rows))
+    with open(os.path.join(outdir, 'scaffolds.fa.fai'),'w') as FAI: FAI.write(''.join('{}\t{}\t0\t60\t61\n'.format(dx, ex) for dx, ex in lengths.items()))
+    return [os.path.join(outdir, 'blast.tbl'), os.path.join(outdir, 'scaffolds.fa.fai')]
+
+@pytest.fixture(scope = 'module')
+def synteny_input(tmp_path_factory):
+    return SyntenyTable(str(tmp_path_factory.mktemp('input')))
+
+def test_align_all_matches_single_chromosome(synteny_input, tmp_path, monkeypatch):
+    # -c -a aligns the scaffolds of every chromosome against that chromosome, the figure equals the one of -c CHROM -a
+    monkeypatch.chdir(tmp_path)
+    assert SynBuild.main(synteny_input + ['-c', '-a', '--nocache', '-o', 'all']) == 0
+    chr_files = sorted(dx for dx in os.listdir(str(tmp_path)) if dx.startswith('all_'))
+    assert len(chr_files) > 1
+    for chr_file in chr_files:
+        chr_name = chr_file[len('all_'):-len('.svg')]
+        with open(chr_file,'r') as ALL: figure = ALL.read()
+        for name in [chr_name, chr_name.upper()]: # -c takes the chromosome name in any case
+            assert SynBuild.main(synteny_input + ['-c', name, '-a', '--nocache', '-o', 'one']) == 0
+            with open('one_' + chr_name + '.svg','r') as ONE: assert ONE.read() == figure, name
+
+def test_blast_summary_counts_all_rows(tmp_path, monkeypatch):
+    # -b hit counts are totals over all BLAST rows of a scaffold/chr pair (any E value), also when the pair comes back in a later run of rows
+    monkeypatch.chdir(tmp_path)
+    rows, runs = [], [['Scaf_0', 'chr1', 0, 20], ['Scaf_0', 'chr2', 0, 10], ['Scaf_0', 'chr1', 20, 20], ['Scaf_1', 'chr2', 0, 15]]
+    for name, chr_name, first, count in runs:
+        for cx in range(first, first + count):
+            que, ref = 10000 + cx * 20000, 5000000 + cx * 20000 + (30000000 if chr_name == 'chr2' else 0)
+            rows.append([name, chr_name, '90.00', '1000', '10', '0', str(que), str(que + 999), str(ref), str(ref + 999), '1e-10' if cx % 10 == 9 else '0.0', '500'])
+    with open('blast.tbl','w') as BLAST: BLAST.write(''.join('\t'.join(dx) + '\n' for dx in rows))
+    with open('scaffolds.fa.fai','w') as FAI: FAI.write('Scaf_0\t900000\t0\t60\t61\nScaf_1\t400000\t0\t60\t61\n')
+    assert SynBuild.main(['blast.tbl', 'scaffolds.fa.fai', '-b', '--nocache']) == 0
+    with open(os.path.basename(str(tmp_path)) + '_BLASTN_summary.txt','r') as SUMMARY: report = SUMMARY.read()
+    assert 'Amount of scaffolds: 2\n' in report
+    assert 'Combined scaffold length: 1300000 bp\n' in report
+    counts = [dx.split('\t')[:3] for dx in report.split('# ...')[1].splitlines()]
+    assert ['Scaf_0', '900000', '50'] in counts and ['Scaf_1', '400000', '15'] in counts
+    assert ['chr1', '40'] in [dx[:2] for dx in counts] # 20 + 20 rows in two separate runs, the old report counted the last run only (20)
+    assert ['chr2', '10'] in [dx[:2] for dx in counts] and ['chr2', '15'] in [dx[:2] for dx in counts]
+
+def OldHitPaths(hit_list, scaffold_name, length, offset): # -s hit paths as drawn by SynBuild before the ribbons (scaffold box rows 300/400)
+    all_hits = [hit for chrom in hit_list[scaffold_name] for hit in hit_list[scaffold_name][chrom]]
+    first, last = min(all_hits), max(all_hits)
+    reverse, chr_median = last[1] < first[1], min(statistics.median([dx[1] for dx in all_hits]), 175000000)
+    paths, order = set(), sorted(hit_list[scaffold_name], key = lambda dx: -len(hit_list[scaffold_name][dx]))
+    for cx, chr_name in enumerate(order):
+        if cx == 0: cx = -1
+        for rec in hit_list[scaffold_name][chr_name]:
+            if cx == -1:
+                if reverse == True: paths.add('<path d= "M ' + str(int(rec[1])/1e5) + ' ' + str(300 + cx*200) +' L ' + str(int(rec[1])/1e5) + ' ' + str(400+ cx*200) + ' L ' + str(int(int(length)/1e5 - int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 300 L ' + str(int(int(length)/1e5 - int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 400" fill = "none" stroke = "' + SynBuild.HIT_COLOR[chr_name] + '" stroke-width="1" />')
+                else: paths.add('<path d= "M ' + str(int(rec[1])/1e5) + ' ' + str(300 + cx*200) +' L ' + str(int(rec[1])/1e5) + ' ' + str(400+ cx*200) + ' L ' + str(int(int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 300 L ' + str(int(int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 400" fill = "none" stroke = "' + SynBuild.HIT_COLOR[chr_name] + '" stroke-width="1" />')
+            else:
+                if reverse == True: paths.add('<path d= "M ' + str(int(int(length)/1e5 - int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 300 L ' + str(int(int(length)/1e5 - int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 400 L ' + str(int(rec[1])/1e5) + ' ' + str(300 + cx*200) +' L ' + str(int(rec[1])/1e5) + ' ' + str(400+ cx*200) +'" fill = "none" stroke = "' + SynBuild.HIT_COLOR[chr_name] + '" stroke-width="1" />')
+                else: paths.add('<path d= "M ' + str(int(int(rec[0])/1e5 + chr_median/1e5 + offset)) + ' 300 L ' + str(int(int(rec[0])/1e5) + chr_median/1e5 + offset) + ' 400 L ' + str(int(rec[1])/1e5) + ' ' + str(300 + cx*200) +' L ' + str(int(rec[1])/1e5) + ' ' + str(400+ cx*200) +'" fill = "none" stroke = "'+ SynBuild.HIT_COLOR[chr_name] + '" stroke-width="1" />')
+    return paths
+
+@pytest.mark.parametrize('reverse', [False, True])
+def test_full_detail_matches_old_renderer(tmp_path, reverse):
+    # --full-detail draws the same hit paths as -s did before the ribbons, including the untruncated x of the other chromosome rows
+    rng, length = random.Random(7), 2500000
+    hits = {'chr3':[], 'chr1':[]}
+    for cx in range(40):
+        que = 20000 + cx * 60000 + rng.randint(0, 999)
+        hits['chr3'].append((que, 61234567 + (length - que if reverse else que)))
+    hits['chr1'].extend((rng.randint(100000, 2000000), rng.randint(1, 90000000)) for cx in range(12)) # inside the chr3 hits, the chr3 ends set the orientation
+    hit_list = {'Scaf_0':hits}
+    assert (max(hits['chr3'])[1] < min(hits['chr3'])[1]) == reverse
+    config = SynBuild.SynConfig(output = str(tmp_path / 's'), full_detail = True, offset = SynBuild.OffsetParse('35K'))
+    SynBuild.ScaffoldSynteny('Scaf_0', hit_list, {'Scaf_0':length}, config)
+    with open(str(tmp_path / 's_Scaf_0.svg'),'r') as SVG: paths = set(dx.strip() for dx in SVG if 'stroke-width="1"' in dx)
+    assert paths == OldHitPaths(hit_list, 'Scaf_0', length, config.offset)
+
+def test_hit_ribbons_merge_runs():
+    # bins one unit apart on the scaffold join into one ribbon when the chromosome x keeps moving one way, in either direction
+    scaffold_x = lambda que: que / 1e5
+    forward = list(SynBuild.HitRibbons([(cx * 100000, (10 + cx) * 100000) for cx in range(5)], -1, scaffold_x, '#000'))
+    assert forward == ['<path d= "M 10 100 L 10 200 L 0 300 L 0 400 L 4 400 L 4 300 L 14 200 L 14 100 Z" fill = "#000" fill-opacity = "0.9" stroke = "#000" stroke-width="0.5" />']
+    backward = list(SynBuild.HitRibbons([(cx * 100000, (10 - cx) * 100000) for cx in range(5)], 1, scaffold_x, '#000'))
+    assert backward == ['<path d= "M 10 600 L 10 500 L 0 400 L 0 300 L 4 300 L 4 400 L 6 500 L 6 600 Z" fill = "#000" fill-opacity = "0.9" stroke = "#000" stroke-width="0.5" />']
+    # a turn on the chromosome starts a new run, here a single bin
+    turn = list(SynBuild.HitRibbons([(0, 1000000), (100000, 1100000), (200000, 1000000)], -1, scaffold_x, '#000'))
+    assert len(turn) == 2 and turn[0].startswith('<path d= "M 10 100 L 10 200 L 0 300 L 0 400 L 1 400 L 1 300 L 11 200 L 11 100 Z"')
+    assert turn[1] == '<path d= "M 10 100 L 10 200 L 2 300 L 2 400" fill = "none" stroke = "#000" stroke-width="1" />'
+
+def test_hit_ribbons_single_bin_and_join():
+    scaffold_x = lambda que: que / 1e5
+    single = list(SynBuild.HitRibbons([(500000, 1000000), (520000, 1050000)], -1, scaffold_x, '#000')) # two hits in one bin
+    assert single == ['<path d= "M 10 100 L 10 200 L 5 300 L 5 400" fill = "none" stroke = "#000" stroke-width="1" />']
+    # bins up to join units apart on the scaffold and on the chromosome are merged, farther ones are not
+    assert len(list(SynBuild.HitRibbons([(0, 1000000), (200000, 1200000)], -1, scaffold_x, '#000'))) == 1
+    assert len(list(SynBuild.HitRibbons([(0, 1000000), (300000, 1100000)], -1, scaffold_x, '#000'))) == 2
+    assert len(list(SynBuild.HitRibbons([(0, 1000000), (100000, 1300000)], -1, scaffold_x, '#000'))) == 2
+    assert len(list(SynBuild.HitRibbons([(0, 1000000), (300000, 1100000)], -1, scaffold_x, '#000', join = 3))) == 1
+
+def test_hit_table_cache_round_trip(synteny_input, tmp_path):
+    table = SynBuild.BlastParse(synteny_input[0], 200)
+    path = str(tmp_path / 'blast.tbl.hitcache')
+    table.Save(path, 'key')
+    assert os.listdir(str(tmp_path)) == ['blast.tbl.hitcache'] # no temporary file is left behind
+    loaded = SynBuild.HitTable.Load(path, 'key')
+    for name, typecode in SynBuild.HitTable.columns: assert getattr(loaded, name) == getattr(table, name), name
+    assert loaded.scaffolds == table.scaffolds and loaded.chrs == table.chrs and loaded.summary == table.summary
+    assert loaded.HitList() == table.HitList()
+    assert SynBuild.HitTable.Load(path, 'other key') is None
+    empty = str(tmp_path / 'empty.hitcache')
+    SynBuild.HitTable().Save(empty, 'key')
+    assert len(SynBuild.HitTable.Load(empty, 'key')) == 0
+
+def test_hit_table_cache_corrupt(synteny_input, tmp_path):
+    # a truncated or damaged cache is not used, the BLAST file is parsed again
+    path = str(tmp_path / 'blast.tbl.hitcache')
+    SynBuild.BlastParse(synteny_input[0], 200).Save(path, 'key')
+    with open(path,'rb') as CACHE: data = CACHE.read()
+    header_end = len(SynBuild.HitTable.magic) + 8 + int.from_bytes(data[8:16],'little')
+    for broken in [data[:-8], data[:header_end + 8], data[:header_end], data[:40], b'', b'SYNHIT1\n' + data[8:], data[:20] + b'#' + data[21:]]:
+        with open(path,'wb') as CACHE: CACHE.write(broken)
+        assert SynBuild.HitTable.Load(path, 'key') is None
+    with open(path,'wb') as CACHE: CACHE.write(data.replace(b'"count": ', b'"count": 1', 1)) # more rows than the columns hold
+    assert SynBuild.HitTable.Load(path, 'key') is None
+
+def test_group_cache_round_trip(synteny_input, tmp_path):
+    hit_list, path = SynBuild.BlastParse(synteny_input[0], 200).HitList(), str(tmp_path / 'blast.tbl.groupcache')
+    cache = SynBuild.GroupCache(hit_list, path, 'key')
+    groups = {(dx, ex):cache.Get(dx, ex) for dx in hit_list for ex in hit_list[dx]}
+    cache.Save()
+    assert os.listdir(str(tmp_path)) == ['blast.tbl.groupcache']
+    loaded = SynBuild.GroupCache(hit_list, path, 'key')
+    assert {dx[:2]:ex for dx, ex in loaded.groups.items()} == groups and not loaded.added
+    assert SynBuild.GroupCache(hit_list, path, 'other key').groups == {}
+
+def test_jobs_equal_serial(synteny_input, tmp_path, monkeypatch):
+    # -j only spreads the work: sharded BLAST parsing, repeat filtering and -c rendering give the single process result
+    serial = SynBuild.BlastParse(synteny_input[0], 200)
+    sharded = SynBuild.BlastParse(synteny_input[0], 200, chunk_size = 4096, jobs = 2)
+    assert len(SynBuild.BlastShards(synteny_input[0], 8)) == 8
+    for name, typecode in SynBuild.HitTable.columns: assert getattr(sharded, name) == getattr(serial, name), name
+    assert sharded.scaffolds == serial.scaffolds and sharded.chrs == serial.chrs
+    assert list(sharded.summary) == list(serial.summary)
+    for dx, ex in serial.summary.items(): assert sharded.summary[dx] == [ex[0], pytest.approx(ex[1]), ex[2], ex[3]] # a pair cut by a range border adds its identities in another order
+    sensitivity = SynBuild.FilterSensitivity()
+    assert len(SynBuild.RepeatFilterShards(serial, 2)) == 2
+    filtered = SynBuild.RepeatFilterBatch(serial, sensitivity, jobs = 2)
+    assert list(filtered.items()) == list(SynBuild.RepeatFilterBatch(serial, sensitivity).items())
+    monkeypatch.chdir(tmp_path)
+    for jobs in ['1', '2']: assert SynBuild.main(synteny_input + ['-c', '-j', jobs, '--nocache', '-o', 'j' + jobs]) == 0
+    figures = sorted(dx[3:] for dx in os.listdir(str(tmp_path)) if dx.startswith('j1_'))
+    assert len(figures) == 5 and figures == sorted(dx[3:] for dx in os.listdir(str(tmp_path)) if dx.startswith('j2_'))
+    for dx in figures:
+        with open('j1_' + dx,'r') as ONE, open('j2_' + dx,'r') as TWO: assert ONE.read() == TWO.read(), dx
+
+def test_repeat_filter():
+    # expected hits are the result of the list based RepeatFilter before 2026-10
+    hits = {'chr1':[(500, 1200), (700, 1500), (1500, 5100), (2600, 7200), (3100, 8800), (3900, 9100)] + [(10000 + cx * 700, 1300 + cx) for cx in range(20)],
+            'chr2':[(600, 20100), (800, 30200), (4100, 12400)], 'chr3':[(900, 40500), (2200, 1100)], 'chrx':[(6100, 60700)]}
+    # scaffold window 0 has 5 hits on 3 chromosomes, chromosome window 1 has 23 hits: both are repeats, chr3 is left empty and dropped
+    assert SynBuild.RepeatFilter(hits, SynBuild.FilterSensitivity('order')) == {'chr1':[(1500, 5100), (2600, 7200), (3100, 8800), (3900, 9100)], 'chr2':[(4100, 12400)], 'chrx':[(6100, 60700)]}
+    hits = {'chr1':[(cx * 1000, cx * 1000) for cx in range(40)], 'chr2':[(500, 90000)]} # 1 of 41 hits (< 3 %) is an off-target hit
+    assert SynBuild.RepeatFilter(hits, SynBuild.FilterSensitivity('order')) == {'chr1':[(cx * 1000, cx * 1000) for cx in range(40)]}
+
+def test_scaffold_alignment():
+    # expected groupings are the result of the linear search ScaffoldAlignment before 2026-10.
+    # Scaffolds share ref positions, ties go to the scaffold earlier in groups and to a start before an end, so the order of groups matters.
+    groups = {'S0':[[39000000, 22000000, 0, 1, 'count=3']], 'S1':[[39000000, 47000000, 0, 1, 'count=3']], 'S2':[[16000000, 39000000, 0, 1, 'count=3']],
+              'S3':[[39000000, 16000000, 0, 1, 'count=3']], 'S4':[[16000000, 16000000, 0, 1, 'count=3']], 'S5':[[16000000, 16000000, 0, 1, 'count=3']]}
+    inp = {'S0':{'chr1':[[39000000, 22000000, 4000, 10000, 'count=3']]},
+           'S1':{'chr1':[[39000000, 47000000, 8000, 13000, 'count=3']], 'chr2':[[0, 1, 4000, 24000, 'count=3']]},
+           'S2':{'chr1':[[16000000, 39000000, 4000, 16000, 'count=3']], 'chr2':[[0, 1, 13000, 11000, 'count=3']]},
+           'S3':{'chr1':[[39000000, 16000000, 8000, 12000, 'count=3']], 'chr2':[[0, 1, 1000, 12000, 'count=3']]},
+           'S4':{'chr1':[[16000000, 16000000, 3000, 14000, 'count=3']], 'chr2':[[0, 1, 7000, 23000, 'count=3']]},
+           'S5':{'chr1':[[16000000, 16000000, 4000, 16000, 'count=3']], 'chr2':[[0, 1, 12000, 19000, 'count=3']]}}
+    assert SynBuild.ScaffoldAlignment(groups, inp, 'chr1') == [['S2', 'S0'], ['S3'], ['S1'], ['S4'], ['S5']]
+    reverse = {dx:groups[dx] for dx in reversed(list(groups))}
+    assert SynBuild.ScaffoldAlignment(reverse, inp, 'chr1') == [['S5'], ['S4', 'S3'], ['S2', 'S0'], ['S1']]
+    assert SynBuild.ScaffoldAlignment({'S4':groups['S4'], 'S2':groups['S2']}, inp, 'chr1') == [['S4'], ['S2']]
+
+def test_gband_all_skips_filtered_scaffolds(synteny_input, tmp_path, monkeypatch):
+    # -g without a name draws every scaffold that keeps hits after the repeat filter, a scaffold of repeats only gets no figure
+    monkeypatch.chdir(tmp_path)
+    with open(synteny_input[0],'r') as BLAST: rows = BLAST.read()
+    rows += ''.join('Scaf_R\t{}\t90.00\t100\t0\t0\t{}\t{}\t{}\t{}\t0.0\t500\n'.format(chr_name, 5000 + cx * 100, 5099 + cx * 100, 1000000 * (cx + 1), 1000000 * (cx + 1) + 99) for cx, chr_name in enumerate(['chr1', 'chr2', 'chr3'] * 2))
+    with open('blast.tbl','w') as BLAST: BLAST.write(rows)
+    with open(synteny_input[1],'r') as FAI, open('scaffolds.fa.fai','w') as OUT: OUT.write(FAI.read() + 'Scaf_R\t100000\t0\t60\t61\n')
+    assert SynBuild.main(['blast.tbl', 'scaffolds.fa.fai', '-g', '--nocache', '-o', 'g']) == 0
+    figures = sorted(dx for dx in os.listdir(str(tmp_path)) if dx.startswith('g_'))
+    assert len(figures) == 30 and 'g_Scaf_R.svg' not in figures
+
+def test_multipage_needs_pdf(synteny_input, capsys):
+    for argv in [['-c', '--multipage'], ['-s', 'Scaf_0', '-pdf', '--multipage']]:
+        with pytest.raises(SystemExit) as error: SynBuild.main(synteny_input + argv + ['--nocache'])
+        assert error.value.code == 2 and '--multipage requires -c and -pdf' in capsys.readouterr().err